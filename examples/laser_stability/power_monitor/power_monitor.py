@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+SiEPIClab laser stability example.
+
+Stream the power of a laser into a log file over a long acquisition, the
+latest samples are plotted live from the ring buffer of the stream.
+
+Mustafa Hammood, SiEPIC Kits, 2022
+"""
+import pyvisa as visa
+import matplotlib.pyplot as plt
+from datetime import datetime
+from siepiclab import instruments
+from siepiclab.drivers.PowerMonitor_keysight import PowerMonitor_keysight
+
+rm = visa.ResourceManager()
+# %% instruments definition
+pm = PowerMonitor_keysight(rm.open_resource('GPIB0::20::INSTR'), chan='1', slot='1')
+pm.SetPwrUnit('mW')
+pm.SetAutoRanging(1)
+pm.addr.write('TRIG'+str(pm.chan)+':INP IGN')
+
+# %% acquisition, logging blocks of 10000 samples of 10 ms each
+file_name = datetime.now().strftime('%Y%m%d%H%M%S')+'_stability.bin'
+acq = pm.StreamPwr(file=file_name, num_pts=10000, avg_time=10e-3, duration=12*3600)
+
+fig, ax = plt.subplots()
+while acq.running():
+    t, pwr = acq.latest().T
+    ax.clear()
+    ax.plot((t-t[0])/3600 if len(t) else t, 1e3*pwr)
+    ax.set_xlabel('Time [h]')
+    ax.set_ylabel('Optical Power [mW]')
+    plt.pause(10)
+acq.stop()
+
+# %% Example: read the whole acquisition from the log
+t, pwr = instruments.stream.read_log(file_name).T
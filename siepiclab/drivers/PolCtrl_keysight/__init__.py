@@ -7,6 +7,8 @@ Mustafa Hammood, SiEPIC Kits, 2022
 """
 
 from siepiclab import instruments
+import numpy as np
+import time
 
 
 class PolCtrl_keysight(instruments.instr_VISA):
@@ -17,6 +19,18 @@ class PolCtrl_keysight(instruments.instr_VISA):
         11896A
     """
 
+    shadow_params = [
+        instruments.shadowed('GetScanRate', 'SetScanRate', convert=int),
+        # paddles move during a scan, only record the positions we set
+        instruments.shadowed('GetPaddlePosition', 'SetPaddlePosition',
+                             values=('position',), convert=int, readthrough=False),
+    ]
+
+    state_params = [
+        ('ScanRate', 'SetScanRate'),
+        ('PaddlePositionAll', 'SetPaddlePositionAll'),
+    ]
+
     def GetState(self):
         """Return an instance of the instrument."""
         currState = instruments.state()
@@ -24,26 +38,10 @@ class PolCtrl_keysight(instruments.instr_VISA):
         currState.AddState('ScanRate', self.GetScanRate())
         return currState
 
-    def SetState(self, state):
-        """
-        Set the state of the instrument to a given state.
-
-        Parameters
-        ----------
-        state : SiEPIC Lab instruments type
-            State of the instrument.
-
-        Returns
-        -------
-        None.
-
-        """
-        self.SetPaddlePositionAll(state['PaddlePositionAll'], verbose=True)
-        self.SetScanRate(state['ScanRate'], verbose=True)
-
     def StartScan(self):
         """Start a random polarization scan."""
         self.addr.write('INIT:IMM')
+        self.invalidate_shadow('GetPaddlePosition')
 
     def StopScan(self, wait=False):
         """Stop a random polarization scan."""
@@ -176,3 +174,94 @@ class PolCtrl_keysight(instruments.instr_VISA):
             self.wait()
         if verbose:
             return(self.GetPaddlePositionAll())
+
+    def OptimizePaddles(self, measure, paddles=(1, 2, 3, 4), points=4, tol=1e-3, max_meas=60,
+                        period=999, span=999, settle=0.):
+        """
+        Maximize a measured power by model-based coordinate search of the paddles.
+
+        The power transmitted through a polarization dependent path varies
+        sinusoidally with the position of a paddle, the others being fixed.
+        Each paddle in turn is set to points positions evenly spread over a
+        period, the sinusoid is fitted to the readings and the paddle is set
+        to the fitted maximum (or the best reading, if higher). Rounds over
+        the paddles are repeated until a round improves the power by less
+        than tol (relative), or the measurement budget is spent.
+
+        Parameters
+        ----------
+        measure : function
+            Returns the power to maximize (linear units), e.g. pm.GetPwr.
+        paddles : tuple, optional
+            Paddles to optimize. The default is (1, 2, 3, 4).
+        points : int, optional
+            Positions sampled per paddle and round, at least 3. The default
+            is 4.
+        tol : float, optional
+            Relative improvement of a round to stop at. The default is 1e-3.
+        max_meas : int, optional
+            Maximum number of measurements. The default is 60.
+        period : float, optional
+            Period of the power in paddle positions. The default is 999.
+        span : int, optional
+            Largest position of the paddles, positions are set from 0 to span.
+            Positions out of range are moved by whole periods into it, or to
+            the nearest end of the range. The default is 999.
+        settle : float, optional
+            Time to settle after a paddle move (s). The default is 0.
+
+        Returns
+        -------
+        report : dict
+            Final 'positions' and 'pwr', 'converged' flag, number of
+            'measurements' and the 'trajectory' of the measurements: a list of
+            the paddle positions and measured power of each.
+
+        """
+        if points < 3:
+            raise ValueError('At least 3 points per paddle are needed to fit the model.')
+        positions = self.GetPaddlePositionAll(max(max(paddles), 4))
+        trajectory = []
+
+        def reachable(x):
+            x = x % period
+            if x > span:
+                x = span if x-span < period-x else 0
+            return min(int(round(x)), span)
+
+        def evaluate(paddle, position):
+            if paddle is not None:
+                positions[paddle-1] = int(position)
+                self.SetPaddlePosition(paddle, int(position), wait=True)
+                if settle:
+                    time.sleep(settle)
+            pwr = measure()
+            trajectory.append((list(positions), pwr))
+            return pwr
+
+        best = evaluate(None, None)
+        converged = False
+        complete = True
+        while complete and not converged:
+            start = best
+            for paddle in paddles:
+                # points-1 samples, the fitted maximum and possibly the best sample
+                if len(trajectory)+points+1 > max_meas:
+                    complete = False
+                    break
+                x0 = positions[paddle-1]
+                xs = [x0]+[reachable(x0+period*k/points) for k in range(1, points)]
+                ys = [best]+[evaluate(paddle, x) for x in xs[1:]]
+                phase = 2*np.pi*np.array(xs)/period
+                model = np.column_stack([np.ones(points), np.cos(phase), np.sin(phase)])
+                a, b, c = np.linalg.lstsq(model, np.array(ys), rcond=None)[0]
+                x_fit = reachable(period*np.arctan2(c, b)/(2*np.pi))
+                best = evaluate(paddle, x_fit)
+                # keep the fitted maximum unless a sample was better
+                k = int(np.argmax(ys))
+                if ys[k] > best:
+                    best = evaluate(paddle, xs[k])
+            converged = complete and best-start <= tol*abs(start)
+
+        return {'positions': positions, 'pwr': best, 'converged': converged,
+                'measurements': len(trajectory), 'trajectory': trajectory}
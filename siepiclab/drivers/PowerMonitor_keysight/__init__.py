@@ -8,6 +8,7 @@ Mustafa Hammood, SiEPIC Kits, 2022
 
 from siepiclab import instruments
 import numpy as np
+import time
 
 
 class PowerMonitor_keysight(instruments.instr_VISA):
@@ -19,10 +20,66 @@ class PowerMonitor_keysight(instruments.instr_VISA):
         N77
     """
 
+    # parameters are restored in this order, the range is set after auto
+    # ranging is disabled
+    params = [
+        instruments.parameter('Wavl', '{sens}:POW:WAV?', '{sens}:POW:WAV {}NM',
+                              parse=lambda re: 1e9*float(re), format=lambda wavl: str(float(wavl)),
+                              values=('wavl',), state='wavl',
+                              doc='wavelength setting in the instrument (nm)'),
+        instruments.parameter('PwrUnit', '{sens}:POW:UNIT?', '{sens}:POW:UNIT {}',
+                              parse=lambda re: 'mW' if int(re) == 1 else 'dBm',
+                              format=instruments.unit_code, values=('unit',), state='pwr_unit',
+                              doc='unit setting in the instrument (mW or dBm)'),
+        instruments.parameter('AutoRanging', '{head}:POW:RANG:AUTO?', '{head}:POW:RANG:AUTO {}',
+                              parse=int, values=('auto_range',), state='auto_range',
+                              doc='auto ranging setting (0: disabled, 1: enabled)'),
+        instruments.parameter('PwrRange', '{head}:POW:RANG?', '{head}:POW:RANG {}',
+                              values=('power_range',), state='pwr_range',
+                              doc='power range upper limit (dBm)'),
+        instruments.parameter('PwrLoggingPar', '{module}:FUNC:PAR:LOGG?', '{module}:FUNC:PAR:LOGG {},{}',
+                              parse=lambda re: (int(re.split(',')[0]), float(re.split(',')[1])),
+                              format=lambda num_pts, avg_time: (str(int(num_pts)), str(avg_time)),
+                              values=('num_pts', 'avg_time'), state=('num_pts', 'avg_time'),
+                              doc='power logging number of points and averaging time (s)'),
+        instruments.parameter('PwrLogging', '{head}:FUNC:STAT?', parse=str, state='pwr_logging',
+                              doc='power logging status'),
+    ]
+
+    shadow_params = [
+        instruments.shadowed('GetWavl', 'SetWavl', convert=float),
+        instruments.shadowed('GetAutoRanging', 'SetAutoRanging', convert=int),
+        instruments.shadowed('GetPwrRange', 'SetPwrRange', convert=float),
+        instruments.shadowed('GetPwrUnit', 'SetPwrUnit', convert=instruments.unit_name),
+        instruments.shadowed('GetPwrLoggingPar', 'SetPwrLoggingPar',
+                             values=('num_pts', 'avg_time'),
+                             convert=lambda num_pts, avg_time: (int(num_pts), float(avg_time))),
+    ]
+
     def __init__(self, addr, chan, slot=None):
         super(PowerMonitor_keysight, self).__init__(addr, chan)
         self.slot = slot
 
+    def fields(self):
+        """
+        Template fields of the declared parameters of the driver.
+
+        The fields reproduce the addressing of the instrument commands:
+        'module' is the module (SENS<chan>), 'sens' the detector head if a
+        slot is given and the module otherwise, 'head' the detector head
+        (CHAN<chan> without a slot), 'start' the target of the logging
+        start, 'res' the target of the logging results and 'fetc' the power
+        fetch.
+        """
+        chan = str(self.chan)
+        module = 'SENS'+chan
+        if self.slot is not None:
+            head = module+':CHAN'+str(self.slot)
+            return {'chan': chan, 'module': module, 'sens': head, 'head': head,
+                    'start': module, 'res': head, 'fetc': ':FETC'+chan+':CHAN'+str(self.slot)}
+        return {'chan': chan, 'module': module, 'sens': module, 'head': module+':CHAN'+chan,
+                'start': module+':CHAN'+chan, 'res': 'SENS:CHAN'+chan, 'fetc': ':FETC'+chan}
+
     def identify(self):
         """
         Identify the instrument.
@@ -33,43 +90,10 @@ class PowerMonitor_keysight(instruments.instr_VISA):
 
         """
         if self.slot:
-            return(self.query('SLOT', ':IDN?').strip())
+            return(self.addr.identify('SLOT'+str(self.chan)+':IDN?'))
         else:
             return(instruments.instr_VISA.identify(self))
 
-    def GetState(self):
-        """Return an instance of the instrument."""
-        currState = instruments.state()
-        currState.AddState('wavl', self.GetWavl())
-        currState.AddState('auto_range', self.GetAutoRanging())
-        currState.AddState('pwr_range', self.GetPwrRange())
-        currState.AddState('pwr_unit', self.GetPwrUnit())
-        currState.AddState('num_pts', self.GetPwrLoggingPar()[0])
-        currState.AddState('avg_time', self.GetPwrLoggingPar()[1])
-        currState.AddState('pwr_logging', self.GetPwrLogging())
-        return currState
-
-    def SetState(self, state):
-        """
-        Set the state of the instrument to a given state.
-
-        Parameters
-        ----------
-        state : SiEPIC Lab instruments type
-            State of the instrument.
-
-        Returns
-        -------
-        None.
-
-        """
-        self.SetWavl(state['wavl'], verbose=True)
-        self.SetAutoRanging(state['auto_range'], verbose=True)
-        self.SetPwrRange(state['pwr_range'], verbose=True)
-        self.SetPwrUnit(state['pwr_unit'], verbose=True)
-        self.SetPwrLoggingPar(state['num_pts'], state['avg_time'], verbose=True)
-        #self.SetPwrLogging(state['pwr_logging'], verbose=True)
-
     def GetPwr(self, log=False):
         """
         Get the measured power at the optical power meter.
@@ -85,10 +109,7 @@ class PowerMonitor_keysight(instruments.instr_VISA):
             Measured power at the detector (in selected unit).
 
         """
-        if self.slot is not None:
-            re = self.addr.query(':FETC'+str(self.chan)+':CHAN'+str(self.slot)+':POW?')
-        else:
-            re = self.query(':FETC', ':POW?')
+        re = self.addr.query(self.fields()['fetc']+':POW?')
         if log:
             pwr = 10*np.log10(1e3*float(str(re.strip())))
             return pwr
@@ -148,178 +169,6 @@ class PowerMonitor_keysight(instruments.instr_VISA):
             # return(self.GetZeroAll())
             return 0
 
-    def GetPwrUnit(self):
-        """
-        Get the unit setting in the instrument.
-
-        Returns
-        -------
-        unit : String
-            Unit setting of the instrument (mW or dBm).
-
-        """
-        if self.slot is not None:
-            re = self.addr.query('SENS'+str(self.chan)+':CHAN'+str(self.slot) + ':POW:UNIT?')
-        else:
-            re = self.query('SENS', ':POW:UNIT?')
-        unit = int(str(re.strip()))
-        if unit == 1:
-            unit = 'mW'
-        else:
-            unit = 'dBm'
-        return unit
-
-    def SetPwrUnit(self, unit='mW', verbose=False, wait=False):
-        """
-        Set the unit setting in the instrument.
-
-        Parameters
-        ----------
-        unit : String, optional
-            The power unit to set. 'dBm' or 'mW'. The defautlt is 'mW'.
-        verbose : Boolean, optional
-            Return the instrument reading after the operation.
-            The default is False.
-        wait : Boolean, optional
-            Block program until the query is done. The default is False.
-
-        Returns
-        -------
-        None.
-
-        """
-        valid_units = ['dbm', 'mw']
-        if unit.lower() not in valid_units:
-            print("ERR: Not a valid unit. Valid units are 'dBm' and 'mW', as str.")
-            return
-        if unit.lower() == 'dbm':
-            unit = 0
-        else:
-            unit = 1
-        if self.slot is not None:
-            self.addr.write('SENS'+str(self.chan)+':CHAN' +
-                            str(self.slot)+':POW:UNIT '+str(unit))
-        else:
-            self.write('SENS', ':POW:UNIT '+str(unit))
-
-        if wait or verbose:
-            self.wait()
-        if verbose:
-            return(self.GetPwrUnit())
-
-    def GetWavl(self):
-        """
-        Get the wavelength setting in the instrument.
-
-        Returns
-        -------
-        wavl : float
-            Wavelength setting in the instrument (in nm).
-
-        """
-        if self.slot is not None:
-            re = self.addr.query('SENS'+str(self.chan)+':CHAN'+str(self.slot) + ':POW:WAV?')
-        else:
-            re = self.query('SENS', ':POW:WAV?')
-        wavl = 1e9*float(str(re.strip()))
-        return wavl
-
-    def SetWavl(self, wavl, verbose=False, wait=False):
-        """
-        Set the wavelength setting in the instrument.
-
-        Parameters
-        ----------
-        wavl : float
-            Wavelength to set the instrument at (nm).
-        verbose : Boolean, optional
-            Return the instrument reading after the operation.
-            The default is False.
-        wait : Boolean, optional
-            Block program until the query is done. The default is False.
-
-        Returns
-        -------
-        None unless verbose is True.
-
-        """
-        if self.slot is not None:
-            self.addr.write('SENS'+str(self.chan)+':CHAN'+str(self.slot) +
-                            ':POW:WAV '+str(float(wavl))+'NM')
-        else:
-            self.write('SENS', ':POW:WAV '+str(float(wavl))+'NM')
-
-        if wait or verbose:
-            self.wait()
-        if verbose:
-            return self.GetWavl()
-
-    def GetAutoRanging(self):
-        """
-        Get the auto ranging setting for the power monitor.
-
-        Returns
-        -------
-        int
-            Auto ranging setting.
-            0: disabled
-            1: enabled
-
-        """
-        if self.slot is not None:
-            re = self.addr.query('SENS'+str(self.chan)+':CHAN' +
-                                 str(self.slot)+':POW:RANG:AUTO?')
-        else:
-            re = self.query('SENS', ':CHAN'+self.chan+':POW:RANG:AUTO?')
-        return int(str(re.strip()))
-
-    def SetAutoRanging(self, auto_range, verbose=False, wait=False):
-        """
-        Set the auto ranging setting for the power monitor.
-
-        Parameters
-        ----------
-        auto_range : int
-            Auto ranging setting.
-            0: disabled
-            1: enabled
-        verbose : Boolean, optional
-            Return the instrument reading after the operation.
-            The default is False.
-        wait : Boolean, optional
-            Block program until the query is done. The default is False.
-
-        Returns
-        -------
-        None unless verbose is True.
-
-        """
-        if self.slot is not None:
-            self.addr.write('SENS'+str(self.chan)+':CHAN'+str(self.slot) +
-                            ':POW:RANG:AUTO '+str(auto_range))
-        else:
-            self.write('SENS', ':CHAN'+self.chan+':POW:RANG:AUTO '+str(auto_range))
-        if wait or verbose:
-            self.wait()
-        if verbose:
-            return self.GetAutoRanging()
-
-    def GetPwrLogging(self):
-        """
-        Get power logging status.
-
-        Returns
-        -------
-        string
-            Power logging status.
-
-        """
-        if self.slot is not None:
-            re = self.addr.query('SENS'+str(self.chan)+':CHAN'+str(self.slot)+':FUNC:STAT?')
-        else:
-            re = self.query('SENS', ':CHAN'+self.chan+':FUNC:STAT?')
-        return str(re.strip())
-
     def SetPwrLogging(self, pwr_logging, verbose=False, wait=False):
         """
         Set power logging status.
@@ -340,134 +189,166 @@ class PowerMonitor_keysight(instruments.instr_VISA):
 
         """
         if pwr_logging:
-            if self.slot is not None:
-                self.addr.write('SENS'+str(self.chan)+':FUNC:STAT LOGG,STAR')
-            else:
-                self.write('SENS', ':CHAN'+self.chan+':FUNC:STAT LOGG,STAR')
+            self.addr.write(self.fields()['start']+':FUNC:STAT LOGG,STAR')
         else:
-            if self.slot is not None:
-                self.addr.write('SENS'+str(self.chan)+':CHAN' +
-                                str(self.slot)+':FUNC:STAT LOGG,STOP')
-            else:
-                self.write('SENS', ':CHAN'+self.chan+':FUNC:STAT LOGG,STOP')
+            self.addr.write(self.fields()['head']+':FUNC:STAT LOGG,STOP')
         if pwr_logging and wait:
-            while self.GetPwrLogging() != 'LOGGING_STABILITY,COMPLETE':
-                pass
+            # sleep through the predicted logging time, then poll its status
+            num_pts, avg_time = self.GetPwrLoggingPar()
+            instruments.wait_predicted(lambda: self.GetPwrLogging().strip() == 'LOGGING_STABILITY,COMPLETE',
+                                       num_pts*avg_time)
         if verbose:
             return self.GetPwrLogging()
 
-    def GetPwrRange(self):
-        """
-        Get the power range upper limit setting for the power monitor.
-
-        Returns
-        -------
-        float
-            Power range upper limit (in dBm).
-
+    def GetPwrLoggingData(self, out=None, file=None):
         """
-        if self.slot is not None:
-            re = self.addr.query('SENS'+str(self.chan)+':CHAN'+str(self.slot)+':POW:RANG?')
-        else:
-            re = self.query('SENS', ':CHAN'+self.chan+':POW:RANG?')
-        return float(str(re.strip()))
+        Fetch the stored power logging data in the buffer.
 
-    def SetPwrRange(self, power_range, verbose=False, wait=False):
-        """
-        Set the auto ranging setting for the power monitor.
+        The data block is read in chunks straight into a numpy array.
 
         Parameters
         ----------
-        power_range : float
-            Power range upper limit (in dBm).
-        verbose : Boolean, optional
-            Return the instrument reading after the operation.
-            The default is False.
-        wait : Boolean, optional
-            Block program until the query is done. The default is False.
+        out : np.array, optional
+            Float32 buffer to read into, e.g. reused between sweeps.
+            The default is None.
+        file : string, optional
+            File to stream the data to, the data is returned as a np.memmap
+            of the file. The default is None.
 
         Returns
         -------
-        None unless verbose is True.
+        np.array
+            Power logging data (W).
 
         """
-        if self.slot is not None:
-            self.addr.write('SENS'+str(self.chan)+':CHAN' +
-                            str(self.slot)+':POW:RANG '+str(power_range))
-        else:
-            self.write('SENS', ':CHAN'+self.chan+':POW:RANG '+str(power_range))
-        if wait or verbose:
-            self.wait()
-        if verbose:
-            return self.GetPwrRange()
+        cmd = self.fields()['res']+':FUNC:RES?'
+        return self.addr.read_block(cmd, '<f4', out=out, file=file)
 
-    def GetPwrLoggingPar(self):
+    def StreamPwr(self, size=100000, file=None, mode='logging', num_pts=1000, avg_time=1e-3,
+                  interval=0.1, duration=None):
         """
-        Get Power Logging Paramater (number of points and average time in s).
+        Stream the measured power into a ring buffer and an on-disk log.
 
-        Returns
-        -------
-        tuple (of ints)
-            Power logging parr setting.
-            (number of points, averaging time in seconds)
-
-        """
-        if self.slot is not None:
-            re = self.addr.query('SENS'+str(self.chan)+':FUNC:PAR:LOGG?')
-        else:
-            re = self.query('SENS', ':FUNC:PAR:LOGG?')
-        pwr_logging_par = str(re.strip()).split(',')
-        return (int(pwr_logging_par[0]), float(pwr_logging_par[1]))
+        In 'logging' mode the logging function is armed and drained
+        repeatedly, with a dead time between the blocks of num_pts samples.
+        The trigger input must ignore triggers (TRIG:INP IGN). In 'fetch'
+        mode the power is read at a fixed cadence.
 
-    def SetPwrLoggingPar(self, num_pts, avg_time, verbose=False, wait=False):
-        """
-        Set Power Logging Paramater (number of points and average time in s).
+        Example
+        ----------
+            acq = pm.StreamPwr(file='stability.bin')
+            ...
+            t, pwr = acq.latest(1000).T  # live data
+            ...
+            acq.stop()
+            t, pwr = instruments.stream.read_log('stability.bin').T
 
         Parameters
         ----------
-        num_pts : int
-            Number of points.
-        avg_time : float
-            Averaging time (in seconds).
-        verbose : Boolean, optional
-            Return the instrument reading after the operation.
-            The default is False.
-        wait : Boolean, optional
-            Block program until the query is done. The default is False.
+        size : int, optional
+            Number of samples in the ring buffer. The default is 100000.
+        file : string, optional
+            File to append the samples to. The default is None (no log).
+        mode : string, optional
+            Acquisition mode, 'logging' or 'fetch'. The default is 'logging'.
+        num_pts : int, optional
+            Number of samples of a logging block. The default is 1000.
+        avg_time : float, optional
+            Averaging time of a logged sample (s). The default is 1e-3.
+        interval : float, optional
+            Interval between fetched samples (s). The default is 0.1.
+        duration : float, optional
+            Duration of the acquisition (s). The default is None (until
+            stopped).
 
         Returns
         -------
-        None unless verbose is True.
-
-        """
-        if self.slot is not None:
-            self.addr.write('SENS'+str(self.chan)+':FUNC:PAR:LOGG ' +
-                            str(int(num_pts))+','+str(avg_time))
+        instruments.stream
+            Running acquisition, of samples of epoch time (s) and power (W).
+
+        """
+        if mode not in ('logging', 'fetch'):
+            raise ValueError("Not a valid mode. Valid modes are 'logging' and 'fetch'.")
+        t_end = None if duration is None else time.time()+duration
+        acq = instruments.stream(size, 2, file)
+
+        if mode == 'logging':
+            self.SetPwrLoggingPar(num_pts, avg_time)
+            buf = np.empty(num_pts, dtype='<f4')
+
+            def acquire():
+                if t_end is not None and time.time() >= t_end:
+                    return None
+                t0 = time.time()
+                self.SetPwrLogging(True, wait=True)
+                pwr = self.GetPwrLoggingData(out=buf)
+                return np.column_stack([t0+avg_time*np.arange(pwr.size), pwr])
         else:
-            self.write('SENS', ':FUNC:PAR:LOGG ' +
-                       str(int(num_pts))+','+str(avg_time))
-        if wait or verbose:
-            self.wait()
-        if verbose:
-            return self.GetPwrLoggingPar()
+            t_next = [time.time()]
+
+            def acquire():
+                time.sleep(max(t_next[0]-time.time(), 0))
+                t = time.time()
+                if t_end is not None and t >= t_end:
+                    return None
+                t_next[0] = max(t_next[0]+interval, t)
+                return [[t, 1e-3*self.GetPwr()]]
+        return acq.start(acquire)
+
+
+class PowerMonitor_group:
+    """
+    Group of HP-Agilent-Keysight power monitors read together.
+
+    The power of the monitors sharing a mainframe (VISA session) is fetched
+    in one compound query (e.g. 'FETC1:CHAN1:POW?;:FETC1:CHAN2:POW?'),
+    rather than a round-trip per monitor.
+
+    pm : list of PowerMonitor_keysight
+        Power monitors of the group, in the order of the readings.
+    """
 
-    def GetPwrLoggingData(self):
+    def __init__(self, pm):
+        if type(pm) != list:
+            pm = [pm]
+        self.pm = pm
+        # indices of the monitors, per session
+        self.sessions = {}
+        for idx, p in enumerate(pm):
+            self.sessions.setdefault(id(p.addr.session), []).append(idx)
+
+    def GetPwr(self, log=False, out=None):
         """
-        Fetch the stored power logging data in the buffer.
+        Get the measured power at all the power monitors of the group.
 
         Parameters
         ----------
-        slot : int
-            Power meter slot to fetch the data buffer from.
+        log : Boolean, optional
+            Flag to get in log (dBm) or linear (mW). The default is mW.
+        out : np.array, optional
+            Array to write the readings into, e.g. a row of a results
+            array. The default is None.
 
         Returns
         -------
-        np.array
-            Power logging data.
-
-        """
-        if self.slot is not None:
-            cmd = 'SENS'+str(self.chan)+':CHAN'+str(self.slot)+':FUNC:RES?'
-        else:
-            cmd = 'SENS:CHAN'+self.chan+':FUNC:RES?'
-        return np.array(self.addr.query_binary_values(cmd))
+        pwr : np.array
+            Measured power at the detectors (in selected unit), one value per
+            power monitor.
+
+        """
+        pwr = np.zeros(len(self.pm)) if out is None else out
+        for idxs in self.sessions.values():
+            addr = self.pm[idxs[0]].addr
+            size = addr.batch_max
+            for start in range(0, len(idxs), size):
+                group = idxs[start:start+size]
+                cmds = [self.pm[idx].fields()['fetc']+':POW?' for idx in group]
+                replies = addr.query(addr.join(cmds)).strip().split(';')
+                if len(replies) != len(group):
+                    raise ValueError('Compound query returned '+str(len(replies)) +
+                                     ' values for '+str(len(group))+' power monitors.')
+                for idx, reply in zip(group, replies):
+                    pwr[idx] = 1e3*float(reply.strip())
+        if log:
+            pwr[:] = 10*np.log10(pwr)
+        return pwr
@@ -6,5 +6,5 @@ Import available instrument drivers in the module.
 Mustafa Hammood, SiEPIC Kits, 2022
 """
 
-from . import PowerMonitor_keysight, PolCtrl_keysight, smu_keithley, smu_keithley2400
+from . import PowerMonitor_keysight, PolCtrl_keysight, smu_keithley, smu_keithley2400, smu_keithley2402
 from . import lwmm_keysight, fls_keysight, tls_keysight
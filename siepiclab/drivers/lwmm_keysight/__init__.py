@@ -7,6 +7,7 @@ Mustafa Hammood, SiEPIC Kits, 2022
 """
 
 from siepiclab import instruments
+from siepiclab.drivers.PowerMonitor_keysight import PowerMonitor_group
 
 
 class lwmm_keysight(instruments.instr_VISA):
@@ -37,3 +38,24 @@ class lwmm_keysight(instruments.instr_VISA):
 
         """
         return 0
+
+    def GetPwrAll(self, pm, log=False):
+        """
+        Get the measured power at several power monitors in one transaction.
+
+        Parameters
+        ----------
+        pm : list of PowerMonitor_keysight
+            Power monitors to read, e.g. all the configured slots and
+            channels of the mainframe.
+        log : Boolean, optional
+            Flag to get in log (dBm) or linear (mW). The default is mW.
+
+        Returns
+        -------
+        pwr : np.array
+            Measured power at the detectors (in selected unit), one value per
+            power monitor.
+
+        """
+        return PowerMonitor_group(pm).GetPwr(log)
@@ -17,6 +17,61 @@ class smu_keithley(instruments.instr_VISA):
         Keithley 2602
     """
 
+    scpi = False  # TSP instrument
+
+    # functions run on the instrument, loaded once per session
+    library = instruments.tsp_script('siepiclab', """
+        function siepiclab_sweep_dual(s1, f1, levels, s2, f2, bias)
+            s1.nvbuffer1.clear()
+            s1.nvbuffer2.clear()
+            s2.nvbuffer1.clear()
+            s2.nvbuffer2.clear()
+            if f2 == "v" then
+                s2.source.func = s2.OUTPUT_DCVOLTS
+                s2.source.levelv = bias
+            else
+                s2.source.func = s2.OUTPUT_DCAMPS
+                s2.source.leveli = bias
+            end
+            if f1 == "v" then
+                s1.source.func = s1.OUTPUT_DCVOLTS
+            else
+                s1.source.func = s1.OUTPUT_DCAMPS
+            end
+            s1.source.output = s1.OUTPUT_ON
+            s2.source.output = s2.OUTPUT_ON
+            for k = 1, table.getn(levels) do
+                if f1 == "v" then
+                    s1.source.levelv = levels[k]
+                else
+                    s1.source.leveli = levels[k]
+                end
+                s1.measure.iv(s1.nvbuffer1, s1.nvbuffer2)
+                s2.measure.iv(s2.nvbuffer1, s2.nvbuffer2)
+            end
+        end
+        """)
+
+    shadow_params = [
+        instruments.shadowed('GetOutput', 'SetOutput', convert=int, skip=('AB',)),
+        instruments.shadowed('GetCurrentLimit', 'SetCurrentLimit', convert=float, skip=('AB',)),
+        instruments.shadowed('GetVoltageLimit', 'SetVoltageLimit', convert=float, skip=('AB',)),
+    ]
+
+    # limits are set before the levels, outputs are switched last
+    state_params = [
+        ('curr_lim_a', 'SetCurrentLimit', 'A'),
+        ('curr_lim_b', 'SetCurrentLimit', 'B'),
+        ('volt_lim_a', 'SetVoltageLimit', 'A'),
+        ('volt_lim_b', 'SetVoltageLimit', 'B'),
+        ('volt_a', 'SetVoltage', 'A'),
+        ('volt_b', 'SetVoltage', 'B'),
+        ('curr_a', 'SetCurrent', 'A'),
+        ('curr_b', 'SetCurrent', 'B'),
+        ('output_a', 'SetOutput', 'A'),
+        ('output_b', 'SetOutput', 'B'),
+    ]
+
     def GetState(self):
         """Return an instance of the instrument."""
         currState = instruments.state()
@@ -34,31 +89,6 @@ class smu_keithley(instruments.instr_VISA):
         currState.AddState('res_b', self.GetResistance('B'))
         return currState
 
-    def SetState(self, state):
-        """
-        Set the state of the instrument to a given state.
-
-        Parameters
-        ----------
-        state : SiEPIC Lab instruments type
-            State of the instrument.
-
-        Returns
-        -------
-        None.
-
-        """
-        self.SetOutput(state['output_a'], 'A', verbose=True)
-        self.SetOutput(state['output_b'], 'B', verbose=True)
-        self.SetVoltage(state['volt_a'], 'A', verbose=True)
-        self.SetVoltage(state['volt_b'], 'B', verbose=True)
-        self.SetCurrent(state['curr_a'], 'A', verbose=True)
-        self.SetCurrent(state['curr_b'], 'B', verbose=True)
-        self.SetCurrentLimit(state['curr_lim_a'], 'A', verbose=True)
-        self.SetCurrentLimit(state['curr_lim_b'], 'B', verbose=True)
-        self.SetVoltageLimit(state['volt_lim_a'], 'A', verbose=True)
-        self.SetVoltageLimit(state['volt_lim_b'], 'B', verbose=True)
-
     def reset(self):
         """
         Reset the instrument.
@@ -353,41 +383,265 @@ class smu_keithley(instruments.instr_VISA):
             res_b = float(self.addr.query("print(smub.measure.r())"))
             return res_a, res_b
 
+    def Measure(self, chan, quantities=('v', 'i', 'r')):
+        """
+        Measure several quantities of a channel in one reading.
+
+        The current and voltage are measured together with measure.iv(), the
+        resistance is computed from them.
+
+        Parameters
+        ----------
+        chan : String
+            Source measure unit channel. "A", "B" or "AB".
+        quantities : tuple of strings, optional
+            Quantities to return, 'v' (V), 'i' (A) or 'r' (Ohms). The default
+            is ('v', 'i', 'r').
+
+        Returns
+        -------
+        values : tuple
+            Measured values in the order of quantities, a tuple per channel
+            for "AB".
+
+        """
+        if chan not in ('A', 'B', 'AB'):
+            print("ERR: Not a valid channel. Valid channels are 'A', 'B' and 'AB'.")
+            return
+        if chan == 'AB':
+            return self.Measure('A', quantities), self.Measure('B', quantities)
+        if not set(quantities) <= {'v', 'i', 'r'}:
+            print("ERR: Not a valid quantity. Valid quantities are 'v', 'i' and 'r'.")
+            return
+        curr, volt = [float(x) for x in
+                      self.addr.query(f"print(smu{chan.lower()}.measure.iv())").split()]
+        values = {'v': volt, 'i': curr, 'r': volt/curr if curr else 9.91e37}
+        return tuple(values[q] for q in quantities)
+
+    def SweepDualBuffered(self, levels, ch1='A', ch2='B', mode1='volt', mode2='curr', bias=0.):
+        """
+        Sweep a channel while biasing the other, on the instrument.
+
+        The sweep runs as a function of the driver script library on the
+        instrument, the current and voltage of both channels are stored in
+        their buffers at every point and read back in one binary transfer.
+        The outputs are turned on and held at the last point of the sweep.
+
+        Parameters
+        ----------
+        levels : list or np.array
+            Source levels of the swept channel (V or A).
+        ch1 : String, optional
+            Swept channel. The default is 'A'.
+        ch2 : String, optional
+            Biased channel. The default is 'B'.
+        mode1 : String, optional
+            Source of the swept channel, 'volt' or 'curr'. The default is 'volt'.
+        mode2 : String, optional
+            Source of the biased channel, 'volt' or 'curr'. The default is 'curr'.
+        bias : float, optional
+            Source level of the biased channel (V or A). The default is 0.
+
+        Returns
+        -------
+        v1, i1, v2, i2 : np.array
+            Measured voltage (V) and current (A) of the swept and biased channel.
+
+        """
+        import numpy as np
+        if mode1 not in ('volt', 'curr') or mode2 not in ('volt', 'curr'):
+            print("ERR: Invalid mode selection. Possible inputs = ['volt', 'curr']")
+            return
+        levels = np.asarray(levels, dtype=float).ravel()
+        points = len(levels)
+        s1 = 'smu'+ch1.lower()
+        s2 = 'smu'+ch2.lower()
+        self.addr.load_script(self.library)
+        func = {'volt': 'v', 'curr': 'i'}
+        self.addr.write(f'siepiclab_sweep_dual({s1}, "{func[mode1]}", '
+                        f"{{{', '.join(repr(float(x)) for x in levels)}}}, "
+                        f'{s2}, "{func[mode2]}", {float(bias)!r})')
+        self.invalidate_shadow('GetOutput')
+        self.wait()
+        # readings are interleaved per point: i1, v1, i2, v2
+        data = self.addr.read_block(self.addr.join(
+            ["format.data = format.REAL32",
+             "format.byteorder = format.LITTLEENDIAN",
+             f"printbuffer(1, {points}, {s1}.nvbuffer1.readings, {s1}.nvbuffer2.readings, "
+             f"{s2}.nvbuffer1.readings, {s2}.nvbuffer2.readings)",
+             "format.data = format.ASCII"]), '<f4', count=4*points)
+        data = data.astype(float).reshape(points, 4)
+        return data[:, 1], data[:, 0], data[:, 3], data[:, 2]
+
+    def SweepIVBuffered(self, v_pts, chan, stime=0., nplc=None):
+        """
+        Voltage sweep measured into the instrument buffers.
+
+        The sweep runs on the instrument trigger model, the current and
+        voltage readings are stored in nvbuffer1 and nvbuffer2 of the channel
+        and read back in one binary transfer once the sweep is done. The
+        output is turned on and held at the last point of the sweep.
+
+        Parameters
+        ----------
+        v_pts : list or np.array
+            Voltage points of the sweep (V).
+        chan : string
+            Channel of the sweep ('A' or 'B').
+        stime : float, optional
+            Settling time before each measurement (s). The default is 0.
+        nplc : float, optional
+            Integration time in number of power line cycles. The default is
+            None, which keeps the instrument setting.
+
+        Returns
+        -------
+        volt : np.array
+            Measured voltage (V).
+        curr : np.array
+            Measured current (A).
+        res : np.array
+            Resistance (Ohms), 9.91e37 where no current is measured.
+
+        """
+        import numpy as np
+        v_pts = np.asarray(v_pts, dtype=float).ravel()
+        smu = 'smu'+chan.lower()
+        points = len(v_pts)
+        steps = np.diff(v_pts)
+        if points > 1 and np.allclose(steps, steps[0]):
+            source = f"{smu}.trigger.source.linearv({float(v_pts[0])!r}, {float(v_pts[-1])!r}, {points})"
+        else:
+            source = f"{smu}.trigger.source.listv({{{', '.join(repr(float(v)) for v in v_pts)}}})"
+        cmds = [f"{smu}.nvbuffer1.clear()",
+                f"{smu}.nvbuffer2.clear()",
+                f"{smu}.source.func = {smu}.OUTPUT_DCVOLTS",
+                f"{smu}.measure.delay = {stime}",
+                source,
+                f"{smu}.trigger.source.limiti = {smu}.source.limiti",
+                f"{smu}.trigger.source.action = {smu}.ENABLE",
+                f"{smu}.trigger.measure.action = {smu}.ENABLE",
+                f"{smu}.trigger.measure.iv({smu}.nvbuffer1, {smu}.nvbuffer2)",
+                f"{smu}.trigger.endpulse.action = {smu}.SOURCE_HOLD",
+                f"{smu}.trigger.count = {points}",
+                f"{smu}.source.output = {smu}.OUTPUT_ON",
+                f"{smu}.trigger.initiate()"]
+        if nplc is not None:
+            cmds.insert(3, f"{smu}.measure.nplc = {nplc}")
+        self.addr.write(self.addr.join(cmds))
+        self.invalidate_shadow('GetOutput')
+        self.wait()
+        # readings are interleaved per point: current, voltage
+        data = self.addr.read_block(self.addr.join(
+            ["format.data = format.REAL32",
+             "format.byteorder = format.LITTLEENDIAN",
+             f"printbuffer(1, {points}, {smu}.nvbuffer1.readings, {smu}.nvbuffer2.readings)",
+             "format.data = format.ASCII"]), '<f4', count=2*points)
+        curr = data[0::2].astype(float)
+        volt = data[1::2].astype(float)
+        res = np.divide(volt, curr, out=np.full(points, 9.91e37), where=curr != 0)
+        return volt, curr, res
+
+    def ArmTriggeredMeasure(self, chan, points, line=1, nplc=None):
+        """
+        Arm buffered measurements taken on external triggers.
+
+        The trigger model of the channel takes one current and voltage
+        reading per trigger received on a digital I/O line, e.g. from the
+        output trigger of a laser sweep, into nvbuffer1 and nvbuffer2. The
+        source level is held, the source action of the trigger model is
+        saved on the instrument and restored by GetTriggeredMeasure. Read
+        the measurements with GetTriggeredMeasure once all the triggers are
+        sent.
+
+        Parameters
+        ----------
+        chan : string
+            Channel of the measurements ('A' or 'B').
+        points : int
+            Number of triggers (measurements).
+        line : int, optional
+            Digital I/O line of the triggers. The default is 1.
+        nplc : float, optional
+            Integration time in number of power line cycles. The default is
+            None, which keeps the instrument setting.
+
+        Returns
+        -------
+        None.
+
+        """
+        smu = 'smu'+chan.lower()
+        cmds = [f"{smu}.nvbuffer1.clear()",
+                f"{smu}.nvbuffer2.clear()",
+                f"digio.trigger[{line}].mode = digio.TRIG_FALLING",
+                f"digio.trigger[{line}].clear()",
+                f"siepiclab_source_action_{chan.lower()} = {smu}.trigger.source.action",
+                f"{smu}.trigger.source.action = {smu}.DISABLE",
+                f"{smu}.trigger.measure.action = {smu}.ENABLE",
+                f"{smu}.trigger.measure.iv({smu}.nvbuffer1, {smu}.nvbuffer2)",
+                f"{smu}.trigger.measure.stimulus = digio.trigger[{line}].EVENT_ID",
+                f"{smu}.trigger.count = {int(points)}",
+                f"{smu}.trigger.initiate()"]
+        if nplc is not None:
+            cmds.insert(2, f"{smu}.measure.nplc = {nplc}")
+        self.addr.write(self.addr.join(cmds))
+
+    def GetTriggeredMeasure(self, chan, points):
+        """
+        Read the measurements armed with ArmTriggeredMeasure.
+
+        Waits for the trigger model to complete, reads the buffers in one
+        binary transfer and returns the trigger model to untriggered
+        operation, with the source action saved by ArmTriggeredMeasure.
+
+        Parameters
+        ----------
+        chan : string
+            Channel of the measurements ('A' or 'B').
+        points : int
+            Number of triggers (measurements).
+
+        Returns
+        -------
+        volt : np.array
+            Measured voltage (V).
+        curr : np.array
+            Measured current (A).
+
+        """
+        smu = 'smu'+chan.lower()
+        self.wait()
+        # readings are interleaved per point: current, voltage
+        data = self.addr.read_block(self.addr.join(
+            ["format.data = format.REAL32",
+             "format.byteorder = format.LITTLEENDIAN",
+             f"printbuffer(1, {int(points)}, {smu}.nvbuffer1.readings, {smu}.nvbuffer2.readings)",
+             "format.data = format.ASCII"]), '<f4', count=2*int(points))
+        self.addr.write(self.addr.join([f"{smu}.trigger.measure.stimulus = 0",
+                                        f"{smu}.trigger.source.action = siepiclab_source_action_{chan.lower()}"]))
+        curr = data[0::2].astype(float)
+        volt = data[1::2].astype(float)
+        return volt, curr
+
     def sweep_2CH_VV(self, chan1, chan2, volt_start=0, volt_stop=5, volt_num=10, visualize=True):
         """Set a voltage on CH1 and read curr and voltage on CH1, voltage on CH2."""
         import numpy as np
-        import time
-        import matplotlib.pyplot as plt
         v_arr = np.linspace(volt_start, volt_stop, volt_num)
         chan1 = chan1.upper()
         chan2 = chan2.upper()
         # reset
         self.reset()
         self.wait()
-        # configure channels and bias
-        self.SetOutputMode(chan1, 'volt')
-
-        self.SetOutputMode(chan2, 'curr')
-        self.SetCurrent(0, chan2)
-        # turn on
-        self.SetOutput(1, chan1)
-        self.SetOutput(1, chan2)
-        time.sleep(1)
-        # perform IV sweep
-        v1 = []
-        i1 = []
-        v2 = []
-        for v in v_arr:
-            self.SetVoltage(v, chan1)
-            v1.append(self.GetVoltage(chan1))
-            v2.append(self.GetVoltage(chan2))
-            i1.append(self.GetCurrent(chan1))
+        # sweep CH1 with CH2 sourcing zero current, on the instrument
+        v1, i1, v2, i2 = self.SweepDualBuffered(v_arr, chan1, chan2, 'volt', 'curr', 0.)
 
         # turn off
         self.SetOutput(0, chan1)
         self.SetOutput(0, chan2)
 
         if visualize:
+            import matplotlib.pyplot as plt
             fig, ax1 = plt.subplots()
             ax1.plot(i1, v1, label='CH1', color='blue')
             ax1.set_ylabel('Voltage CH1 (V)', color='blue')
@@ -408,38 +662,21 @@ class smu_keithley(instruments.instr_VISA):
     def sweep_2CH_IV(self, chan1='A', chan2='B', curr_start=0, curr_stop=10e-6, curr_num=10, visualize=True):
         """Set a current on CH1 and read curr and voltage on CH1, voltage on CH2."""
         import numpy as np
-        import time
-        import matplotlib.pyplot as plt
         i_arr = np.linspace(curr_start, curr_stop, curr_num)
         chan1 = chan1.upper()
         chan2 = chan2.upper()
         # reset
         self.reset()
         self.wait()
-        # configure channels and bias
-        self.SetOutputMode(chan2, 'curr')
-
-        self.SetOutputMode(chan1, 'curr')
-        self.SetCurrent(0, chan2)
-        # turn on
-        self.SetOutput(1, chan1)
-        self.SetOutput(1, chan2)
-        time.sleep(1)
-        # perform IV sweep
-        v1 = []
-        i1 = []
-        v2 = []
-        for i in i_arr:
-            self.SetCurrent(i, chan1)
-            v1.append(self.GetVoltage(chan1))
-            v2.append(self.GetVoltage(chan2))
-            i1.append(self.GetCurrent(chan1))
+        # sweep CH1 with CH2 sourcing zero current, on the instrument
+        v1, i1, v2, i2 = self.SweepDualBuffered(i_arr, chan1, chan2, 'curr', 'curr', 0.)
 
         # turn off
         self.SetOutput(0, chan1)
         self.SetOutput(0, chan2)
 
         if visualize:
+            import matplotlib.pyplot as plt
             fig, ax1 = plt.subplots()
             ax1.plot(i1, v1, label='CH1', color='blue')
             ax1.set_ylabel('Voltage CH1 (V)', color='blue')
@@ -459,35 +696,16 @@ class smu_keithley(instruments.instr_VISA):
     
     def SweepVV_independent(self, ch1='A', ch2='B', v1_start=0, v1_stop=5, v2_bias=0, pts=100, visualize=True):
         import numpy as np
-        import matplotlib.pyplot as plt
         self.reset()
-        self.SetOutputMode(ch1, 'volt')
-        self.SetOutputMode(ch2, 'volt')
-    
         v_arr = np.linspace(v1_start, v1_stop, pts)
-        self.SetVoltage(0, ch1)
-        self.SetVoltage(v2_bias, ch2)
-    
-        i1 = []
-        v1 = []
-        i2 = []
-        v2 = []
-    
-        self.SetOutput(1, ch1)
-        self.SetOutput(1, ch2)
-    
-        for v in v_arr:
-            self.SetVoltage(v, ch1)
-            v1.append(self.GetVoltage(ch1))
-            i1.append(self.GetCurrent(ch1))
-            v2.append(self.GetVoltage(ch2))
-            i2.append(self.GetCurrent(ch2))
-    
+        v1, i1, v2, i2 = self.SweepDualBuffered(v_arr, ch1, ch2, 'volt', 'volt', v2_bias)
+
         # turn off
         self.SetOutput(0, ch1)
         self.SetOutput(0, ch2)
     
         if visualize:
+            import matplotlib.pyplot as plt
             fig1, ax1 = plt.subplots()
             ax1.plot(v1, i1, label='CH1 (PS)', color='blue')
             ax1.set_xlabel('Voltage CH1 (V)', color='blue')
@@ -505,35 +723,16 @@ class smu_keithley(instruments.instr_VISA):
 
     def SweepVI_independent(self, ch1='A', ch2='B', v1_start=0, v1_stop=5, curr2=0, pts=100, visualize=True):
         import numpy as np
-        import matplotlib.pyplot as plt
         self.reset()
-        self.SetOutputMode(ch1, 'volt')
-        self.SetOutputMode(ch2, 'curr')
-    
         v_arr = np.linspace(v1_start, v1_stop, pts)
-        self.SetVoltage(0, ch1)
-        self.SetCurrent(curr2, ch2)
-    
-        i1 = []
-        v1 = []
-        i2 = []
-        v2 = []
-    
-        self.SetOutput(1, ch1)
-        self.SetOutput(1, ch2)
-    
-        for v in v_arr:
-            self.SetVoltage(v, ch1)
-            v1.append(self.GetVoltage(ch1))
-            i1.append(self.GetCurrent(ch1))
-            v2.append(self.GetVoltage(ch2))
-            i2.append(self.GetCurrent(ch2))
-    
+        v1, i1, v2, i2 = self.SweepDualBuffered(v_arr, ch1, ch2, 'volt', 'curr', curr2)
+
         # turn off
         self.SetOutput(0, ch1)
         self.SetOutput(0, ch2)
     
         if visualize:
+            import matplotlib.pyplot as plt
             fig1, ax1 = plt.subplots()
             ax1.plot(v1, i1, label='CH1', color='blue')
             ax1.set_xlabel('Voltage CH1 (V)', color='blue')
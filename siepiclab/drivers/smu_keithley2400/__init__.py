@@ -17,6 +17,23 @@ class smu_keithley2400(instruments.instr_VISA):
         Keithley 2400
     """
 
+    shadow_params = [
+        instruments.shadowed('GetOutput', 'SetOutput', convert=int, skip=('AB',)),
+        instruments.shadowed('GetCurrentLimit', 'SetCurrentLimit', convert=float, skip=('AB',)),
+        instruments.shadowed('GetVoltageLimit', 'SetVoltageLimit', convert=float, skip=('AB',)),
+    ]
+
+    list_max = 100  # points of a source list sweep
+
+    # limits are set before the levels, the output is switched last
+    state_params = [
+        ('curr_lim_a', 'SetCurrentLimit', 'A'),
+        ('volt_lim_a', 'SetVoltageLimit', 'A'),
+        ('volt_a', 'SetVoltage', 'A'),
+        ('curr_a', 'SetCurrent', 'A'),
+        ('output_a', 'SetOutput', 'A'),
+    ]
+
     def GetState(self):
         """Return an instance of the instrument."""
         currState = instruments.state()
@@ -29,26 +46,6 @@ class smu_keithley2400(instruments.instr_VISA):
 
         return currState
 
-    def SetState(self, state):
-        """
-        Set the state of the instrument to a given state.
-
-        Parameters
-        ----------
-        state : SiEPIC Lab instruments type
-            State of the instrument.
-
-        Returns
-        -------
-        None.
-
-        """
-        self.SetOutput(state['output_a'], 'A', verbose=True)
-        self.SetVoltage(state['volt_a'], 'A', verbose=True)
-        self.SetCurrent(state['curr_a'], 'A', verbose=True)
-        self.SetCurrentLimit(state['curr_lim_a'], 'A', verbose=True)
-        self.SetVoltageLimit(state['volt_lim_a'], 'A', verbose=True)
-
     def reset(self, verbose=False):
         """
         Reset the instrument.
@@ -381,3 +378,109 @@ class smu_keithley2400(instruments.instr_VISA):
             self.SetResistanceMode(chan)
             res = float(self.addr.query("READ?"))
             return res
+
+    def Measure(self, chan='A', quantities=('v', 'i', 'r')):
+        """
+        Measure several quantities of the channel in one reading.
+
+        The voltage and current are read together by a multi-element READ?,
+        the resistance is computed from them. The source is left unchanged.
+
+        Parameters
+        ----------
+        chan : String, optional
+            Source measure unit channel. The default is "A".
+        quantities : tuple of strings, optional
+            Quantities to return, 'v' (V), 'i' (A) or 'r' (Ohms). The default
+            is ('v', 'i', 'r').
+
+        Returns
+        -------
+        values : tuple
+            Measured values in the order of quantities.
+
+        """
+        if chan != 'A':
+            print("ERR: Not a valid channel. The only valid channel is 'A'.")
+            return
+        if not set(quantities) <= {'v', 'i', 'r'}:
+            print("ERR: Not a valid quantity. Valid quantities are 'v', 'i' and 'r'.")
+            return
+        re = self.addr.query(self.addr.join(["SENS1:FUNC:CONC ON",
+                                             'SENS1:FUNC:ON "VOLT","CURR"',
+                                             "FORM:ELEM VOLT,CURR",
+                                             "READ?"]))
+        volt, curr = [float(x) for x in re.split(',')]
+        values = {'v': volt, 'i': curr, 'r': volt/curr if curr else 9.91e37}
+        return tuple(values[q] for q in quantities)
+
+    def SweepIVBuffered(self, v_pts, chan='A', stime=0., nplc=None):
+        """
+        Voltage sweep on the instrument trigger model.
+
+        Evenly spaced points run as a linear sweep, other points as list
+        sweeps of up to list_max points. Each sweep returns the voltage,
+        current and resistance of all its points in one binary block. The
+        output is turned on and held at the last point of the sweep.
+
+        Parameters
+        ----------
+        v_pts : list or np.array
+            Voltage points of the sweep (V).
+        chan : String, optional
+            Source measure unit channel. The default is "A".
+        stime : float, optional
+            Source delay before each measurement (s). The default is 0.
+        nplc : float, optional
+            Integration time in number of power line cycles. The default is
+            None, which keeps the instrument setting.
+
+        Returns
+        -------
+        volt : np.array
+            Measured voltage (V).
+        curr : np.array
+            Measured current (A).
+        res : np.array
+            Measured resistance (Ohms).
+
+        """
+        import numpy as np
+        v_pts = np.asarray(v_pts, dtype=float).ravel()
+        steps = np.diff(v_pts)
+        if len(v_pts) > 1 and np.allclose(steps, steps[0]):
+            sweeps = [(["SOUR1:VOLT:MODE SWE",
+                        f"SOUR1:VOLT:STAR {float(v_pts[0])!r}",
+                        f"SOUR1:VOLT:STOP {float(v_pts[-1])!r}",
+                        "SOUR1:SWE:SPAC LIN",
+                        f"SOUR1:SWE:POIN {len(v_pts)}"], len(v_pts))]
+        else:
+            sweeps = [(["SOUR1:VOLT:MODE LIST",
+                        "SOUR1:LIST:VOLT "+','.join(repr(float(v)) for v in v_pts[idx:idx+self.list_max])],
+                       len(v_pts[idx:idx+self.list_max]))
+                      for idx in range(0, len(v_pts), self.list_max)]
+
+        cmds = ["SOUR1:FUNC VOLT",
+                f"SOUR1:DEL {stime}",
+                "SENS1:FUNC:CONC ON",
+                'SENS1:FUNC:ON "VOLT","CURR","RES"',
+                "SENS1:RES:MODE MAN",
+                "FORM:ELEM VOLT,CURR,RES",
+                "FORM:DATA REAL,64",
+                "FORM:BORD SWAP",
+                ":OUTP1 1"]
+        if nplc is not None:
+            cmds.insert(2, f"SENS1:CURR:NPLC {nplc}")
+        self.addr.write(self.addr.join(cmds))
+        data = []
+        for sweep, points in sweeps:
+            self.addr.write(self.addr.join(sweep+[f"TRIG:COUN {points}"]))
+            data.append(self.addr.read_block("READ?", '<f8', count=3*points))
+        # back to single readings in ASCII, the source held at the last point
+        self.addr.write(self.addr.join([f"SOUR1:VOLT {float(v_pts[-1])!r}",
+                                        "SOUR1:VOLT:MODE FIX",
+                                        "TRIG:COUN 1",
+                                        "FORM:DATA ASC"]))
+        self.invalidate_shadow('GetOutput')
+        data = np.concatenate(data).reshape(-1, 3)
+        return data[:, 0], data[:, 1], data[:, 2]
@@ -9,16 +9,38 @@ Mustafa Hammood, SiEPIC Kits, 2022
 from siepiclab import instruments
 
 
-class smu_keithley2400(instruments.instr_VISA):
+class smu_keithley2402(instruments.instr_VISA):
     """
     Keithley class source measure unit class.
 
     Includes:
-        Keithley 2400
+        Keithley 2400 series with two channels
     """
 
-    def __init__(self, single_chan=True):
-
+    shadow_params = [
+        instruments.shadowed('GetOutput', 'SetOutput', convert=int, skip=('AB',)),
+        instruments.shadowed('GetCurrentLimit', 'SetCurrentLimit', convert=float, skip=('AB',)),
+        instruments.shadowed('GetVoltageLimit', 'SetVoltageLimit', convert=float, skip=('AB',)),
+    ]
+
+    list_max = 100  # points of a source list sweep
+
+    # limits are set before the levels, outputs are switched last
+    state_params = [
+        ('curr_lim_a', 'SetCurrentLimit', 'A'),
+        ('curr_lim_b', 'SetCurrentLimit', 'B'),
+        ('volt_lim_a', 'SetVoltageLimit', 'A'),
+        ('volt_lim_b', 'SetVoltageLimit', 'B'),
+        ('volt_a', 'SetVoltage', 'A'),
+        ('volt_b', 'SetVoltage', 'B'),
+        ('curr_a', 'SetCurrent', 'A'),
+        ('curr_b', 'SetCurrent', 'B'),
+        ('output_a', 'SetOutput', 'A'),
+        ('output_b', 'SetOutput', 'B'),
+    ]
+
+    def __init__(self, addr, chan=None, single_chan=True):
+        super(smu_keithley2402, self).__init__(addr, chan)
         self.single_chan = single_chan  # Flag to set to False in case your unit somehow has 2 channels??
 
     def GetState(self):
@@ -40,33 +62,6 @@ class smu_keithley2400(instruments.instr_VISA):
             currState.AddState('res_b', self.GetResistance('B'))
         return currState
 
-    def SetState(self, state):
-        """
-        Set the state of the instrument to a given state.
-
-        Parameters
-        ----------
-        state : SiEPIC Lab instruments type
-            State of the instrument.
-
-        Returns
-        -------
-        None.
-
-        """
-        self.SetOutput(state['output_a'], 'A', verbose=True)
-        self.SetVoltage(state['volt_a'], 'A', verbose=True)
-        self.SetCurrent(state['curr_a'], 'A', verbose=True)
-        self.SetCurrentLimit(state['curr_lim_a'], 'A', verbose=True)
-        self.SetVoltageLimit(state['volt_lim_a'], 'A', verbose=True)
-
-        if not self.single_chan:
-            self.SetOutput(state['output_b'], 'B', verbose=True)
-            self.SetVoltage(state['volt_b'], 'B', verbose=True)
-            self.SetCurrent(state['curr_b'], 'B', verbose=True)
-            self.SetCurrentLimit(state['curr_lim_b'], 'B', verbose=True)
-            self.SetVoltageLimit(state['volt_lim_b'], 'B', verbose=True)
-
     def reset(self, verbose=False):
         """
         Reset the instrument.
@@ -483,3 +478,109 @@ class smu_keithley2400(instruments.instr_VISA):
             res_a = float(self.addr.query("SENS1:RES?"))
             res_b = float(self.addr.query("SENS2:RES?"))
             return res_a, res_b
+
+    def Measure(self, chan, quantities=('v', 'i', 'r')):
+        """
+        Measure several quantities of the channels in one query.
+
+        The voltage and current of the channels are read by one compound
+        query, the resistance is computed from them.
+
+        Parameters
+        ----------
+        chan : String
+            Source measure unit channel. "A", "B" or "AB".
+        quantities : tuple of strings, optional
+            Quantities to return, 'v' (V), 'i' (A) or 'r' (Ohms). The default
+            is ('v', 'i', 'r').
+
+        Returns
+        -------
+        values : tuple
+            Measured values in the order of quantities, a tuple per channel
+            for "AB".
+
+        """
+        if chan not in ('A', 'B', 'AB'):
+            print("ERR: Not a valid channel. Valid channels are 'A', 'B' and 'AB'.")
+            return
+        if not set(quantities) <= {'v', 'i', 'r'}:
+            print("ERR: Not a valid quantity. Valid quantities are 'v', 'i' and 'r'.")
+            return
+        chans = {'A': ['1'], 'B': ['2'], 'AB': ['1', '2']}[chan]
+        re = self.addr.query(self.addr.join([f"SENS{ch}:{q}?" for ch in chans for q in ('VOLT', 'CURR')]))
+        re = [float(x) for x in re.split(';')]
+        measured = []
+        for volt, curr in zip(re[0::2], re[1::2]):
+            values = {'v': volt, 'i': curr, 'r': volt/curr if curr else 9.91e37}
+            measured.append(tuple(values[q] for q in quantities))
+        return measured[0] if len(measured) == 1 else tuple(measured)
+
+    def SweepIVBuffered(self, v_pts, chan='A', stime=0., nplc=None):
+        """
+        Voltage list sweep of one channel or both channels in sync.
+
+        The channels step on a shared trigger through their own lists of
+        points, in sweeps of up to list_max points. Each sweep returns the
+        voltage, current and resistance of all its points and channels in
+        one binary block. The outputs are turned on and held at the last
+        point of the sweep.
+
+        Parameters
+        ----------
+        v_pts : list or np.array
+            Voltage points of the sweep (V). For chan 'AB', a pair of the
+            points of channel A and B, each a list or a constant voltage.
+        chan : String, optional
+            Source measure unit channel. "A", "B" or "AB". The default is "A".
+        stime : float, optional
+            Source delay before each measurement (s). The default is 0.
+        nplc : float, optional
+            Integration time in number of power line cycles. The default is
+            None, which keeps the instrument setting.
+
+        Returns
+        -------
+        volt : np.array
+            Measured voltage (V), one column per channel for chan 'AB'.
+        curr : np.array
+            Measured current (A), one column per channel for chan 'AB'.
+        res : np.array
+            Measured resistance (Ohms), one column per channel for chan 'AB'.
+
+        """
+        import numpy as np
+        if chan == 'AB':
+            points = max(np.size(v) for v in v_pts)
+            lists = [np.broadcast_to(np.asarray(v, dtype=float).ravel(), (points,)) for v in v_pts]
+            chans = ['1', '2']
+        else:
+            lists = [np.asarray(v_pts, dtype=float).ravel()]
+            points = len(lists[0])
+            chans = ['1' if chan == 'A' else '2']
+
+        cmds = ["FORM:ELEM VOLT,CURR,RES", "FORM:DATA REAL,64", "FORM:BORD SWAP"]
+        for ch in chans:
+            cmds += [f"SOUR{ch}:FUNC VOLT", f"SOUR{ch}:DEL {stime}", f"SOUR{ch}:VOLT:MODE LIST"]
+            if nplc is not None:
+                cmds.append(f"SENS{ch}:CURR:NPLC {nplc}")
+            cmds.append(f":OUTP{ch} 1")
+        self.addr.write(self.addr.join(cmds))
+        query = "READ? (@"+','.join(chans)+")"
+        data = []
+        for idx in range(0, points, self.list_max):
+            count = min(self.list_max, points-idx)
+            cmds = [f"SOUR{ch}:LIST:VOLT "+','.join(repr(float(v)) for v in values[idx:idx+count])
+                    for ch, values in zip(chans, lists)]
+            self.addr.write(self.addr.join(cmds+[f"TRIG:COUN {count}"]))
+            data.append(self.addr.read_block(query, '<f8', count=3*count*len(chans)))
+        # back to single readings in ASCII, the sources held at the last point
+        cmds = []
+        for ch, values in zip(chans, lists):
+            cmds += [f"SOUR{ch}:VOLT {float(values[-1])!r}", f"SOUR{ch}:VOLT:MODE FIX"]
+        self.addr.write(self.addr.join(cmds+["TRIG:COUN 1", "FORM:DATA ASC"]))
+        self.invalidate_shadow('GetOutput')
+        data = np.concatenate(data).reshape(points, len(chans), 3)
+        if chan != 'AB':
+            data = data[:, 0]
+        return data[..., 0], data[..., 1], data[..., 2]
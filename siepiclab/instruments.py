@@ -4,6 +4,23 @@ SiEPIClab instruments module.
 
 Mustafa Hammood, SiEPIC Kits, 2022
 """
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import asyncio
+import csv
+import functools
+import hashlib
+import inspect
+import json
+import math
+import re
+import struct
+import textwrap
+import threading
+import time
+import weakref
+import numpy as np
 
 
 class instr:
@@ -43,11 +60,1534 @@ class state:
         return self.state
 
 
+class shadow:
+    """
+    Instrument shadow register abstraction class.
+
+    Records the parameter values written by the driver setters so that the
+    getters can answer without querying the instrument.
+
+    max_age : float, Optional.
+        Time after which a recorded value is considered stale and queried
+        again (seconds), e.g. to catch front panel changes.
+        Default is None (never stale).
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self.register = {}
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, key, value):
+        """
+        Record the value of a parameter.
+
+        Parameters
+        ----------
+        key : tuple
+            Parameter key (getter name and getter arguments).
+        value : ANY TYPE
+            Value of the parameter.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.register[key] = (value, time.monotonic())
+
+    def lookup(self, key):
+        """
+        Look up the value of a parameter.
+
+        Parameters
+        ----------
+        key : tuple
+            Parameter key (getter name and getter arguments).
+
+        Returns
+        -------
+        hit : Boolean
+            True if the parameter value is in the register and not stale.
+        value : ANY TYPE
+            Value of the parameter, None if not a hit.
+
+        """
+        entry = self.register.get(key)
+        if entry is not None:
+            value, t = entry
+            if self.max_age is None or time.monotonic()-t <= self.max_age:
+                self.hits += 1
+                return True, value
+            del self.register[key]
+        self.misses += 1
+        return False, None
+
+    def invalidate(self, name=None):
+        """
+        Invalidate recorded parameters.
+
+        Parameters
+        ----------
+        name : string, optional
+            Getter name of the parameter to invalidate. The default is None,
+            which invalidates all the parameters.
+
+        Returns
+        -------
+        None.
+
+        """
+        if name is None:
+            self.register.clear()
+        else:
+            for key in [k for k in self.register if k[0] == name]:
+                del self.register[key]
+
+
+class shadowed:
+    """
+    Shadowed parameter of an instrument driver.
+
+    Declares a getter/setter pair of a driver whose value can be answered
+    from the instrument shadow register, see instr_VISA.enable_shadow.
+
+    getter : string
+        Name of the getter method.
+    setter : string
+        Name of the setter method.
+    values : tuple of strings, Optional.
+        Names of the setter arguments holding the value. Default is the first
+        argument of the setter.
+    convert : function, Optional.
+        Converts the setter value(s) to the value returned by the getter.
+        Raising KeyError or ValueError leaves the parameter unrecorded.
+    skip : tuple, Optional.
+        Argument values (e.g. channel 'AB') that are never shadowed.
+    readthrough : Boolean, Optional.
+        Record the values queried by the getter, not only the values written
+        by the setter. Default is True.
+    """
+
+    def __init__(self, getter, setter, values=None, convert=None, skip=(), readthrough=True):
+        self.getter = getter
+        self.setter = setter
+        self.values = values
+        self.convert = convert
+        self.skip = skip
+        self.readthrough = readthrough
+
+    def wrap(self, cls):
+        """Wrap the getter and setter methods defined in a driver class."""
+        if self.getter in cls.__dict__:
+            setattr(cls, self.getter, self.wrap_getter(cls.__dict__[self.getter]))
+        if self.setter in cls.__dict__:
+            setattr(cls, self.setter, self.wrap_setter(cls.__dict__[self.setter]))
+
+    def key(self, sig, names, args, kwargs):
+        """Build the register key from the call arguments, None if skipped."""
+        bound = sig.bind(None, *args, **kwargs)
+        bound.apply_defaults()
+        key = [self.getter]
+        for name in names:
+            value = bound.arguments[name]
+            if value in self.skip:
+                return None
+            key.append(value)
+        return tuple(key)
+
+    def wrap_getter(self, fget):
+        """Wrap a getter to answer from the shadow register when enabled."""
+        param = self
+        sig = inspect.signature(fget)
+        names = list(sig.parameters)[1:]
+
+        @functools.wraps(fget)
+        def getter(instr, *args, **kwargs):
+            reg = getattr(instr, 'shadow', None)
+            key = None if reg is None else param.key(sig, names, args, kwargs)
+            if key is None:
+                return fget(instr, *args, **kwargs)
+            hit, value = reg.lookup(key)
+            if not hit:
+                value = fget(instr, *args, **kwargs)
+                if param.readthrough:
+                    reg.record(key, value)
+            return value
+        return getter
+
+    def wrap_setter(self, fset):
+        """Wrap a setter to record the value written in the shadow register."""
+        param = self
+        sig = inspect.signature(fset)
+        params = list(sig.parameters)[1:]
+        values = self.values or params[:1]
+        names = [n for n in params if n not in values and n not in ('verbose', 'wait')]
+
+        @functools.wraps(fset)
+        def setter(instr, *args, **kwargs):
+            reg = getattr(instr, 'shadow', None)
+            if reg is None:
+                return fset(instr, *args, **kwargs)
+            key = param.key(sig, names, args, kwargs)
+            if key is None:
+                reg.invalidate(param.getter)
+                return fset(instr, *args, **kwargs)
+            reg.register.pop(key, None)
+            re = fset(instr, *args, **kwargs)
+            # a verbose setter already recorded the value read back
+            if key not in reg.register:
+                bound = sig.bind(instr, *args, **kwargs)
+                bound.apply_defaults()
+                value = [bound.arguments[n] for n in values]
+                try:
+                    if param.convert is not None:
+                        value = param.convert(*value)
+                    else:
+                        value = value[0]
+                except (KeyError, ValueError):
+                    return re
+                reg.record(key, value)
+            return re
+        return setter
+
+
+def same_value(a, b, rel_tol=1e-6, abs_tol=1e-12):
+    """
+    Compare two parameter values, numbers within a tolerance.
+
+    Parameters
+    ----------
+    a, b : ANY TYPE
+        Values to compare, sequences are compared element-wise.
+    rel_tol : float, optional
+        Relative tolerance of numbers. The default is 1e-6.
+    abs_tol : float, optional
+        Absolute tolerance of numbers. The default is 1e-12.
+
+    Returns
+    -------
+    Boolean
+        True if the values are the same.
+
+    """
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same_value(x, y, rel_tol, abs_tol) for x, y in zip(a, b))
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) and \
+            not isinstance(a, bool) and not isinstance(b, bool):
+        return math.isclose(a, b, rel_tol=rel_tol, abs_tol=abs_tol)
+    return a == b
+
+
+def unit_name(unit):
+    """Power unit name as returned by the drivers ('dBm' or 'mW')."""
+    return {'dbm': 'dBm', 'mw': 'mW'}[unit.lower()]
+
+
+def unit_code(unit):
+    """Power unit code written to the instruments (0: dBm, 1: W)."""
+    codes = {'dbm': '0', 'mw': '1'}
+    if str(unit).lower() not in codes:
+        raise ValueError("Not a valid unit. Valid units are 'dBm' and 'mW', as str.")
+    return codes[str(unit).lower()]
+
+
+def params_named(params, *names):
+    """
+    Select declared parameters by name, in the order of the names.
+
+    Raises KeyError if a name is not declared in params, a driver table built
+    from another driver table does not silently lose a parameter.
+    """
+    index = {p.name: p for p in params}
+    return [index[name] for name in names]
+
+
+class parameter:
+    """
+    Declared parameter of an instrument driver.
+
+    Describes how a parameter is queried and written. The Get<name> and
+    Set<name> accessors of the driver, its state and its state restore order
+    are generated from the table of declared parameters, see
+    instr_VISA.params.
+
+    name : string
+        Name of the parameter, the accessors are 'Get'+name and 'Set'+name.
+    query : string
+        Query template, formatted with the driver template fields (see
+        instr_VISA.fields), e.g. '{sour}:WAV?'.
+    write : string, Optional.
+        Write template, formatted with the driver template fields and the
+        formatted value(s) as positional fields, e.g. '{sour}:WAV {}NM'.
+        Default is None (read-only parameter).
+    parse : function, Optional.
+        Converts the response string to the value. Default is float.
+    format : function, Optional.
+        Converts the setter value(s) to the written value(s), a tuple for
+        several. Raising ValueError rejects the value. Default is str.
+    values : tuple of strings, Optional.
+        Names of the setter value arguments. Default is ('value',).
+    defaults : dict, Optional.
+        Default values of the setter value arguments, by name, e.g.
+        {'unit': 'mW'}. Default is None (no defaults).
+    state : string or tuple of strings, Optional.
+        Key of the parameter in the instrument state, a tuple of keys for a
+        parameter of several values. Default is None (not in the state).
+    doc : string, Optional.
+        Description of the parameter, e.g. 'laser wavelength (nm)'.
+    """
+
+    def __init__(self, name, query, write=None, parse=float, format=str, values=('value',),
+                 defaults=None, state=None, doc=None):
+        self.name = name
+        self.query = query
+        self.write = write
+        self.parse = parse
+        self.format = format
+        self.values = values
+        self.defaults = defaults or {}
+        self.state = state
+        self.doc = doc or name
+
+    def query_cmd(self, fields):
+        """Build the query of the parameter."""
+        return self.query.format(**fields)
+
+    def write_cmd(self, fields, *values):
+        """Build the write of the parameter values."""
+        formatted = self.format(*values)
+        if not isinstance(formatted, tuple):
+            formatted = (formatted,)
+        return self.write.format(*formatted, **fields)
+
+    def wrap(self, cls):
+        """Generate the accessors of the parameter missing in a driver class."""
+        name = self.name
+        if 'Get'+name not in cls.__dict__:
+            def getter(instr):
+                return instr.get_param(name)
+            getter.__name__ = getter.__qualname__ = 'Get'+name
+            getter.__doc__ = self.getter_doc()
+            setattr(cls, 'Get'+name, getter)
+        if self.write is not None and 'Set'+name not in cls.__dict__:
+            kind = inspect.Parameter.POSITIONAL_OR_KEYWORD
+            signature = inspect.Signature(
+                [inspect.Parameter('self', kind)] +
+                [inspect.Parameter(v, kind, default=self.defaults.get(v, inspect.Parameter.empty))
+                 for v in self.values] +
+                [inspect.Parameter('verbose', kind, default=False),
+                 inspect.Parameter('wait', kind, default=False)])
+
+            names = self.values
+
+            def setter(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                arguments = bound.arguments
+                return arguments['self'].set_param(name, *[arguments[v] for v in names],
+                                                   verbose=arguments['verbose'], wait=arguments['wait'])
+            setter.__name__ = setter.__qualname__ = 'Set'+name
+            setter.__doc__ = self.setter_doc()
+            setter.__signature__ = signature
+            setattr(cls, 'Set'+name, setter)
+
+    def getter_doc(self):
+        """Docstring of the generated getter."""
+        return ('Get the '+self.doc+'.\n\n'
+                'Returns\n-------\n'+', '.join(self.values)+'\n    Value of the parameter.\n')
+
+    def setter_doc(self):
+        """Docstring of the generated setter."""
+        return ('Set the '+self.doc+'.\n\n'
+                'Parameters\n----------\n'+', '.join(self.values)+'\n    Value of the parameter.\n'
+                + ''.join('    The default of '+v+' is '+repr(d)+'.\n' for v, d in self.defaults.items()) +
+                'verbose : Boolean, optional\n    Return the instrument reading after the operation.\n'
+                '    The default is False.\n'
+                'wait : Boolean, optional\n    Block program until the query is done. The default is False.\n\n'
+                'Returns\n-------\nNone unless verbose is True.\n')
+
+
+class tsp_script:
+    """
+    TSP script of functions of a driver library.
+
+    The script is loaded on the instrument under a name derived from the
+    hash of its source, so a changed script is loaded again while an
+    unchanged one is loaded once, see session.load_script. Running the
+    script defines its functions on the instrument.
+
+    name : string
+        Name of the library, e.g. 'siepiclab'.
+    source : string
+        TSP source of the script, one statement per line.
+    """
+
+    def __init__(self, name, source):
+        self.source = textwrap.dedent(source).strip()
+        self.name = name+'_'+hashlib.sha1(self.source.encode()).hexdigest()[:8]
+
+    def lines(self):
+        """Lines of the script upload."""
+        return ['loadscript '+self.name]+self.source.splitlines()+['endscript']
+
+
 class instruction:
     """Instrument instruction abstraction class."""
 
-    def __init__(self):
-        return
+    def __init__(self):
+        return
+
+
+class opc_engine:
+    """
+    Operation complete engine of a VISA session.
+
+    Waits for the pending operations of an instrument to complete, either by
+    service request (SRQ) notification or by polling '*OPC?'. The session is
+    held from '*OPC' until the service request is read, so that concurrent
+    waits on a session do not take each other's request. After a missed
+    request, waits poll until the operations are complete and the stale
+    status is cleared.
+
+    mode : String, Optional.
+        'srq', 'poll' or 'auto'. 'auto' uses SRQ if the resource supports
+        it and falls back to polling otherwise. Default is 'auto'.
+    timeout : float, Optional.
+        Deadline of a wait (seconds). Default is None (no deadline).
+    poll_min : float, Optional.
+        First polling interval (seconds). Default is 1 ms.
+    poll_max : float, Optional.
+        Maximum polling interval (seconds). Default is 100 ms.
+    backoff : float, Optional.
+        Polling interval growth factor. Default is 2.
+    """
+
+    # VISA status codes of a timeout and of an unsupported SRQ event
+    VI_ERROR_TMO = -1073807339
+    VI_ERROR_NSUP = (-1073807257, -1073807322, -1073807196)  # NSUP_OPER, INV_EVENT, NSUP_MECH
+    # VISA service request event type and queue event mechanism
+    VI_EVENT_SERVICE_REQ = 0x3FFF200B
+    VI_QUEUE = 1
+
+    def __init__(self, sess):
+        self.session = sess
+        self.mode = 'auto'
+        self.timeout = None
+        self.poll_min = 1e-3
+        self.poll_max = 0.1
+        self.backoff = 2
+        self.srq = None  # None: SRQ not tried yet, False: not supported
+        self.stale = False  # an '*OPC' of a missed service request may be pending
+        self.last = None
+
+    def wait(self, timeout=None):
+        """
+        Block the program until the instrument operations are complete.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Deadline of the wait (seconds). The default is the engine timeout.
+
+        Returns
+        -------
+        report : dict
+            'method' used ('srq' or 'poll'), number of 'polls' and time
+            'elapsed' waiting (seconds).
+
+        """
+        if timeout is None:
+            timeout = self.timeout
+        t0 = time.monotonic()
+        deadline = None if timeout is None else t0+timeout
+
+        method = 'poll'
+        polls = 0
+        if self.mode != 'poll' and self.srq is not False and not self.stale and \
+                hasattr(self.session.resource, 'wait_for_srq'):
+            if self.wait_srq(deadline):
+                method = 'srq'
+            elif self.mode == 'srq':
+                raise TimeoutError('Operation complete SRQ was not received.')
+        if method == 'poll':
+            polls = self.poll(deadline)
+            if self.stale:
+                self.clear()
+
+        self.last = {'method': method, 'polls': polls, 'elapsed': time.monotonic()-t0}
+        return self.last
+
+    def wait_srq(self, deadline):
+        """
+        Wait for the operation complete service request.
+
+        Parameters
+        ----------
+        deadline : float
+            time.monotonic() deadline of the wait, None for no deadline.
+
+        Returns
+        -------
+        Boolean
+            True if the service request was received. False if the backend
+            does not support SRQ (polled from now on), or if the request was
+            not received by the deadline (polled until the status is clear).
+
+        """
+        sess = self.session
+        with sess.arbiter.request():
+            try:
+                if not self.srq:
+                    # operation complete sets ESR bit 0, ESB (STB bit 5) asserts SRQ
+                    sess.write('*ESE 1')
+                    sess.write('*SRE 32')
+                    self.srq = True
+                sess.write('*OPC')
+                sess.flush()
+                if deadline is None:
+                    sess.resource.wait_for_srq(None)
+                else:
+                    timeout = max(deadline-time.monotonic(), 0)
+                    sess.resource.wait_for_srq(int(1e3*timeout))
+            except (AttributeError, NotImplementedError):
+                # backend does not support SRQ, poll from now on
+                self.srq = False
+                return False
+            except Exception as err:
+                code = getattr(err, 'error_code', None)
+                if code in self.VI_ERROR_NSUP:
+                    self.srq = False
+                    return False
+                if code == self.VI_ERROR_TMO or isinstance(err, TimeoutError):
+                    # SRQ is kept, the pending '*OPC' would raise a stale request
+                    self.stale = True
+                    return False
+                raise
+            sess.query('*ESR?')  # clear the event status register
+            return True
+
+    def clear(self):
+        """Clear the status and the queued service requests left by a missed request."""
+        sess = self.session
+        with sess.arbiter.request():
+            sess.query('*ESR?')
+            discard_events = getattr(sess.resource, 'discard_events', None)
+            if discard_events is not None:
+                discard_events(self.VI_EVENT_SERVICE_REQ, self.VI_QUEUE)
+        self.stale = False
+
+    def poll(self, deadline):
+        """
+        Poll '*OPC?' with exponential backoff until the operations are complete.
+
+        Parameters
+        ----------
+        deadline : float
+            time.monotonic() deadline of the wait, None for no deadline.
+
+        Returns
+        -------
+        polls : int
+            Number of '*OPC?' queries.
+
+        """
+        delay = self.poll_min
+        polls = 0
+        while True:
+            polls += 1
+            if self.session.query('*OPC?').find('1') != -1:
+                return polls
+            if deadline is not None and time.monotonic()+delay > deadline:
+                raise TimeoutError('Operation did not complete after ' +
+                                   str(polls)+' *OPC? polls.')
+            time.sleep(delay)
+            delay = min(delay*self.backoff, self.poll_max)
+
+
+class arbiter:
+    """
+    I/O arbiter of a VISA session.
+
+    Serializes the access to a physical session. Requests are queued per
+    client (driver object); when the session is released it is granted to
+    the head of the client queues with the lowest priority value, clients
+    of equal priority being served in turn. A thread holding the session
+    can request it again (re-entrant).
+
+    Methods
+    -------
+    request
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.owner = None
+        self.depth = 0
+        self.queues = {}
+        self.served = {}
+        self.grants = 0
+
+    def pending(self):
+        """Number of requests waiting for the session."""
+        with self.cond:
+            return sum(len(q) for q in self.queues.values())
+
+    def next(self):
+        """Ticket to grant next: lowest priority, then least recently served client."""
+        best = None
+        for key, q in self.queues.items():
+            rank = (q[0][0], self.served.get(key, -1))
+            if best is None or rank < best[0]:
+                best = (rank, q[0])
+        return best[1]
+
+    @contextmanager
+    def request(self, client=None, priority=0):
+        """
+        Hold the session for the duration of the context.
+
+        Parameters
+        ----------
+        client : ANY TYPE, optional
+            Client of the request, e.g. a driver object. The default is None.
+        priority : int, optional
+            Priority of the request, lower is served first. The default is 0.
+
+        Returns
+        -------
+        Context manager.
+
+        """
+        me = threading.get_ident()
+        with self.cond:
+            if self.owner == me:
+                self.depth += 1
+            else:
+                key = id(client)
+                ticket = (priority, me)
+                q = self.queues.setdefault(key, deque())
+                q.append(ticket)
+                while self.owner is not None or self.next() is not ticket:
+                    self.cond.wait()
+                q.popleft()
+                if not q:
+                    del self.queues[key]
+                self.owner = me
+                self.depth = 1
+                self.served[key] = self.grants
+                self.grants += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.depth -= 1
+                if not self.depth:
+                    self.owner = None
+                    self.cond.notify_all()
+
+
+class io_stats:
+    """
+    I/O statistics of a VISA session.
+
+    Records the count, bytes and latency distribution of every bus
+    transaction, keyed by command template: numeric suffixes, TSP channel
+    letters and arguments are replaced, e.g. 'SOUR0:WAV 1550NM' becomes
+    'SOUR*:WAV'. Latencies are binned in a histogram of log-spaced bins
+    (bins_per_decade) from 10 us to 100 s, plus underflow and overflow bins.
+    The transactions are recorded while the enabled attribute is True.
+
+    scpi : Boolean, Optional.
+        Flag if the commands are SCPI commands, otherwise they are templated
+        as TSP code. Default is True.
+    """
+
+    bins_per_decade = 4
+    t_min = 1e-5
+    n_bins = 7*bins_per_decade+2
+
+    def __init__(self, scpi=True):
+        self.scpi = scpi
+        self.enabled = True
+        self.templates = {}
+        self.reset()
+
+    def reset(self):
+        """Clear the recorded statistics."""
+        self.commands = {}
+        self.t_start = time.time()
+
+    def template(self, cmd):
+        """
+        Get the template of a command.
+
+        Parameters
+        ----------
+        cmd : string
+            Command sent to the instrument.
+
+        Returns
+        -------
+        template : string
+            Command template.
+
+        """
+        template = self.templates.get(cmd)
+        if template is None:
+            parts = []
+            if self.scpi:
+                for part in cmd.strip().split(';'):
+                    part = part.strip().split(' ')[0]
+                    parts.append(re.sub(r'\d+', '*', part))
+            else:
+                for part in cmd.strip().split(';'):
+                    part = re.sub(r'=\s*\S+', '=', part.strip())
+                    part = re.sub(r'smu[ab]', 'smu*', part)
+                    parts.append(re.sub(r'\d+(\.\d*)?([eE][-+]?\d+)?', '*', part))
+            template = ';'.join(parts)
+            if len(self.templates) > 4096:
+                self.templates.clear()
+            self.templates[cmd] = template
+        return template
+
+    def record(self, cmd, latency, bytes_out=0, bytes_in=0):
+        """
+        Record a bus transaction.
+
+        Parameters
+        ----------
+        cmd : string
+            Command sent to the instrument ('' for a read).
+        latency : float
+            Duration of the transaction (seconds).
+        bytes_out : int, optional
+            Bytes written. The default is 0.
+        bytes_in : int, optional
+            Bytes read. The default is 0.
+
+        Returns
+        -------
+        None.
+
+        """
+        if not self.enabled:
+            return
+        template = self.template(cmd) if cmd else '<read>'
+        entry = self.commands.get(template)
+        if entry is None:
+            entry = self.commands[template] = [0, 0, 0, 0., math.inf, 0., [0]*self.n_bins]
+        entry[0] += 1
+        entry[1] += bytes_out
+        entry[2] += bytes_in
+        entry[3] += latency
+        entry[4] = min(entry[4], latency)
+        entry[5] = max(entry[5], latency)
+        if latency < self.t_min:
+            idx = 0
+        else:
+            idx = min(int(math.log10(latency/self.t_min)*self.bins_per_decade)+1, self.n_bins-1)
+        entry[6][idx] += 1
+
+    def edges(self):
+        """Upper latency edge of each histogram bin (seconds)."""
+        return [self.t_min*10**(idx/self.bins_per_decade) for idx in range(self.n_bins-1)]+[math.inf]
+
+    def percentile(self, hist, q):
+        """Upper bin edge below which a fraction q of the transactions fall."""
+        target = q*sum(hist)
+        count = 0
+        for edge, n in zip(self.edges(), hist):
+            count += n
+            if count >= target:
+                return edge
+        return math.inf
+
+    def snapshot(self):
+        """
+        Get a snapshot of the recorded statistics.
+
+        Returns
+        -------
+        snapshot : dict
+            Statistics of each command template: count, bytes_out, bytes_in,
+            total, mean, min, max, p50, p90, p99 (seconds) and hist (counts
+            per bin, see edges()).
+
+        """
+        snapshot = {}
+        for template, entry in list(self.commands.items()):
+            count, bytes_out, bytes_in, total, t_min, t_max, hist = entry
+            snapshot[template] = {
+                'count': count,
+                'bytes_out': bytes_out,
+                'bytes_in': bytes_in,
+                'total': total,
+                'mean': total/count,
+                'min': t_min,
+                'max': t_max,
+                'p50': self.percentile(hist, 0.5),
+                'p90': self.percentile(hist, 0.9),
+                'p99': self.percentile(hist, 0.99),
+                'hist': list(hist),
+            }
+        return snapshot
+
+
+class batch_state(threading.local):
+    """
+    Batching state of a session, separate for each thread.
+
+    Commands written by a thread are only queued in the batches opened by
+    that thread, other threads keep writing directly.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.queue = []
+
+
+class session:
+    """
+    VISA session abstraction class.
+
+    A session wraps one VISA resource and is shared by every driver bound to
+    the same physical instrument (e.g. the slots of a lightwave mainframe).
+    Attributes that are not handled by the session (timeout, clear, ...) are
+    passed through to the underlying resource.
+
+    I/O on a session is serialized by its arbiter, so the session can be
+    used from several threads or from the asynchronous methods of the
+    drivers. Drivers access the session through a session_client handle.
+
+    Methods
+    -------
+    write
+    read
+    query
+    query_binary_values
+    read_block
+    identify
+    load_script
+    flush
+    run
+    """
+
+    def __init__(self, resource, scpi=True):
+        # attributes are set on the instance dictionary directly, anything
+        # else is forwarded to the wrapped resource by __setattr__
+        self.__dict__.update(
+            resource=resource,
+            scpi=scpi,
+            batching=batch_state(),
+            batch_max=32,
+            instruments=weakref.WeakSet(),
+            arbiter=arbiter(),
+            stats=io_stats(scpi),
+            async_locks=weakref.WeakKeyDictionary(),
+            idn={},
+            scripts=set(),
+        )
+        self.__dict__['opc'] = opc_engine(self)
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['resource'], name)
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+        else:
+            setattr(self.resource, name, value)
+
+    def join(self, cmds):
+        """
+        Join a list of commands into a single program message.
+
+        SCPI commands are joined with ';:' so that each command restarts at
+        the root of the command tree, TSP statements are joined with ';'.
+
+        Parameters
+        ----------
+        cmds : list of strings
+            Commands to join.
+
+        Returns
+        -------
+        msg : string
+            Program message.
+
+        """
+        if not self.scpi:
+            return '; '.join(cmds)
+        msg = cmds[0]
+        for cmd in cmds[1:]:
+            if cmd[0] in ':*':
+                msg += ';'+cmd
+            else:
+                msg += ';:'+cmd
+        return msg
+
+    def flush(self):
+        """Send the queued commands as one program message."""
+        with self.arbiter.request():
+            queue = self.batching.queue
+            if queue:
+                msg = self.join(queue)
+                self.batching.queue = []
+                t0 = time.perf_counter()
+                self.resource.write(msg)
+                self.stats.record(msg, time.perf_counter()-t0, len(msg))
+
+    def write(self, cmd):
+        """
+        Write a command, or queue it if the session is batching.
+
+        Parameters
+        ----------
+        cmd : string
+            Command to write.
+
+        Returns
+        -------
+        None.
+
+        """
+        if '*RST' in cmd or 'reset()' in cmd:
+            for instr in self.instruments:
+                if instr.shadow is not None:
+                    instr.shadow.invalidate()
+        with self.arbiter.request():
+            if self.batching.depth:
+                self.batching.queue.append(cmd)
+                if len(self.batching.queue) >= self.batch_max:
+                    self.flush()
+            else:
+                t0 = time.perf_counter()
+                self.resource.write(cmd)
+                self.stats.record(cmd, time.perf_counter()-t0, len(cmd))
+
+    def read(self, *args, **kwargs):
+        """Read a response, flushing the queued commands first."""
+        with self.arbiter.request():
+            self.flush()
+            t0 = time.perf_counter()
+            resp = self.resource.read(*args, **kwargs)
+            self.stats.record('', time.perf_counter()-t0, 0, len(resp))
+            return resp
+
+    def query(self, cmd, *args, **kwargs):
+        """Query the instrument, flushing the queued commands first."""
+        with self.arbiter.request():
+            self.flush()
+            t0 = time.perf_counter()
+            resp = self.resource.query(cmd, *args, **kwargs)
+            self.stats.record(cmd, time.perf_counter()-t0, len(cmd), len(resp))
+            return resp
+
+    def query_binary_values(self, cmd, *args, **kwargs):
+        """Query a binary block, flushing the queued commands first."""
+        with self.arbiter.request():
+            self.flush()
+            t0 = time.perf_counter()
+            resp = self.resource.query_binary_values(cmd, *args, **kwargs)
+            nbytes = len(resp)*struct.calcsize(kwargs.get('datatype', 'f'))
+            self.stats.record(cmd, time.perf_counter()-t0, len(cmd), nbytes)
+            return resp
+
+    def read_block(self, cmd, dtype='<f4', out=None, file=None, chunk_size=2**20,
+                   expect_termination=True, count=None):
+        """
+        Query an IEEE 488.2 binary block into a numpy array.
+
+        The block is read in chunks straight into the array, without going
+        through a list of values. The array is either given, allocated to
+        the length of the block or mapped to a file on disk.
+
+        Parameters
+        ----------
+        cmd : string
+            Query returning the block.
+        dtype : numpy dtype, optional
+            Type and byte order of the values. The default is '<f4'.
+        out : np.array, optional
+            Buffer to read into, of at least the length of the block. The
+            default is None.
+        file : string or file object, optional
+            File to stream the block to. The values are returned as a
+            np.memmap of the file. The default is None.
+        chunk_size : int, optional
+            Number of bytes read per transfer. The default is 1 MiB.
+        expect_termination : Boolean, optional
+            Flag if a termination character follows the block. The default is
+            True.
+        count : int, optional
+            Number of values of an indefinite length block ('#0', e.g. the
+            TSP printbuffer output). The default is None.
+
+        Returns
+        -------
+        np.array
+            Values of the block (view of out if given).
+
+        """
+        dtype = np.dtype(dtype)
+        with self.arbiter.request():
+            self.flush()
+            t0 = time.perf_counter()
+            res = self.resource
+            if not hasattr(res, 'read_bytes'):
+                # backend without raw reads, parse the block with pyvisa
+                values = res.query_binary_values(cmd, datatype=dtype.char,
+                                                 is_big_endian=dtype.byteorder == '>')
+                nbytes = len(values)*dtype.itemsize
+                if out is None and file is None:
+                    data = np.array(values, dtype=dtype)
+                else:
+                    data = self.block_buffer(len(values), dtype, out, file)
+                    data[:] = values
+            else:
+                res.write(cmd)
+                head = res.read_bytes(2)
+                if head[:1] != b'#':
+                    raise ValueError('Not a definite length binary block: '+repr(head))
+                ndigits = int(head[1:2])
+                if ndigits:
+                    nbytes = int(res.read_bytes(ndigits))
+                elif count is not None:
+                    nbytes = count*dtype.itemsize
+                else:
+                    raise ValueError('Indefinite length binary block of unknown count.')
+                data = self.block_buffer(nbytes//dtype.itemsize, dtype, out, file)
+                buf = data.view(np.uint8)
+                pos = 0
+                while pos < nbytes:
+                    chunk = res.read_bytes(min(chunk_size, nbytes-pos))
+                    buf[pos:pos+len(chunk)] = np.frombuffer(chunk, np.uint8)
+                    pos += len(chunk)
+                if expect_termination:
+                    res.read_bytes(1)
+            if isinstance(data, np.memmap):
+                data.flush()
+            self.stats.record(cmd, time.perf_counter()-t0, len(cmd), nbytes)
+            return data
+
+    def identify(self, cmd='*IDN?'):
+        """
+        Query an identification string, cached for the life of the session.
+
+        Parameters
+        ----------
+        cmd : string, optional
+            Identification query, e.g. 'SLOT1:IDN?' for a mainframe module.
+            The default is '*IDN?'.
+
+        Returns
+        -------
+        idn : string
+            Identification string.
+
+        """
+        idn = self.idn.get(cmd)
+        if idn is None:
+            idn = self.query(cmd).strip()
+            self.idn[cmd] = idn
+        return idn
+
+    def load_script(self, script):
+        """
+        Load a TSP script on the instrument, once per session.
+
+        The script is uploaded unless the instrument already holds a script
+        of the same name (same source), then run to define its functions.
+
+        Parameters
+        ----------
+        script : tsp_script
+            Script to load.
+
+        Returns
+        -------
+        uploaded : Boolean
+            Flag if the script was uploaded.
+
+        """
+        if script.name in self.scripts:
+            return False
+        with self.arbiter.request():
+            self.flush()
+            uploaded = self.query('print('+script.name+' ~= nil)').strip() != 'true'
+            if uploaded:
+                # the lines of the script are separate messages, never batched
+                lines = script.lines()
+                t0 = time.perf_counter()
+                for line in lines:
+                    self.resource.write(line)
+                self.stats.record(lines[0], time.perf_counter()-t0, sum(len(line) for line in lines))
+            self.write(script.name+'()')
+            self.scripts.add(script.name)
+            return uploaded
+
+    @staticmethod
+    def block_buffer(num, dtype, out=None, file=None):
+        """Get the array to read a block of num values into."""
+        if file is not None:
+            return np.memmap(file, dtype=dtype, mode='w+', shape=(num,))
+        if out is None:
+            return np.empty(num, dtype=dtype)
+        if out.dtype != dtype or out.size < num or not out.flags.c_contiguous:
+            raise ValueError('Buffer must be a contiguous array of dtype ' +
+                             str(dtype)+' and size '+str(num)+' or more.')
+        return out.reshape(-1)[:num]
+
+    async def run(self, func, *args, lock=True):
+        """
+        Run a blocking function on the I/O thread pool.
+
+        Parameters
+        ----------
+        func : function
+            Blocking function to run, e.g. a driver method.
+        *args : ANY TYPE
+            Arguments of the function.
+        lock : Boolean, optional
+            Hold the session asyncio lock while running, so coroutines using
+            the same resource are queued in the event loop rather than in the
+            thread pool. The default is True.
+
+        Returns
+        -------
+        ANY TYPE
+            Return value of the function.
+
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args)
+        if not lock:
+            return await loop.run_in_executor(get_executor(), call)
+        if loop not in self.async_locks:
+            self.async_locks[loop] = asyncio.Lock()
+        async with self.async_locks[loop]:
+            return await loop.run_in_executor(get_executor(), call)
+
+    @contextmanager
+    def batch(self):
+        """
+        Queue all the writes to the session and send them together on exit.
+
+        Queued commands are also sent before any read or query, and whenever
+        batch_max commands are pending. Batches can be nested, the queue is
+        flushed when the outermost batch exits. Batches are opened per
+        thread, writes from other threads are not queued.
+        """
+        self.batching.depth += 1
+        try:
+            yield self
+        finally:
+            self.batching.depth -= 1
+            if not self.batching.depth:
+                self.flush()
+
+
+class session_client:
+    """
+    Handle of a driver on a shared VISA session.
+
+    I/O through the handle is requested from the session arbiter on behalf
+    of the driver, with the driver priority. Other attributes are passed
+    through to the session (and the resource).
+    """
+
+    def __init__(self, sess, owner):
+        self.__dict__.update(session=sess, owner=owner)
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['session'], name)
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+        else:
+            setattr(self.session, name, value)
+
+    def transaction(self):
+        """Hold the session on behalf of the driver (see arbiter.request)."""
+        return self.session.arbiter.request(self.owner, self.owner.priority)
+
+    def write(self, *args, **kwargs):
+        """Write to the session on behalf of the driver."""
+        with self.transaction():
+            return self.session.write(*args, **kwargs)
+
+    def read(self, *args, **kwargs):
+        """Read from the session on behalf of the driver."""
+        with self.transaction():
+            return self.session.read(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        """Query the session on behalf of the driver."""
+        with self.transaction():
+            return self.session.query(*args, **kwargs)
+
+    def query_binary_values(self, *args, **kwargs):
+        """Query a binary block from the session on behalf of the driver."""
+        with self.transaction():
+            return self.session.query_binary_values(*args, **kwargs)
+
+    def read_block(self, *args, **kwargs):
+        """Read a binary block from the session on behalf of the driver."""
+        with self.transaction():
+            return self.session.read_block(*args, **kwargs)
+
+    def identify(self, *args, **kwargs):
+        """Identify the instrument on behalf of the driver (cached)."""
+        with self.transaction():
+            return self.session.identify(*args, **kwargs)
+
+    def load_script(self, *args, **kwargs):
+        """Load a TSP script on behalf of the driver (once per session)."""
+        with self.transaction():
+            return self.session.load_script(*args, **kwargs)
+
+
+_sessions = weakref.WeakValueDictionary()
+_executor = None
+
+
+def get_executor(max_workers=None):
+    """
+    Get the thread pool running the asynchronous instrument I/O.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Number of threads, used when the pool is created. The default is
+        None (concurrent.futures default).
+
+    Returns
+    -------
+    ThreadPoolExecutor
+        I/O thread pool.
+
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers, thread_name_prefix='siepiclab_io')
+    return _executor
+
+
+def open_session(addr, scpi=True):
+    """
+    Get the session of a VISA resource, creating it if needed.
+
+    Resources are identified by their VISA resource name, so drivers opened
+    on the same instrument share a session. A resource reopened under the
+    same name (e.g. after closing the previous one) gets a new session.
+
+    Parameters
+    ----------
+    addr : pyvisa resource or session
+        Resource to get the session of.
+    scpi : Boolean, optional
+        Flag if the instrument uses the SCPI language. The default is True.
+
+    Returns
+    -------
+    session
+        Session of the resource.
+
+    """
+    if isinstance(addr, session_client):
+        return addr.session
+    if isinstance(addr, session):
+        return addr
+    key = getattr(addr, 'resource_name', None) or id(addr)
+    sess = _sessions.get(key)
+    if sess is None or sess.resource is not addr:
+        sess = session(addr, scpi)
+        _sessions[key] = sess
+    return sess
+
+
+def snapshot_stats():
+    """
+    Get a snapshot of the I/O statistics of all the open sessions.
+
+    Returns
+    -------
+    snapshot : dict
+        Statistics snapshot (see io_stats.snapshot) of each session, keyed by
+        resource name.
+
+    """
+    return {str(key): sess.stats.snapshot() for key, sess in list(_sessions.items())}
+
+
+def reset_stats():
+    """Clear the I/O statistics of all the open sessions."""
+    for sess in list(_sessions.values()):
+        sess.stats.reset()
+
+
+def export_stats(file_name, snapshot=None):
+    """
+    Export I/O statistics to a JSON (.json) or CSV (.csv) file.
+
+    Parameters
+    ----------
+    file_name : string
+        File name and directory of the file to save, the format is set by
+        the extension.
+    snapshot : dict, optional
+        Statistics to export, as returned by snapshot_stats(). The default is
+        None, which exports the statistics of all the open sessions.
+
+    Returns
+    -------
+    None.
+
+    """
+    if snapshot is None:
+        snapshot = snapshot_stats()
+    if str(file_name).lower().endswith('.csv'):
+        fields = ['count', 'bytes_out', 'bytes_in', 'total', 'mean', 'min', 'max', 'p50', 'p90', 'p99']
+        with open(file_name, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['resource', 'template']+fields)
+            for resource, commands in snapshot.items():
+                for template, entry in commands.items():
+                    writer.writerow([resource, template]+[entry[k] for k in fields])
+    else:
+        with open(file_name, 'w') as f:
+            json.dump(snapshot, f, indent=1)
+
+
+def wait_predicted(done, duration, lead=0.1, poll_min=1e-3, poll_max=0.1, backoff=2, timeout=None):
+    """
+    Wait for an operation of a predicted duration to complete.
+
+    Sleeps until shortly before the predicted end of the operation, then
+    polls its completion with exponential backoff, like opc_engine.poll.
+
+    Parameters
+    ----------
+    done : function
+        Returns True once the operation is complete.
+    duration : float
+        Predicted duration of the operation from now (seconds).
+    lead : float, optional
+        Time before the predicted end to start polling (seconds). The default
+        is 0.1.
+    poll_min : float, optional
+        First polling interval (seconds). The default is 1 ms.
+    poll_max : float, optional
+        Maximum polling interval (seconds). The default is 100 ms.
+    backoff : float, optional
+        Growth factor of the polling interval. The default is 2.
+    timeout : float, optional
+        Deadline of the wait from now (seconds). The default is None (no
+        deadline).
+
+    Returns
+    -------
+    report : dict
+        Number of 'polls', time 'elapsed' waiting and 'predicted' duration
+        (seconds).
+
+    """
+    t0 = time.monotonic()
+    if duration > lead:
+        time.sleep(duration-lead)
+    delay = poll_min
+    polls = 0
+    while True:
+        polls += 1
+        if done():
+            return {'polls': polls, 'elapsed': time.monotonic()-t0, 'predicted': duration}
+        if timeout is not None and time.monotonic()+delay > t0+timeout:
+            raise TimeoutError('Operation did not complete in '+str(timeout) +
+                               ' s (predicted '+str(duration)+' s), after '+str(polls)+' polls.')
+        time.sleep(delay)
+        delay = min(delay*backoff, poll_max)
+
+
+class stream:
+    """
+    Live acquisition of samples into a bounded ring buffer.
+
+    Samples are rows of columns (e.g. time and value). The ring buffer keeps
+    the latest samples, so memory stays flat for acquisitions of any length,
+    and every sample is appended to an on-disk log as raw little endian
+    float64 rows (see read_log). The acquisition runs in the I/O thread
+    pool until stopped.
+
+    size : int, Optional.
+        Number of samples in the ring buffer. Default is 100000.
+    columns : int, Optional.
+        Number of columns of a sample. Default is 2.
+    file : string, Optional.
+        File to append the samples to. Default is None (no log).
+
+    Methods
+    -------
+    push
+    latest
+    start
+    wait
+    stop
+    """
+
+    def __init__(self, size=100000, columns=2, file=None):
+        self.buffer = np.zeros((size, columns))
+        self.count = 0
+        self.lock = threading.Lock()
+        self.file = None if file is None else open(file, 'ab')
+        self.stopped = threading.Event()
+        self.future = None
+
+    def push(self, samples):
+        """
+        Add samples to the ring buffer and the log.
+
+        Parameters
+        ----------
+        samples : np.array
+            Samples, one row per sample.
+
+        Returns
+        -------
+        None.
+
+        """
+        samples = np.asarray(samples, dtype='<f8').reshape(-1, self.buffer.shape[1])
+        if self.file is not None:
+            samples.tofile(self.file)
+            self.file.flush()
+        size = self.buffer.shape[0]
+        samples = samples[-size:]
+        with self.lock:
+            idx = (self.count+np.arange(len(samples))) % size
+            self.buffer[idx] = samples
+            self.count += len(samples)
+
+    def latest(self, num=None):
+        """
+        Get the latest samples, oldest first.
+
+        Parameters
+        ----------
+        num : int, optional
+            Number of samples. The default is None (all the buffered samples).
+
+        Returns
+        -------
+        np.array
+            Copy of the samples, one row per sample.
+
+        """
+        size = self.buffer.shape[0]
+        with self.lock:
+            num = min(self.count, size) if num is None else min(num, self.count, size)
+            idx = (self.count-num+np.arange(num)) % size
+            return self.buffer[idx]
+
+    def start(self, acquire):
+        """
+        Start the acquisition.
+
+        Parameters
+        ----------
+        acquire : function
+            Acquires and returns the next samples, called in a loop until the
+            stream is stopped. Returning None stops the stream.
+
+        Returns
+        -------
+        stream
+            The stream itself.
+
+        """
+        def run():
+            try:
+                while not self.stopped.is_set():
+                    samples = acquire()
+                    if samples is None:
+                        break
+                    self.push(samples)
+            finally:
+                self.stopped.set()
+                if self.file is not None:
+                    self.file.close()
+
+        self.future = get_executor().submit(run)
+        return self
+
+    def running(self):
+        """Flag if the acquisition is running."""
+        return self.future is not None and not self.future.done()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the acquisition to end, e.g. after its duration.
+
+        Errors of the acquisition are raised here.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Time to wait for the acquisition to end (seconds). The default
+            is None (no limit).
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.future is not None:
+            self.future.result(timeout)
+
+    def stop(self, timeout=None):
+        """
+        Stop the acquisition once the current acquisition is complete.
+
+        Errors of the acquisition are raised here.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Time to wait for the acquisition to stop (seconds). The default
+            is None (no limit).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.stopped.set()
+        if self.future is not None:
+            self.future.result(timeout)
+        elif self.file is not None:
+            self.file.close()
+
+    @staticmethod
+    def read_log(file_name, columns=2):
+        """
+        Read the samples of a stream log.
+
+        Parameters
+        ----------
+        file_name : string
+            File name and directory of the log.
+        columns : int, optional
+            Number of columns of a sample. The default is 2.
+
+        Returns
+        -------
+        np.array
+            Samples, one row per sample.
+
+        """
+        return np.fromfile(file_name, dtype='<f8').reshape(-1, columns)
 
 
 class instr_VISA(instr):
@@ -60,30 +1600,366 @@ class instr_VISA(instr):
     wait
     query
     write
+    fields
+    get_param
+    get_params
+    set_param
+    GetState
+    SetState
+    batch
+    flush
+    enable_shadow
+    disable_shadow
+    invalidate_shadow
+    transaction
+    async_query
+    async_write
+    async_read
+    async_wait
+    async_call
     """
 
+    scpi = True
+    # declared parameters of the driver, see instruments.parameter
+    params = []
+    param_index = {}
+    shadow_params = []
+    # parameters restored by SetState, in a dependency safe order:
+    # (state key or tuple of keys, setter name, setter arguments after the value)
+    state_params = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'params' in cls.__dict__:
+            for param in cls.params:
+                param.wrap(cls)
+            if 'state_params' not in cls.__dict__:
+                cls.state_params = [(param.state, 'Set'+param.name) for param in cls.params
+                                    if param.write is not None and param.state is not None]
+        cls.param_index = {param.name: param for param in cls.params}
+        for param in cls.shadow_params:
+            param.wrap(cls)
+
     def __init__(self, addr, chan=None):
         super(instr_VISA, self).__init__()
-        self.addr = addr
+        self.priority = 0
+        self.addr = session_client(open_session(addr, self.scpi), self)
+        self.addr.instruments.add(self)
         self.chan = chan
+        self.shadow = None
+
+    def transaction(self):
+        """
+        Hold the instrument session for several I/O operations.
+
+        Other drivers sharing the session (e.g. other slots of the mainframe)
+        are kept waiting until the transaction ends, so that a write and the
+        following read are not interleaved with their I/O. Requests waiting
+        for the session are served by priority (lower self.priority first).
+
+        Example
+        ----------
+            with pm.transaction():
+                pm.addr.write('SENS1:CHAN1:FUNC:RES?')
+                data = pm.addr.read_raw()
+
+        Returns
+        -------
+        Context manager.
+
+        """
+        return self.addr.transaction()
+
+    def enable_shadow(self, max_age=None):
+        """
+        Enable the shadow register of the instrument.
+
+        Values written by the shadowed setters of the driver are recorded and
+        returned by the getters without querying the instrument, until they
+        are invalidated by a reset, max_age or invalidate_shadow().
+
+        Parameters
+        ----------
+        max_age : float, optional
+            Time after which a recorded value is queried again (seconds).
+            The default is None (never).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.shadow = shadow(max_age)
+
+    def disable_shadow(self):
+        """Disable the shadow register of the instrument."""
+        self.shadow = None
+
+    def invalidate_shadow(self, name=None):
+        """
+        Invalidate the shadow register of the instrument.
+
+        Parameters
+        ----------
+        name : string, optional
+            Getter name of the parameter to invalidate. The default is None (all).
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.shadow is not None:
+            self.shadow.invalidate(name)
+
+    def fields(self):
+        """
+        Template fields of the declared parameters of the driver.
+
+        Returns
+        -------
+        dict
+            Fields substituted in the parameter templates.
+
+        """
+        return {'chan': self.chan}
+
+    def get_param(self, name):
+        """
+        Query a declared parameter.
+
+        Parameters
+        ----------
+        name : string
+            Name of the parameter.
+
+        Returns
+        -------
+        ANY TYPE
+            Value of the parameter.
+
+        """
+        param = self.param_index[name]
+        return param.parse(self.addr.query(param.query_cmd(self.fields())).strip())
+
+    def get_params(self, names=None):
+        """
+        Query several declared parameters with compound queries.
+
+        SCPI queries are joined in one message per session batch_max
+        parameters (e.g. 'SOUR0:POW?;:SOUR0:WAV?'), rather than a round-trip
+        per parameter. Parameters recorded in the shadow register are not
+        queried.
+
+        Parameters
+        ----------
+        names : list of strings, optional
+            Names of the parameters. The default is None (all parameters).
+
+        Returns
+        -------
+        values : dict
+            Values of the parameters, by name.
+
+        """
+        if names is None:
+            names = list(self.param_index)
+        values = {}
+        missing = []
+        for name in names:
+            hit = False
+            if self.shadow is not None:
+                hit, value = self.shadow.lookup(('Get'+name,))
+            if hit:
+                values[name] = value
+            else:
+                missing.append(name)
+
+        fields = self.fields()
+        size = self.addr.batch_max if self.scpi else 1
+        for idx in range(0, len(missing), size):
+            group = missing[idx:idx+size]
+            cmds = [self.param_index[name].query_cmd(fields) for name in group]
+            replies = self.addr.query(self.addr.join(cmds)).strip().split(';')
+            if len(replies) != len(group):
+                raise ValueError('Compound query returned '+str(len(replies)) +
+                                 ' values for '+str(len(group))+' parameters.')
+            for name, reply in zip(group, replies):
+                values[name] = self.param_index[name].parse(reply.strip())
+
+        if self.shadow is not None:
+            readthrough = {p.getter for p in self.shadow_params if p.readthrough}
+            for name in missing:
+                if 'Get'+name in readthrough:
+                    self.shadow.record(('Get'+name,), values[name])
+        return {name: values[name] for name in names}
+
+    def set_param(self, name, *values, verbose=False, wait=False):
+        """
+        Write a declared parameter.
+
+        Parameters
+        ----------
+        name : string
+            Name of the parameter.
+        *values : ANY TYPE
+            Value(s) of the parameter.
+        verbose : Boolean, optional
+            Return the instrument reading after the operation.
+            The default is False.
+        wait : Boolean, optional
+            Block program until the query is done. The default is False.
+
+        Returns
+        -------
+        None unless verbose is True.
+
+        """
+        param = self.param_index[name]
+        try:
+            cmd = param.write_cmd(self.fields(), *values)
+        except ValueError as e:
+            print('ERR: '+str(e))
+            return
+        self.addr.write(cmd)
+        if wait or verbose:
+            self.wait()
+        if verbose:
+            return getattr(self, 'Get'+name)()
+
+    def GetState(self):
+        """Return an instance of the instrument."""
+        currState = state()
+        params = [p for p in self.params if p.state is not None]
+        values = self.get_params([p.name for p in params])
+        for param in params:
+            if isinstance(param.state, tuple):
+                for key, value in zip(param.state, values[param.name]):
+                    currState.AddState(key, value)
+            else:
+                currState.AddState(param.state, values[param.name])
+        return currState
+
+    def SetState(self, state, current=None, verify=True):
+        """
+        Set the state of the instrument to a given state.
+
+        Only the parameters of state_params that differ from the current
+        state are written, in the order of state_params, in a single batch.
+        The written parameters are then read back once and compared.
+
+        Parameters
+        ----------
+        state : SiEPIC Lab instruments type
+            State of the instrument (dict or instruments.state).
+        current : SiEPIC Lab instruments type, optional
+            Current state of the instrument. The default is None, which gets
+            the state (answered by the shadow register if enabled).
+        verify : Boolean, optional
+            Read back and compare the written parameters. The default is True.
+
+        Returns
+        -------
+        mismatch : dict
+            Parameters that differ from the given state after the operation,
+            as (expected, actual) tuples.
+
+        """
+        state = getattr(state, 'state', state)
+        if current is None:
+            current = self.GetState()
+        current = getattr(current, 'state', current)
+
+        changed = []
+        for keys, setter, *args in self.state_params:
+            keys = (keys,) if isinstance(keys, str) else keys
+            if any(k not in state for k in keys):
+                continue
+            if all(k in current and same_value(state[k], current[k]) for k in keys):
+                continue
+            changed.append((keys, setter, args))
+        if not changed:
+            return {}
+
+        with self.batch():
+            for keys, setter, args in changed:
+                getattr(self, setter)(*[state[k] for k in keys], *args)
+        if not verify:
+            return {}
+
+        self.wait()
+        # read back from the instrument, not from the shadow register
+        reg, self.shadow = self.shadow, None
+        try:
+            actual = self.GetState().state
+        finally:
+            self.shadow = reg
+        mismatch = {}
+        for keys, setter, args in changed:
+            for k in keys:
+                if not same_value(state[k], actual.get(k)):
+                    mismatch[k] = (state[k], actual.get(k))
+        if mismatch:
+            self.invalidate_shadow()
+            print('ERR: Parameters not restored: '+str(mismatch))
+        return mismatch
+
+    def batch(self):
+        """
+        Batch the writes to the instrument session.
+
+        Example
+        ----------
+            with tls.batch():
+                tls.SetWavl(1550)
+                tls.SetPwr(1)
+            >> Both commands are sent in a single bus transaction.
+
+        Returns
+        -------
+        Context manager.
+
+        """
+        return self.addr.batch()
+
+    def flush(self):
+        """Send the writes queued in the instrument session."""
+        self.addr.flush()
 
     def identify(self):
         """
         Identify the instrument.
 
+        The identifier is queried once per session.
+
         Returns
         -------
         idn : String
             Instrument VISA identifier.
 
         """
-        idn = self.addr.query('*IDN?').strip()
+        idn = self.addr.identify('*IDN?')
         return idn
 
-    def wait(self):
-        """Blocks the program until the instrument is done with instruction."""
-        while self.addr.query('*OPC?').find('1') == -1:
-            pass
+    def wait(self, timeout=None):
+        """
+        Blocks the program until the instrument is done with instruction.
+
+        Uses the operation complete engine of the instrument session, see
+        instruments.opc_engine for the waiting strategies.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Deadline of the wait (seconds). The default is None (engine setting).
+
+        Returns
+        -------
+        report : dict
+            'method' used, number of 'polls' and time 'elapsed' waiting (seconds).
+
+        """
+        return self.addr.opc.wait(timeout)
 
     def read(self):
         """
@@ -136,3 +2012,99 @@ class instr_VISA(instr):
             self.addr.write(cmd1+self.chan+cmd2)
         else:
             self.addr.write(cmd1+cmd2)
+
+    async def async_query(self, cmd1, cmd2=''):
+        """
+        Ask the instrument and wait for a response, without blocking the event loop.
+
+        Example
+        ----------
+            async def main():
+                return await asyncio.gather(tls.async_query('SOUR', ':WAV?'),
+                                            smu.async_call(smu.GetCurrent, 'A'))
+            wavl, curr = asyncio.run(main())
+            >> Both instruments are queried at the same time.
+
+        Parameters
+        ----------
+        cmd1 : string
+            First command.
+        cmd2 : string, optional
+            second command. The default is ''.
+
+        Returns
+        -------
+        String
+            Response from the instrument.
+
+        """
+        return await self.addr.run(self.query, cmd1, cmd2)
+
+    async def async_write(self, cmd1, cmd2=''):
+        """
+        Write a command to the instrument, without blocking the event loop.
+
+        Parameters
+        ----------
+        cmd1 : string
+            First command.
+        cmd2 : string, optional
+            second command. The default is ''.
+
+        Returns
+        -------
+        None.
+
+        """
+        return await self.addr.run(self.write, cmd1, cmd2)
+
+    async def async_read(self):
+        """
+        Read a command in the buffer, without blocking the event loop.
+
+        Returns
+        -------
+        String
+            Response from the instrument.
+
+        """
+        return await self.addr.run(self.read)
+
+    async def async_wait(self, timeout=None):
+        """
+        Wait until the instrument is done with instruction, without blocking the event loop.
+
+        The session is not locked while waiting, so other coroutines can keep
+        using the resource.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Deadline of the wait (seconds). The default is None (engine setting).
+
+        Returns
+        -------
+        report : dict
+            'method' used, number of 'polls' and time 'elapsed' waiting (seconds).
+
+        """
+        return await self.addr.run(self.wait, timeout, lock=False)
+
+    async def async_call(self, method, *args):
+        """
+        Call a blocking driver method, without blocking the event loop.
+
+        Parameters
+        ----------
+        method : function
+            Method of the driver, e.g. tls.GetWavl.
+        *args : ANY TYPE
+            Arguments of the method.
+
+        Returns
+        -------
+        ANY TYPE
+            Return value of the method.
+
+        """
+        return await self.addr.run(method, *args)
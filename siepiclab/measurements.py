@@ -5,7 +5,10 @@ SiEPIClab measurements module.
 Mustafa Hammood, SiEPIC Kits, 2022
 """
 import pickle
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
+import numpy as np
+from siepiclab.instruments import get_executor
 
 
 class routine:
@@ -28,40 +31,125 @@ class lab_setup:
         self.settings = self.GetSettings()
         self.verbose = verbose
 
-    def GetSettings(self, verbose=False):
+    def run(self, method, parallel=True, args=None):
+        """
+        Call a method of all the instruments in the experiment setup.
+
+        Instruments on separate VISA resources are handled concurrently,
+        instruments sharing a resource are handled in turn by the same
+        thread.
+
+        Parameters
+        ----------
+        method : string
+            Name of the method to call.
+        parallel : Boolean, optional
+            Flag to run the calls concurrently. The default is True.
+        args : list of tuples, optional
+            Arguments of the call, per instrument. The default is None (no
+            arguments).
+
+        Returns
+        -------
+        list
+            Return values of the calls, in the order of the instruments.
+
+        """
+        groups = {}
+        for idx, instr in enumerate(self.instruments):
+            addr = getattr(instr, 'addr', None)
+            key = id(getattr(addr, 'session', instr))
+            groups.setdefault(key, []).append(idx)
+
+        values = [None]*len(self.instruments)
+
+        def call(group):
+            for idx in group:
+                values[idx] = getattr(self.instruments[idx], method)(*(args[idx] if args else ()))
+
+        if not parallel or len(groups) < 2:
+            for group in groups.values():
+                call(group)
+        else:
+            for future in [get_executor().submit(call, group) for group in groups.values()]:
+                future.result()
+        return values
+
+    def identify(self, parallel=True):
+        """
+        Identify all the instruments in the experiment setup.
+
+        Returns
+        -------
+        idns : list
+            list of instrument identifiers.
+
+        """
+        return self.run('identify', parallel)
+
+    def GetSettings(self, verbose=False, parallel=True):
         """
         Get the settings of all the instruments in the experiment setup.
 
+        Parameters
+        ----------
+        verbose : Boolean, optional
+            Print the states. The default is False.
+        parallel : Boolean, optional
+            Capture the states of instruments on separate VISA resources
+            concurrently. The default is True.
+
         Returns
         -------
         settings : list
             list of instrument states.
 
         """
-        settings = []
-        for idx, instr in enumerate(self.instruments):
-            settings.append(instr.GetState())
-            if verbose:
+        settings = self.run('GetState', parallel)
+        if verbose:
+            for instr, state in zip(self.instruments, settings):
                 print('State of: ' + instr.identify())
-                print(str(instr.GetState().state)+'\n')
+                print(str(state.state)+'\n')
         return settings
 
-    def SetSettings(self, settings):
+    @contextmanager
+    def batch(self):
+        """
+        Batch the writes to all the instruments in the experiment setup.
+
+        Instruments sharing a VISA resource share the same queue, so their
+        commands are sent together as one message.
+        """
+        with ExitStack() as stack:
+            for instr in self.instruments:
+                stack.enter_context(instr.batch())
+            yield self
+
+    def SetSettings(self, settings=None, parallel=True):
         """
         Set the settings of all the instruments in the experiment setup.
 
+        Each instrument only writes the parameters that differ from its
+        current state, see instruments.instr_VISA.SetState.
+
         Parameters
         ----------
-        settings : list
-            list of instrument states.
+        settings : list, optional
+            list of instrument states. The default is None, which restores
+            the settings captured when the setup was created.
+        parallel : Boolean, optional
+            Restore instruments on separate VISA resources concurrently.
+            The default is True.
 
         Returns
         -------
-        None
+        mismatch : list
+            Parameters of each instrument that could not be restored.
 
         """
-        for idx, inst in enumerate(self.instruments):
-            inst.SetState(self.settings[idx].state)
+        if settings is None:
+            settings = self.settings
+        return self.run('SetState', parallel, [(s,) for s in settings])
 
 
 class results:
@@ -181,6 +269,61 @@ class results:
             return pickle.load(f)
 
 
+class running_stats:
+    """
+    Running mean and variance of repeated measurements.
+
+    Measurements are folded in one at a time (Welford's algorithm), so only
+    the mean and the sum of squared deviations are kept in memory.
+
+    Example
+    ----------
+        stats = siepiclab.measurements.running_stats()
+        for cycle in range(8):
+            stats.add(measure())
+        mean, std = stats.mean, stats.std()
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def add(self, data):
+        """
+        Fold a measurement into the statistics.
+
+        Parameters
+        ----------
+        data : np.array
+            Measurement, of the same shape for every call.
+
+        Returns
+        -------
+        None.
+
+        """
+        data = np.asarray(data, dtype=float)
+        self.count += 1
+        if self.mean is None:
+            self.mean = data.copy()
+            self.m2 = np.zeros_like(self.mean)
+            return
+        delta = data-self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(data-self.mean)
+
+    def var(self):
+        """Sample variance of the measurements (zero for a single measurement)."""
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return self.m2/(self.count-1)
+
+    def std(self):
+        """Sample standard deviation of the measurements."""
+        return np.sqrt(self.var())
+
+
 class sequence:
     """Operations sequence abstraction class."""
 
@@ -198,10 +341,10 @@ class sequence:
         settings = self.experiment.GetSettings(self.verbose)
 
         # add the instrument state to the results file
-        self.results.add('instruments', [instr.identify() for instr in self.instruments])
+        idns = self.experiment.identify()
+        self.results.add('instruments', idns)
         for idx, state in enumerate(settings):
-            self.results.data['state_'+self.instruments[idx].identify()
-                              ] = str(state.GetState())
+            self.results.data['state_'+idns[idx]] = str(state.GetState())
 
         self.instructions()
 
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+SiEPIClab replay module.
+
+Record the I/O of VISA resources during a measurement and play it back
+without the instruments, e.g. to benchmark a new version of the drivers
+against a run captured in the lab:
+
+    rec = replay.recording()
+    mainframe = rec.wrap(rm.open_resource('GPIB0::20::INSTR'))
+    ... run the sequence on mainframe ...
+    rec.save('sweep.rec.gz')
+
+    rec = replay.recording.load('sweep.rec.gz')
+    mainframe = rec.open_resource('GPIB0::20::INSTR', time_scale=0.1)
+    ... run the same sequence on mainframe ...
+
+Mustafa Hammood, SiEPIC Kits, 2022
+"""
+import base64
+import builtins
+import gzip
+import json
+import struct
+import time
+
+VERSION = 1
+
+
+class replayed_error(Exception):
+    """
+    Error of a recorded operation that is not a builtin exception, replayed.
+
+    error : string
+        Name of the type of the recorded exception.
+    error_code : int or None
+        VISA status code of the recorded exception, if it had one.
+    """
+
+    def __init__(self, msg, error, error_code=None):
+        super(replayed_error, self).__init__(msg)
+        self.error = error
+        self.error_code = error_code
+
+
+class recorder:
+    """
+    Recording VISA resource wrapper.
+
+    Passes every operation through to the wrapped resource and appends it
+    with its response and timing to the events of the recording. Operations
+    that raise are recorded with their exception. Attributes that are not
+    I/O operations (timeout, ...) are passed through.
+    """
+
+    def __init__(self, resource, rec, name):
+        # attributes are set on the instance dictionary directly, anything
+        # else is forwarded to the wrapped resource by __setattr__. The
+        # resource name is made unique so that drivers do not share a session
+        # with drivers opened on the unwrapped resource.
+        self.__dict__.update(resource=resource, rec=rec,
+                             resource_name='REC'+str(rec.number)+'::'+name,
+                             events=rec.resources.setdefault(name, []))
+
+    def __getattr__(self, name):
+        if name == 'wait_for_srq':
+            wait_for_srq = self.resource.wait_for_srq  # AttributeError if unsupported
+            return lambda timeout=None: self.call('srq', timeout, wait_for_srq, timeout)
+        return getattr(self.__dict__['resource'], name)
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+        else:
+            setattr(self.resource, name, value)
+
+    def call(self, op, msg, func, *args, **kwargs):
+        """
+        Perform an operation on the resource and record it.
+
+        Parameters
+        ----------
+        op : string
+            Operation name.
+        msg : string, int or None
+            Message (or argument) of the operation.
+        func : function
+            Operation of the resource.
+        *args, **kwargs :
+            Arguments of the operation.
+
+        Returns
+        -------
+        Response of the operation.
+
+        """
+        t0 = time.perf_counter()
+        try:
+            resp = func(*args, **kwargs)
+        except Exception as err:
+            t1 = time.perf_counter()
+            event = {'op': op, 'msg': msg, 't': round(t0-self.rec.t0, 6), 'latency': round(t1-t0, 6),
+                     'error': type(err).__name__, 'error_msg': str(err)}
+            if getattr(err, 'error_code', None) is not None:
+                event['error_code'] = int(err.error_code)
+            self.events.append(event)
+            raise
+        t1 = time.perf_counter()
+        event = {'op': op, 'msg': msg, 't': round(t0-self.rec.t0, 6), 'latency': round(t1-t0, 6)}
+        if isinstance(resp, (bytes, bytearray)):
+            event['raw'] = base64.b64encode(bytes(resp)).decode('ascii')
+        elif resp is not None:
+            event['resp'] = resp
+        self.events.append(event)
+        return resp
+
+    def write(self, msg):
+        """Write a message to the resource."""
+        return self.call('write', msg, self.resource.write, msg)
+
+    def read(self):
+        """Read a response from the resource."""
+        return self.call('read', None, self.resource.read)
+
+    def query(self, msg):
+        """Query the resource."""
+        return self.call('query', msg, self.resource.query, msg)
+
+    def read_raw(self, size=None):
+        """Read a raw response from the resource."""
+        return self.call('read_raw', size, self.resource.read_raw, size)
+
+    def read_bytes(self, count, *args, **kwargs):
+        """Read a number of bytes from the resource."""
+        return self.call('read_bytes', count, self.resource.read_bytes, count, *args, **kwargs)
+
+    def query_binary_values(self, msg, datatype='f', is_big_endian=False, container=list, **kwargs):
+        """
+        Query binary values from the resource.
+
+        The values are recorded packed with their datatype, the container is
+        applied on replay.
+        """
+        values = self.call('binary', msg, self.resource.query_binary_values, msg,
+                           datatype=datatype, is_big_endian=is_big_endian, container=list,
+                           **kwargs)
+        event = self.events[-1]
+        order = '>' if is_big_endian else '<'
+        del event['resp']
+        event['datatype'] = datatype
+        event['is_big_endian'] = is_big_endian
+        event['raw'] = base64.b64encode(
+            struct.pack(order+str(len(values))+datatype, *values)).decode('ascii')
+        return container(values)
+
+    def clear(self):
+        """Clear the resource."""
+        return self.call('clear', None, self.resource.clear)
+
+
+class player:
+    """
+    Replaying VISA resource.
+
+    Answers the operations from the recorded events of a resource, in order.
+    An operation that differs from the recording raises a ValueError, so a
+    replay is only valid if the code issues the same I/O as the recorded run.
+    Operations that raised when recorded raise again: builtin exceptions
+    with their type, others as a replayed_error.
+
+    time_scale : float, Optional.
+        Scale of the recorded latencies, 1 replays with the original latency,
+        0 replays as fast as possible. Default is 1.
+    """
+
+    def __init__(self, events, resource_name, time_scale=1.):
+        self.events = events
+        self.resource_name = resource_name
+        self.time_scale = time_scale
+        self.timeout = 2000
+        self.position = 0
+
+    def __getattr__(self, name):
+        if name == 'wait_for_srq' and any(e['op'] == 'srq' for e in self.__dict__.get('events', [])):
+            return lambda timeout=None: self.next('srq', timeout)
+        raise AttributeError(name)
+
+    def remaining(self):
+        """Number of events left to replay."""
+        return len(self.events)-self.position
+
+    def next(self, op, msg):
+        """
+        Replay the next event.
+
+        Parameters
+        ----------
+        op : string
+            Operation name.
+        msg : string, int or None
+            Message (or argument) of the operation.
+
+        Returns
+        -------
+        event : dict
+            Recorded event.
+
+        Raises
+        ------
+        Exception
+            The recorded exception of the operation, if it raised.
+
+        """
+        if self.position >= len(self.events):
+            raise ValueError('Replay of '+self.resource_name+' is exhausted, got '+op+' '+str(msg))
+        event = self.events[self.position]
+        if event['op'] != op or (op != 'srq' and event['msg'] != msg):
+            raise ValueError('Replay of '+self.resource_name+' diverged at event '+str(self.position) +
+                             ': expected '+event['op']+' '+str(event['msg'])+', got '+op+' '+str(msg))
+        self.position += 1
+        if self.time_scale:
+            time.sleep(event['latency']*self.time_scale)
+        if 'error' in event:
+            error = getattr(builtins, event['error'], None)
+            if isinstance(error, type) and issubclass(error, Exception):
+                raise error(event['error_msg'])
+            raise replayed_error(event['error_msg'], event['error'], event.get('error_code'))
+        return event
+
+    def write(self, msg):
+        """Write a message."""
+        self.next('write', msg)
+
+    def read(self):
+        """Read a response."""
+        return self.next('read', None)['resp']
+
+    def query(self, msg):
+        """Query a response."""
+        return self.next('query', msg)['resp']
+
+    def read_raw(self, size=None):
+        """Read a raw response."""
+        return base64.b64decode(self.next('read_raw', size)['raw'])
+
+    def read_bytes(self, count, *args, **kwargs):
+        """Read a number of bytes."""
+        return base64.b64decode(self.next('read_bytes', count)['raw'])
+
+    def query_binary_values(self, msg, datatype='f', is_big_endian=False, container=list, **kwargs):
+        """Query binary values."""
+        event = self.next('binary', msg)
+        raw = base64.b64decode(event['raw'])
+        order = '>' if event['is_big_endian'] else '<'
+        size = struct.calcsize(event['datatype'])
+        return container(struct.unpack(order+str(len(raw)//size)+event['datatype'], raw))
+
+    def clear(self):
+        """Clear the resource."""
+        self.next('clear', None)
+
+    def close(self):
+        """Close the resource."""
+        return
+
+
+class recording:
+    """
+    Recording of the I/O of VISA resources.
+
+    Wraps live resources to record them and opens replaying resources on the
+    recorded events, like a pyvisa ResourceManager.
+    """
+
+    count = 0
+
+    def __init__(self, resources=None):
+        self.resources = resources or {}
+        self.players = {}
+        self.t0 = time.perf_counter()
+        self.number = recording.count
+        recording.count += 1
+
+    def wrap(self, resource, name=None):
+        """
+        Wrap a live resource to record its I/O.
+
+        Parameters
+        ----------
+        resource : pyvisa resource
+            Resource to record.
+        name : string, optional
+            Name of the resource in the recording. The default is None, which
+            uses the VISA resource name.
+
+        Returns
+        -------
+        recorder
+            Recording resource to open the drivers on.
+
+        """
+        if name is None:
+            name = getattr(resource, 'resource_name', None) or 'resource'+str(len(self.resources))
+        return recorder(resource, self, name)
+
+    def list_resources(self):
+        """List the resource names of the recording."""
+        return tuple(self.resources)
+
+    def open_resource(self, name, time_scale=1., **kwargs):
+        """
+        Open a replaying resource on a recorded resource.
+
+        Drivers opened on the same name replay the same stream of events.
+
+        Parameters
+        ----------
+        name : string
+            Name of the resource in the recording.
+        time_scale : float, optional
+            Scale of the recorded latencies. The default is 1.
+
+        Returns
+        -------
+        player
+            Replaying resource.
+
+        """
+        res = self.players.get(name)
+        if res is None:
+            res = player(self.resources[name], 'REPLAY'+str(self.number)+'::'+name, time_scale)
+            self.players[name] = res
+        res.time_scale = time_scale
+        return res
+
+    def rewind(self):
+        """
+        Rewind the replay to the start of the recording.
+
+        Resources opened after a rewind are new resources (with new sessions),
+        so nothing cached by the previous replay is reused.
+        """
+        self.players = {}
+        self.number = recording.count
+        recording.count += 1
+
+    def remaining(self):
+        """Number of events left to replay, per resource."""
+        return {name: res.remaining() for name, res in self.players.items()}
+
+    def latency(self):
+        """Total recorded I/O latency (seconds), per resource."""
+        return {name: sum(e['latency'] for e in events) for name, events in self.resources.items()}
+
+    def save(self, file_name):
+        """
+        Save the recording to a JSON file, gzip compressed if the file name
+        ends with '.gz'.
+
+        Parameters
+        ----------
+        file_name : string
+            File name and directory of the file to save.
+
+        Returns
+        -------
+        None.
+
+        """
+        data = json.dumps({'version': VERSION, 'resources': self.resources}, separators=(',', ':'))
+        if str(file_name).endswith('.gz'):
+            with gzip.open(file_name, 'wt', encoding='utf-8') as f:
+                f.write(data)
+        else:
+            with open(file_name, 'w', encoding='utf-8') as f:
+                f.write(data)
+
+    @classmethod
+    def load(cls, file_name):
+        """
+        Load a recording saved with save().
+
+        Parameters
+        ----------
+        file_name : string
+            File name and directory of the file to load.
+
+        Returns
+        -------
+        recording
+            Loaded recording.
+
+        """
+        opener = gzip.open if str(file_name).endswith('.gz') else open
+        with opener(file_name, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != VERSION:
+            raise ValueError('Unsupported recording version: '+str(data.get('version')))
+        return cls(data['resources'])
+
+
+def benchmark(run, rec, time_scale=1., repeat=1):
+    """
+    Time a measurement replayed from a recording.
+
+    Parameters
+    ----------
+    run : function
+        Function running the measurement, called with the recording to open
+        the replaying resources with rec.open_resource(name, time_scale).
+    rec : recording
+        Recording to replay.
+    time_scale : float, optional
+        Scale of the recorded latencies. The default is 1.
+    repeat : int, optional
+        Number of replays. The default is 1.
+
+    Returns
+    -------
+    times : list
+        Duration of each replay (seconds).
+
+    """
+    times = []
+    for ii in range(repeat):
+        rec.rewind()
+        t0 = time.perf_counter()
+        run(rec, time_scale)
+        times.append(time.perf_counter()-t0)
+        left = {name: n for name, n in rec.remaining().items() if n}
+        if left:
+            raise ValueError('Replay ended before the end of the recording: '+str(left))
+    return times
@@ -16,6 +16,10 @@ class SweepIV(measurements.sequence):
     Test setup:
         SMU <-GS-> ||DUT||
 
+    mode : string, Optional.
+        'stepped' sets and measures each point from the computer, 'buffered'
+        runs the sweep on the SMU and reads the buffered readings back at
+        once. Default is 'stepped'.
     verbose : Boolean, Optional.
         Verbose messages and plots flag. Default is False.
     visual : Boolean, Optional.
@@ -28,6 +32,7 @@ class SweepIV(measurements.sequence):
         self.v_pts = [0]
         self.chan = 'A'
         self.pwr_lim = 10e-3
+        self.mode = 'stepped'
 
         self.instruments = [smu]
         self.experiment = measurements.lab_setup(self.instruments)
@@ -39,22 +44,30 @@ class SweepIV(measurements.sequence):
             for instr in self.instruments:
                 print(instr.identify())
             print('\nDone identifying instruments.')
-        self.smu.SetPowerLimit(self.pwr_lim, self.chan)
+        if self.mode not in ('stepped', 'buffered'):
+            raise ValueError("ERR: Not a valid mode. Valid modes are 'stepped' and 'buffered', as str.")
+        if hasattr(self.smu, 'SetPowerLimit'):
+            # no power compliance on the 2400 series
+            self.smu.SetPowerLimit(self.pwr_lim, self.chan)
         self.smu.SetOutput(1, self.chan)
 
-        volt = []
-        curr = []
-        res = []
-        for v in self.v_pts:
-            self.smu.SetVoltage(v, self.chan)
-
-            volt.append(self.smu.GetVoltage(self.chan))
-            curr.append(self.smu.GetCurrent(self.chan))
-            res.append(self.smu.GetResistance(self.chan))
-
-        volt = np.array(volt)
-        curr = np.array(curr)
-        res = np.array(res)
+        if self.mode == 'buffered':
+            volt, curr, res = self.smu.SweepIVBuffered(self.v_pts, self.chan)
+        else:
+            volt = []
+            curr = []
+            res = []
+            for v in self.v_pts:
+                self.smu.SetVoltage(v, self.chan)
+
+                v_meas, i_meas, r_meas = self.smu.Measure(self.chan)
+                volt.append(v_meas)
+                curr.append(i_meas)
+                res.append(r_meas)
+
+            volt = np.array(volt)
+            curr = np.array(curr)
+            res = np.array(res)
 
         self.results.add('volt', volt)
         self.results.add('curr', curr)
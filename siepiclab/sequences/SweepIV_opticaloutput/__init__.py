@@ -6,6 +6,7 @@ Current-Voltage (IV) sweep using a source measurement unit while recording optic
 Mustafa Hammood, SiEPIC Kits, 2022
 """
 from siepiclab import measurements
+from siepiclab.drivers.PowerMonitor_keysight import PowerMonitor_group
 from datetime import datetime
 import numpy as np
 
@@ -58,14 +59,16 @@ class SweepIV_opticaloutput(measurements.sequence):
         curr = []
         res = []
         pwr_optical = np.zeros((np.size(self.v_pts), len(self.pm)))
+        # the power monitors of a mainframe are read in one transaction
+        pm_group = PowerMonitor_group(self.pm)
         for idx, v in enumerate(self.v_pts):
             self.smu.SetVoltage(v, self.chan)
 
-            volt.append(self.smu.GetVoltage(self.chan))
-            curr.append(self.smu.GetCurrent(self.chan))
-            res.append(self.smu.GetResistance(self.chan))
-            for pm_idx, p in enumerate(self.pm):
-                pwr_optical[idx, pm_idx] = p.GetPwr()
+            v_meas, i_meas, r_meas = self.smu.Measure(self.chan)
+            volt.append(v_meas)
+            curr.append(i_meas)
+            res.append(r_meas)
+            pm_group.GetPwr(out=pwr_optical[idx])
 
         volt = np.array(volt)
         curr = np.array(curr)
@@ -20,6 +20,10 @@ class SweepIV_photodiode(measurements.sequence):
         laser -SMF-> 3 dB splitter -SMF-> ||DUT||
         laser -SMF-> 3 dB splitter -SMF-> power monitor (reference calibration)
 
+    mode : string, Optional.
+        'stepped' sets and measures each point from the computer, 'buffered'
+        runs the sweep on the SMU and reads the buffered readings back at
+        once. Default is 'stepped'.
     verbose : Boolean, Optional.
         Verbose messages and plots flag. Default is False.
     visual : Boolean, Optional.
@@ -31,6 +35,7 @@ class SweepIV_photodiode(measurements.sequence):
         self.smu = smu
         self.v_pts = [0]
         self.chan = 'A'
+        self.mode = 'stepped'
 
         self.laser = laser
         self.laser_pwr = [0, 1, 2]  # mW
@@ -49,6 +54,8 @@ class SweepIV_photodiode(measurements.sequence):
             for instr in self.instruments:
                 print(instr.identify())
             print('\nDone identifying instruments.')
+        if self.mode not in ('stepped', 'buffered'):
+            raise ValueError("ERR: Not a valid mode. Valid modes are 'stepped' and 'buffered', as str.")
         self.smu.SetOutput(1, self.chan)
 
         self.pm.SetWavl(self.laser_wavl)
@@ -73,20 +80,17 @@ class SweepIV_photodiode(measurements.sequence):
                 self.laser.SetOutput(1)
                 pm_pwr.append(self.pm.GetPwr())
             time.sleep(2)
-            for idx, v in enumerate(self.v_pts):
-                self.smu.SetVoltage(v, self.chan)
-                volt[idx, ii] = self.smu.GetVoltage(self.chan)
-                curr[idx, ii] = self.smu.GetCurrent(self.chan)
-                res[idx, ii] = self.smu.GetResistance(self.chan)
-
-            volt = np.array(volt)
-            curr = np.array(curr)
-            res = np.array(res)
-
-            self.results.add('volt', volt)
-            self.results.add('curr', curr)
-            self.results.add('res', res)
-            self.results.add('laser_pwr', laser_pwr)
+            if self.mode == 'buffered':
+                volt[:, ii], curr[:, ii], res[:, ii] = self.smu.SweepIVBuffered(self.v_pts, self.chan)
+            else:
+                for idx, v in enumerate(self.v_pts):
+                    self.smu.SetVoltage(v, self.chan)
+                    volt[idx, ii], curr[idx, ii], res[idx, ii] = self.smu.Measure(self.chan)
+
+        self.results.add('volt', volt)
+        self.results.add('curr', curr)
+        self.results.add('res', res)
+        self.results.add('laser_pwr', laser_pwr)
 
         if self.visual:
             import matplotlib.pyplot as plt
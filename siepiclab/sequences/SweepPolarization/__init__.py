@@ -27,6 +27,12 @@ class SweepPolarization(measurements.sequence):
     optimize : Boolean, Optional.
         Optimization flag. Sets the polarization controller to maximize transmission.
         Default is True.
+    method : String, Optional.
+        'scan' samples a random scan for scantime seconds, 'model' maximizes
+        the transmission by model-based search of the paddle positions (see
+        PolCtrl_keysight.OptimizePaddles), within max_meas measurements and
+        to a relative tolerance tol. Without optimize, the paddles are set
+        back to their starting positions after the search. Default is 'scan'.
     verbose : Boolean, Optional.
         Verbose messages and plots flag. Default is False.
     visual : Boolean, Optional.
@@ -45,6 +51,9 @@ class SweepPolarization(measurements.sequence):
         self.wavl = 1550
         self.scanrate = 1
         self.optimize = False
+        self.method = 'scan'
+        self.tol = 1e-3
+        self.max_meas = 60
         self.verbose = False
         self.visual = False
 
@@ -65,6 +74,39 @@ class SweepPolarization(measurements.sequence):
         self.fls.SetPwrUnit('mW')
         self.fls.SetOutput(True)
 
+    def optimize_model(self):
+        """Maximize the transmission by model-based search of the paddle positions."""
+        import numpy as np
+
+        if self.verbose:
+            print("Optimizing polarizaition . . .")
+        start = self.polCtrl.GetPaddlePositionAll()
+        report = self.polCtrl.OptimizePaddles(self.pm.GetPwr, tol=self.tol, max_meas=self.max_meas)
+        if not self.optimize:
+            self.polCtrl.SetPaddlePositionAll(start, wait=True)
+        samples = np.array([positions for positions, pwr in report['trajectory']])
+        pmReadOut = 10*np.log10([pwr for positions, pwr in report['trajectory']])
+        idx = np.where(pmReadOut == np.max(pmReadOut))[0]
+        if self.verbose:
+            print(f"Converged: {report['converged']} after {report['measurements']} measurements.")
+
+        self.results.add('idx', idx)
+        self.results.add('pmReadOut', pmReadOut)
+        self.results.add('samples', samples)
+        self.results.add('converged', report['converged'])
+
+        if self.visual:
+            import matplotlib.pyplot as plt
+            plt.figure(figsize=(11, 6))
+            plt.plot(pmReadOut, '.-')
+            plt.xlabel('Measurement')
+            plt.ylabel('Power [dBm]')
+            plt.title('Polarization optimization sequence\n' +
+                      f'wavl = {int(self.wavl)} nm, measurements = {report["measurements"]}')
+            plt.tight_layout()
+        if self.verbose:
+            print("\n***Sequence executed successfully.***")
+
     def instructions(self):
         """Instructions of the sequence."""
         import time
@@ -78,6 +120,11 @@ class SweepPolarization(measurements.sequence):
 
         self.InstrSetting()
 
+        if self.method == 'model':
+            return self.optimize_model()
+        elif self.method != 'scan':
+            raise ValueError("Not a valid method. Valid methods are 'scan' and 'model'.")
+
         samples = []
         pmReadOut = []
         if self.verbose:
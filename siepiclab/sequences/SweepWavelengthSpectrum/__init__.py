@@ -5,8 +5,7 @@ Wavelength spectrum sweep sequence using tunable laser source and optical power
 
 Mustafa Hammood, SiEPIC Kits, 2022
 """
-from siepiclab import measurements
-import time
+from siepiclab import instruments, measurements
 import numpy as np
 
 
@@ -19,6 +18,19 @@ class SweepWavelengthSpectrum(measurements.sequence):
     
     mode : String, Optional.
         Sets sweep to continous or stepped. Default is continuous.
+    segmented : Boolean, Optional.
+        Split the sweep into segments of at most max_pts points and max_span
+        nm, overlapping by overlap_pts points, stitched into one spectrum.
+        Default is False.
+    match_power : Boolean, Optional.
+        Scale each segment to the power of the previous one over their
+        overlap when stitching. Default is True.
+    cycles : int, Optional.
+        Number of sweeps of each segment, averaged as they are fetched.
+        Default is 1.
+    bidirectional : Boolean, Optional.
+        Sweep each cycle up and back down the wavelength range, both
+        directions are averaged. Default is False.
     verbose : Boolean, Optional.
         Verbose messages and plots flag. Default is False.
     visual : Boolean, Optional.
@@ -47,97 +59,337 @@ class SweepWavelengthSpectrum(measurements.sequence):
         self.wavl_pts = 601  # number of points
         self.pwr = 1  # laser power, mW
         self.sweep_speed = 20  # nm/s
+        self.dwell = 0.1  # s, per step of a stepped sweep
         self.upper_limit = 0  # maximum power expected (dbm, -100: existing setting.)
+        self.sweep_overhead = 0.5  # s, laser settling added to the predicted sweep time
+        self.sweep_timeout = 30  # s, allowed beyond twice the predicted sweep time
+
+        # segmented sweep settings
+        self.segmented = False
+        self.max_pts = 100000  # points of the power monitor logging buffer
+        self.max_span = None  # nm per sweep, None: no limit
+        self.overlap_pts = 100  # points shared by consecutive segments
+        self.match_power = True
+
+        # averaged sweep settings
+        self.cycles = 1
+        self.bidirectional = False
 
         self.instruments.extend([mf, tls] + self.pm)
         self.experiment = measurements.lab_setup(self.instruments)
 
     def setup(self):
         """Instruments setting to customizable sequence parameters."""
-        # set the detector to the wavelength and units to mW
-        for p in self.pm:
-            p.SetWavl(self.wavl)
-            p.SetPwrUnit('mW')
-
-        # set the wavelength and power of the laser and turn on
-        self.tls.SetWavl(self.wavl)
-        self.tls.SetPwrUnit('dBm')
-        self.tls.SetPwr(self.pwr)
-        self.tls.SetPwrUnit('mW')
-        self.tls.SetOutput(True)
-
-        # set tunable laser to send output trigger
-        self.tls.write('TRIG', ':OUTP STF')
-        # trigger is looped into mainframe
-        self.mf.addr.write('TRIG:CONF LOOP')
-        # set power meters to receive trigger (also check if there are multiple pms)
+        # setup is write-only, send the commands in as few messages as possible
+        with self.experiment.batch():
+            # set the detector to the wavelength and units to mW
+            for p in self.pm:
+                p.SetWavl(self.wavl)
+                p.SetPwrUnit('mW')
+
+            # set the wavelength and power of the laser and turn on
+            self.tls.SetWavl(self.wavl)
+            self.tls.SetPwrUnit('dBm')
+            self.tls.SetPwr(self.pwr)
+            self.tls.SetPwrUnit('mW')
+            self.tls.SetOutput(True)
+
+            # set tunable laser to send output trigger
+            self.tls.write('TRIG', ':OUTP STF')
+            # trigger is looped into mainframe
+            self.mf.addr.write('TRIG:CONF LOOP')
+            # set power meters to receive trigger (also check if there are multiple pms)
+            for p in self.pm:
+                p.addr.write('TRIG'+str(p.chan)+':INP SME')
+
+            # Configure tunable laser sweep settings
+            # sweep mode, cycle number, start wavl, stop wavl, sweep speed, and step
+            # set tunable laser mode to continuous sweep
+            if self.mode.upper() == 'STEP':
+                self.tls.write('SOUR', ':WAV:SWE:MODE STEP')
+                self.tls.write('SOUR', ':WAV:SWE:DWEL '+str(self.dwell))
+            else:
+                self.tls.write('SOUR', ':WAV:SWE:MODE CONT')
+
+            # a bidirectional sweep is a two cycle sweep, back and forth;
+            # cycles to average are run (and fetched) one after the other
+            if self.bidirectional:
+                self.tls.write('SOUR', ':WAV:SWE:REP TWOW')
+            else:
+                self.tls.write('SOUR', ':WAV:SWE:REP ONEW')
+            self.tls.write('SOUR', ':WAV:SWE:CYCL '+str(self.directions()))
+            self.tls.SetSweepSpeed(self.sweep_speed)
+            self.tls.SetSweepStep(self.sweep_step)
+
+            for idx, p in enumerate(self.pm):
+                p.SetAutoRanging(0)  # disable auto ranging
+                p.SetPwrRange(self.upper_limit)
+                p.SetPwrUnit('dBm')
+            self.configure_segment(*self.segments()[0])
+
+            self.tls.SetWavlLoggingStatus(True)
+
+    def segments(self):
+        """
+        Split the sweep into hardware-feasible segments.
+
+        Segments are on the wavelength grid of the whole sweep, the last
+        segment is moved back to keep its full length.
+
+        Returns
+        -------
+        segments : list of tuples
+            Start wavelength (nm), stop wavelength (nm) and number of points of
+            each segment.
+
+        """
+        if not self.segmented:
+            return [(self.wavl_start, self.wavl_stop, self.wavl_pts)]
+        length = self.max_pts
+        if self.max_span is not None:
+            length = min(length, int(self.max_span/self.sweep_step+1e-9)+1)
+        if length <= self.overlap_pts:
+            raise ValueError('Segments of '+str(length)+' points cannot overlap by ' +
+                             str(self.overlap_pts)+' points.')
+        segments = []
+        first = 0
+        while True:
+            first = min(first, max(self.wavl_pts-length, 0))
+            last = min(first+length, self.wavl_pts)-1
+            segments.append((self.wavl_start+first*self.sweep_step,
+                             self.wavl_start+last*self.sweep_step, last-first+1))
+            if last == self.wavl_pts-1:
+                return segments
+            first += length-self.overlap_pts
+
+    def directions(self):
+        """Number of sweep directions of a cycle."""
+        return 2 if self.bidirectional else 1
+
+    def configure_segment(self, start, stop, pts):
+        """Set the sweep range and logging of a segment."""
+        self.tls.SetSweepStart(start)
+        self.tls.SetSweepStop(stop)
         for p in self.pm:
-            p.addr.write('TRIG'+str(p.chan)+':INP SME')
+            p.SetPwrLoggingPar(self.directions()*pts, 0.5*self.step_time())
+
+    def step_time(self):
+        """Time the laser takes per wavelength step (s)."""
+        if self.mode.upper() == 'STEP':
+            return self.dwell
+        return self.sweep_step/self.sweep_speed
+
+    def sweep_duration(self, start, stop, pts):
+        """
+        Predict the duration of the sweep of a segment.
+
+        A continuous sweep lasts its span over the sweep speed, a stepped
+        sweep its number of steps times the dwell time.
+
+        Returns
+        -------
+        float
+            Duration of the sweep (s), with the laser settling overhead.
 
-        # Configure tunable laser sweep settings
-        # sweep mode, cycle number, start wavl, stop wavl, sweep speed, and step
-        # set tunable laser mode to continuous sweep
+        """
         if self.mode.upper() == 'STEP':
-            self.tls.write('SOUR', ':WAV:SWE:MODE STEP')
+            duration = pts*self.dwell
         else:
-            self.tls.write('SOUR', ':WAV:SWE:MODE CONT')
-        
-        # set tunable laser sweep cycle number to 1
-        self.tls.write('SOUR', ':WAV:SWE:CYCL 1')
-        self.tls.SetSweepStart(self.wavl_start)
-        self.tls.SetSweepStop(self.wavl_stop)
-        self.tls.SetSweepSpeed(self.sweep_speed)
-        self.tls.SetSweepStep(self.sweep_step)
-
-        for idx, p in enumerate(self.pm):
-            p.SetAutoRanging(0)  # disable auto ranging
-            p.SetPwrRange(self.upper_limit)
-            p.SetPwrUnit('dBm')
-            p.SetPwrLoggingPar(self.wavl_pts, 0.5*self.sweep_step/self.sweep_speed)
+            duration = abs(stop-start)/self.sweep_speed
+        return self.directions()*duration+self.sweep_overhead
 
-        self.tls.SetWavlLoggingStatus(True)
+    def sweep_done(self):
+        """Flag if the sweep is finished and the power monitors logged all the points."""
+        if self.tls.GetSweepRun():
+            return False
+        return all(p.GetPwrLogging().strip().upper().endswith('COMPLETE') for p in self.pm)
 
-    def instructions(self):
-        """Instructions of the sequence."""
-        if self.verbose:
-            print('\nIdentifying instruments . . .')
-            for instr in self.instruments:
-                print(instr.identify())
-            print('\nDone identifying instruments.')
+    def run_segment(self, start, stop, pts):
+        """
+        Arm the logging, run the sweep of a segment and wait for it to finish.
 
-        self.wavl = int((self.wavl_stop+self.wavl_start)/2)
-        self.sweep_step = (self.wavl_stop-self.wavl_start)/(self.wavl_pts-1)
+        The sweep duration is predicted (see sweep_duration), the sweep and
+        logging status are polled from shortly before the predicted end.
 
-        self.setup()
-        time_delays = 2.5
+        Returns
+        -------
+        report : dict
+            Wait report, see instruments.wait_predicted.
+
+        """
         self.tls.SetWavlLoggingStatus(True)
         for p in self.pm:
             p.SetPwrLogging(True)
-        time.sleep(time_delays)
+        # logging is armed once the commands are processed
+        self.tls.wait()
 
         # start the wavelength sweep
         if self.verbose:
             print("***Starting Wavelength Sweep.***")
         self.tls.SetSweepRun(True)
-        time.sleep(time_delays)
+        duration = self.sweep_duration(start, stop, pts)
+        return instruments.wait_predicted(self.sweep_done, duration,
+                                          timeout=2*duration+self.sweep_timeout)
 
-        while self.tls.GetSweepRun():
-            time.sleep(time_delays)  # check every half a sec if the sweep is done
-       
-        if self.verbose:
-            print("***Sweep Finished, fetching.***")
-        # fetch the sweep data from the buffers
+    def fetch_segment(self, start, stop, pts, buffers=None):
+        """
+        Fetch the logged data of a segment.
+
+        Parameters
+        ----------
+        buffers : list of np.array, optional
+            Float32 buffers of the power monitors to read into, reused
+            between cycles. The default is None.
+
+        Returns
+        -------
+        wavl : np.array
+            Wavelength of the points (nm).
+        pwr : np.array
+            Power of the points (mW), one column per power monitor. The
+            sweeps of a bidirectional cycle are stacked along a first axis,
+            both in the order of wavl.
+
+        """
         if self.mode.upper() == 'STEP':
             # The 81689A cannot log the wavelength (LLOG), hence we infer from our settings.
-            rslts_wavl = np.linspace(self.wavl_start, self.wavl_stop, num=self.wavl_pts)
+            wavl = np.linspace(start, stop, num=pts)
         else:
-            rslts_wavl = 1e9*self.tls.GetWavlLoggingData()  # nm
+            wavl = 1e9*self.tls.GetWavlLoggingData()[:pts]  # nm
 
-        rslts_pwr = np.zeros((rslts_wavl.size, len(self.pm)))
+        pwr = np.zeros((self.directions(), wavl.size, len(self.pm)))
         for n, p in enumerate(self.pm):
-            rslts_pwr[:, n] = 1e3*p.GetPwrLoggingData()  # mW
+            out = None if buffers is None else buffers[n]
+            data = 1e3*p.GetPwrLoggingData(out=out).reshape(self.directions(), -1)  # mW
+            pwr[0, :, n] = data[0]
+            if self.bidirectional:
+                pwr[1, :, n] = data[1, ::-1]
+        if not self.bidirectional:
+            pwr = pwr[0]
+        return wavl, pwr
+
+    def average_segment(self, start, stop, pts, next_start=None):
+        """
+        Run the cycles of a segment, averaging them as they are fetched.
+
+        Parameters
+        ----------
+        next_start : float, optional
+            Start wavelength of the next segment (nm), the laser is moved
+            there while the last cycle is read out. The default is None.
+
+        Returns
+        -------
+        wavl : np.array
+            Wavelength of the points (nm).
+        stats : measurements.running_stats
+            Statistics of the power of the points (mW), one column per power
+            monitor.
+
+        """
+        stats = measurements.running_stats()
+        buffers = [np.empty(self.directions()*pts, dtype='<f4') for p in self.pm]
+        for cycle in range(self.cycles):
+            report = self.run_segment(start, stop, pts)
+            if self.verbose:
+                print("***Sweep Finished in "+str(round(report['elapsed'], 2))+" s, fetching.***")
+            if next_start is not None and cycle == self.cycles-1:
+                self.tls.SetWavl(next_start)
+            wavl, pwr = self.fetch_segment(start, stop, pts, buffers)
+            if self.bidirectional:
+                for sweep in pwr:
+                    stats.add(sweep)
+            else:
+                stats.add(pwr)
+        return wavl, stats
+
+    def stitch(self, data, gain=None):
+        """
+        Stitch the segments into one spectrum.
+
+        Consecutive segments are joined at the middle of their overlap. With
+        match_power, each segment is scaled to the power of the previous one
+        over the overlap, correcting power drift between the sweeps.
+
+        Parameters
+        ----------
+        data : list of tuples
+            Wavelength and power of each segment, see fetch_segment.
+        gain : np.array, optional
+            Scale to apply to each segment instead of matching their power,
+            e.g. to stitch the deviation of the power. The default is None.
+
+        Returns
+        -------
+        wavl : np.array
+            Wavelength (nm).
+        pwr : np.array
+            Power (mW), one column per power monitor.
+        gain : np.array
+            Scale applied to each segment, one column per power monitor.
+
+        """
+        wavl, pwr = data[0]
+        match = gain is None
+        if match:
+            gain = np.ones((len(data), pwr.shape[1]))
+        pwr = pwr*gain[0]
+        for idx, (w, p) in enumerate(data[1:], start=1):
+            overlap = wavl >= w[0]
+            if match and self.match_power and overlap.any():
+                for n in range(p.shape[1]):
+                    ref = np.interp(wavl[overlap], w, p[:, n])
+                    if ref.sum() > 0:
+                        gain[idx, n] = pwr[overlap, n].sum()/ref.sum()
+            p = p*gain[idx]
+            middle = 0.5*(w[0]+wavl[-1])
+            keep = wavl < middle
+            wavl = np.concatenate([wavl[keep], w[w >= middle]])
+            pwr = np.concatenate([pwr[keep], p[w >= middle]])
+        return wavl, pwr, gain
+
+    def measure(self, segments):
+        """
+        Measure the spectrum of the configured sweep.
+
+        The setup and the first segment are configured beforehand, the
+        sweep ends configured to the last segment.
+
+        Parameters
+        ----------
+        segments : list of tuples
+            Segments of the sweep, see segments.
 
-        # disable power and wavelength logging for power monitor and tunable laser
+        Returns
+        -------
+        wavl : np.array
+            Wavelength (nm).
+        pwr : np.array
+            Power (mW), one column per power monitor.
+        std : np.array
+            Standard deviation of the power over the cycles (mW).
+        gain : np.array
+            Scale applied to each segment, one column per power monitor.
+
+        """
+        data = []
+        deviation = []
+        for idx, segment in enumerate(segments):
+            if idx:
+                with self.experiment.batch():
+                    self.configure_segment(*segment)
+            # the logging buffers are reused by the next segment, the laser
+            # moves to its start while this segment is read out
+            next_start = segments[idx+1][0] if idx+1 < len(segments) else None
+            wavl, stats = self.average_segment(*segment, next_start=next_start)
+            data.append((wavl, stats.mean))
+            deviation.append((wavl, stats.std()))
+        wavl, pwr, gain = self.stitch(data)
+        std = self.stitch(deviation, gain)[1]
+        return wavl, pwr, std, gain
+
+    def teardown(self):
+        """Disable the power and wavelength logging and the sweep triggers."""
         for p in self.pm:
             p.SetPwrLogging(False)
             p.SetAutoRanging(1)
@@ -145,8 +397,26 @@ class SweepWavelengthSpectrum(measurements.sequence):
         self.tls.SetWavlLoggingStatus(False)
         self.mf.addr.write('TRIG:CONF PASS')
 
+    def instructions(self):
+        """Instructions of the sequence."""
+        if self.verbose:
+            print('\nIdentifying instruments . . .')
+            for instr in self.instruments:
+                print(instr.identify())
+            print('\nDone identifying instruments.')
+
+        self.wavl = int((self.wavl_stop+self.wavl_start)/2)
+        self.sweep_step = (self.wavl_stop-self.wavl_start)/(self.wavl_pts-1)
+
+        segments = self.segments()
+        self.setup()
+        rslts_wavl, rslts_pwr, rslts_std, gain = self.measure(segments)
+        self.teardown()
+
         self.results.add('rslts_wavl', rslts_wavl)
         self.results.add('rslts_pwr', rslts_pwr)
+        self.results.add('rslts_std', rslts_std)
+        self.results.add('segment_gain', gain)
 
         if self.visual or self.saveplot:
             import matplotlib.pyplot as plt
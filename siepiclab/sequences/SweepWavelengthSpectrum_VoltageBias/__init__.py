@@ -6,7 +6,7 @@ at various voltage bias points
 
 Mustafa Hammood, SiEPIC Kits, 2022
 """
-from siepiclab import measurements
+from siepiclab import instruments, measurements
 from siepiclab.sequences.SweepWavelengthSpectrum import SweepWavelengthSpectrum
 import numpy as np
 
@@ -19,6 +19,15 @@ class SweepWavelengthSpectrum_VoltageBias(SweepWavelengthSpectrum):
         Optical:    laser -SMF-> ||DUT|| -SMF-> Power Monitor(s)
         Electrical: smu -GS-> ||DUT||
 
+    The sweep is configured once for all the bias points, the spectra are
+    returned as arrays of shape (bias points, wavelength points, power
+    monitors).
+
+    v_pts : list, Optional.
+        Voltage bias points (V). Default is [0].
+    chan : String, Optional.
+        Channel of the source measure unit. Default is 'A'.
+
     verbose : Boolean, Optional.
         Verbose messages and plots flag. Default is False.
     visual : Boolean, Optional.
@@ -36,21 +45,18 @@ class SweepWavelengthSpectrum_VoltageBias(SweepWavelengthSpectrum):
 
     def instructions(self):
         """Instructions of the sequence."""
+        self.wavl = int((self.wavl_stop+self.wavl_start)/2)
+        self.sweep_step = (self.wavl_stop-self.wavl_start)/(self.wavl_pts-1)
+
+        segments = self.segments()
         self.smu.SetOutput(1, self.chan)
-        rslts_wavl = []
-        rslts_pwr = []
-        for v in self.v_pts:
-            self.smu.SetVoltage(v, self.chan)
-            if self.visual:
-                self.visual = False
-                temp1, temp2 = SweepWavelengthSpectrum.instructions(self)
-                rslts_wavl.append(temp1)
-                rslts_pwr.append(temp2)
-                self.visual = True
-            else:
-                temp1, temp2 = SweepWavelengthSpectrum.instructions(self)
-                rslts_wavl.append(temp1)
-                rslts_pwr.append(temp2)
+        self.smu.SetVoltage(self.v_pts[0], self.chan, wait=True)
+        self.setup()
+        if len(segments) == 1 and self.cycles == 1 and not self.bidirectional:
+            rslts_wavl, rslts_pwr = self.pipeline(*segments[0])
+        else:
+            rslts_wavl, rslts_pwr = self.measure_bias(segments)
+        self.teardown()
 
         self.results.add('rslts_wavl', rslts_wavl)
         self.results.add('rslts_pwr', rslts_pwr)
@@ -75,3 +81,90 @@ class SweepWavelengthSpectrum_VoltageBias(SweepWavelengthSpectrum):
         if self.verbose:
             print("\n***Sequence executed successfully.***")
         return rslts_wavl, rslts_pwr, self.v_pts
+
+    def pipeline(self, start, stop, pts):
+        """
+        Sweep the spectrum at each bias point, overlapping the I/O.
+
+        The sweep is configured once. Once a sweep is done, the next bias is
+        set while its buffers are fetched, and they are parsed while the
+        next sweep runs. The logging buffers of the power monitors are
+        cleared when they are armed, so a sweep cannot overlap the fetch of
+        the previous one.
+
+        Returns
+        -------
+        wavl : np.array
+            Wavelength (nm), one row per bias point, of pts points each (a
+            single unsegmented sweep).
+        pwr : np.array
+            Power (mW), of shape (bias points, pts, power monitors).
+
+        """
+        n_bias = len(self.v_pts)
+        wavl = np.zeros((n_bias, pts))
+        pwr = np.zeros((n_bias, pts, len(self.pm)))
+        # raw buffers, fetched into while the previous ones are parsed
+        raw_wavl = [np.empty(pts, dtype='<f8') for ii in range(2)]
+        raw_pwr = [[np.empty(pts, dtype='<f4') for p in self.pm] for ii in range(2)]
+
+        def parse(idx, buf):
+            if self.mode.upper() == 'STEP':
+                # The 81689A cannot log the wavelength (LLOG), hence we infer from our settings.
+                wavl[idx] = np.linspace(start, stop, num=pts)
+            else:
+                wavl[idx] = 1e9*raw_wavl[buf]  # nm
+            for n in range(len(self.pm)):
+                pwr[idx, :, n] = 1e3*raw_pwr[buf][n]  # mW
+
+        executor = instruments.get_executor()
+        parsing = []
+        for idx in range(n_bias):
+            report = self.run_segment(start, stop, pts)
+            if self.verbose:
+                print("***Sweep at "+str(self.v_pts[idx])+" V Finished in " +
+                      str(round(report['elapsed'], 2))+" s, fetching.***")
+            biasing = None
+            if idx+1 < n_bias:
+                biasing = executor.submit(self.smu.SetVoltage, self.v_pts[idx+1], self.chan, wait=True)
+            buf = idx % 2
+            if idx >= 2:
+                parsing[idx-2].result()  # the buffers are free
+            if self.mode.upper() != 'STEP':
+                self.tls.GetWavlLoggingData(out=raw_wavl[buf])
+            for n, p in enumerate(self.pm):
+                p.GetPwrLoggingData(out=raw_pwr[buf][n])
+            parsing.append(executor.submit(parse, idx, buf))
+            if biasing is not None:
+                biasing.result()
+        for future in parsing:
+            future.result()
+        return wavl, pwr
+
+    def measure_bias(self, segments):
+        """
+        Measure the spectrum of a segmented or averaged sweep at each bias point.
+
+        Returns
+        -------
+        wavl : np.array
+            Wavelength (nm), one row per bias point, as many points as the
+            stitched spectrum of the segments.
+        pwr : np.array
+            Power (mW), of shape (bias points, wavelength points, power
+            monitors).
+
+        """
+        for idx, v in enumerate(self.v_pts):
+            if idx:
+                self.smu.SetVoltage(v, self.chan, wait=True)
+                if len(segments) > 1:
+                    with self.experiment.batch():
+                        self.configure_segment(*segments[0])
+            wavl_v, pwr_v = self.measure(segments)[:2]
+            if not idx:
+                # the stitched spectrum may differ in length from wavl_pts
+                wavl = np.zeros((len(self.v_pts),)+np.shape(wavl_v))
+                pwr = np.zeros((len(self.v_pts),)+np.shape(pwr_v))
+            wavl[idx], pwr[idx] = wavl_v, pwr_v
+        return wavl, pwr
@@ -5,7 +5,7 @@ Photodiode respinsivity measurement sequence.
 
 Mustafa Hammood, SiEPIC Kits, 2022
 """
-from siepiclab import measurements
+from siepiclab import instruments, measurements
 import numpy as np
 from datetime import datetime
 import time
@@ -20,6 +20,14 @@ class photodiode_responsivity(measurements.sequence):
         laser -optical-> 3 dB splitter -optical-> ||DUT||
         laser -optical-> 3 dB splitter -optical-> reference calibration monitor
 
+    mode : String, Optional.
+        'stepped' sets the laser and reads the instruments point by point,
+        'triggered' runs a stepped laser sweep whose output triggers the
+        SMU (on digital I/O line trig_line) and power monitor readings,
+        fetched once per bias. Default is 'stepped'.
+    dwell : float, Optional.
+        Dwell time per wavelength step of a triggered sweep (s).
+        Default is 0.1.
     verbose : Boolean, Optional.
         Verbose messages and plots flag. Default is False.
     visual : Boolean, Optional.
@@ -42,9 +50,92 @@ class photodiode_responsivity(measurements.sequence):
         self.wavl_pts = 501
         self.laser_pwr = 1  # mW
 
+        self.settle = 2  # s, after setting a bias
+        self.mode = 'stepped'
+        self.dwell = 0.1  # s
+        self.trig_line = 1  # SMU digital I/O line wired to the laser trigger output
+        self.upper_limit = 0  # power monitor range in triggered mode (dBm)
+        self.sweep_overhead = 0.5  # s, laser settling added to the predicted sweep time
+
         self.instruments = [smu, pm, laser]
         self.experiment = measurements.lab_setup(self.instruments)
 
+    def optical_power(self, pwr):
+        """
+        Optical power at the device of a power monitor reading.
+
+        Parameters
+        ----------
+        pwr : float or np.array
+            Power measured at the reference power monitor (mW).
+
+        Returns
+        -------
+        float or np.array
+            Optical power at the device (mW), corrected by loss_coupling.
+
+        """
+        return pwr*10**(self.loss_coupling/10)
+
+    def setup_triggered(self):
+        """Configure the stepped laser sweep and its triggered power logging."""
+        step = (self.wavl_stop-self.wavl_start)/(self.wavl_pts-1)
+        with self.experiment.batch():
+            self.pm.SetAutoRanging(0)
+            self.pm.SetPwrRange(self.upper_limit)
+            self.pm.SetPwrLoggingPar(self.wavl_pts, 0.5*self.dwell)
+            self.pm.addr.write('TRIG'+str(self.pm.chan)+':INP SME')
+
+            self.laser.SetWavl(self.wavl_start)
+            self.laser.write('SOUR', ':WAV:SWE:MODE STEP')
+            self.laser.write('SOUR', ':WAV:SWE:REP ONEW')
+            self.laser.write('SOUR', ':WAV:SWE:CYCL 1')
+            self.laser.SetSweepStart(self.wavl_start)
+            self.laser.SetSweepStop(self.wavl_stop)
+            self.laser.SetSweepStep(step)
+            self.laser.write('SOUR', ':WAV:SWE:DWEL '+str(self.dwell))
+            # a trigger per step, looped into the mainframe and out to the SMU
+            self.laser.write('TRIG', ':OUTP STF')
+            self.laser.addr.write('TRIG:CONF LOOP')
+
+    def sweep_done(self):
+        """Flag if the sweep is finished and the power monitor logged all the points."""
+        if self.laser.GetSweepRun():
+            return False
+        return self.pm.GetPwrLogging().strip().upper().endswith('COMPLETE')
+
+    def measure_triggered(self):
+        """
+        Measure the responsivity curve at the current bias in one triggered sweep.
+
+        Returns
+        -------
+        photocurr : np.array
+            Absolute photocurrent (A).
+        pwr_optical : np.array
+            Optical power at the device (mW).
+
+        """
+        self.smu.ArmTriggeredMeasure(self.smu_chan, self.wavl_pts, self.trig_line)
+        self.pm.SetPwrLogging(True)
+        self.laser.wait()
+        self.laser.SetSweepRun(True)
+        duration = self.wavl_pts*self.dwell+self.sweep_overhead
+        instruments.wait_predicted(self.sweep_done, duration, timeout=2*duration+30)
+
+        curr = self.smu.GetTriggeredMeasure(self.smu_chan, self.wavl_pts)[1]
+        # logged power is in W whatever the power unit
+        pwr = 1e3*self.pm.GetPwrLoggingData()
+        return np.abs(curr), self.optical_power(pwr)
+
+    def teardown_triggered(self):
+        """Disable the power logging and the sweep triggers."""
+        self.pm.SetPwrLogging(False)
+        self.pm.SetAutoRanging(1)
+        self.pm.addr.write('TRIG'+str(self.pm.chan)+':INP IGN')
+        self.laser.write('TRIG', ':OUTP DIS')
+        self.laser.addr.write('TRIG:CONF PASS')
+
     def instructions(self):
         """Instructions of the sequence."""
         if self.verbose:
@@ -57,6 +148,11 @@ class photodiode_responsivity(measurements.sequence):
         if type(self.smu_v_bias) != list:
             self.smu_v_bias = [self.smu_v_bias]
 
+        if self.mode not in ('stepped', 'triggered'):
+            raise ValueError("Not a valid mode. Valid modes are 'stepped' and 'triggered'.")
+        if self.mode == 'triggered' and not hasattr(self.smu, 'ArmTriggeredMeasure'):
+            raise ValueError('The SMU does not support triggered measurements.')
+
         wavl_range = np.linspace(self.wavl_start, self.wavl_stop, self.wavl_pts)
         self.smu.SetVoltage(0, self.smu_chan)
         self.smu.SetOutput(1, self.smu_chan)
@@ -76,19 +172,28 @@ class photodiode_responsivity(measurements.sequence):
         wavl_res = 0.1  # 100 pm
         wavls_fit = np.arange(np.min(wavl_range), np.max(wavl_range), wavl_res)
         responsivity_fit = np.zeros((np.size(wavls_fit), np.size(self.smu_v_bias)))
+        if self.mode == 'triggered':
+            self.setup_triggered()
         for i, volt in enumerate(self.smu_v_bias):
             self.smu.SetVoltage(volt, self.smu_chan)
-            time.sleep(2)
-            for idx, wavl in enumerate(wavl_range):
-                wavls[idx, i] = self.laser.SetWavl(wavl, verbose=True)
-                photocurr[idx, i] = self.smu.GetCurrent(self.smu_chan)
-                pwr_optical[idx, i] = 10**((1e-3*self.pm.GetPwr()+self.loss_coupling)/10)
+            time.sleep(self.settle)
+            if self.mode == 'triggered':
+                wavls[:, i] = wavl_range
+                photocurr[:, i], pwr_optical[:, i] = self.measure_triggered()
+            else:
+                for idx, wavl in enumerate(wavl_range):
+                    wavls[idx, i] = self.laser.SetWavl(wavl, verbose=True)
+                    photocurr[idx, i] = self.smu.GetCurrent(self.smu_chan)
+                    # the dBm reading is scaled by 1e3 by GetPwr
+                    pwr_optical[idx, i] = self.optical_power(10**(1e-3*self.pm.GetPwr()/10))
 
             photocurr[:, i] = np.abs(photocurr[:, i])
             responsivity[:, i] = photocurr[:, i] / (1e-3*pwr_optical[:, i])  # A/W
             # 3rd order polynomial usually okay for broadband responsivity plots
             pfit = np.poly1d(np.polyfit(wavls[:, i], responsivity[:, i], 3))
             responsivity_fit[:, i] = pfit(wavls_fit)
+        if self.mode == 'triggered':
+            self.teardown_triggered()
 
         self.results.add('wavls', wavls)
         self.results.add('responsivity', responsivity)
@@ -0,0 +1,1387 @@
+# -*- coding: utf-8 -*-
+"""
+SiEPIClab simulation module.
+
+In-process simulated VISA backend to run the drivers and sequences without
+hardware. A bench holds instrument models and opens simulated resources on
+them, in place of a pyvisa ResourceManager:
+
+    bench = simulation.default_bench()
+    tls = tls_keysight(bench.open_resource('mainframe_1550'), chan='0')
+
+Mustafa Hammood, SiEPIC Kits, 2022
+"""
+import re
+import struct
+import threading
+import time
+import numpy as np
+from siepiclab import instruments
+
+OPTIONS_SCALE = {'': 1., 'm': 1., 'nm': 1e-9, 'pm': 1e-12, 'um': 1e-6,
+                 'w': 1., 'mw': 1e-3, 'uw': 1e-6, 'nw': 1e-9,
+                 'm/s': 1., 'nm/s': 1e-9}
+
+
+def number(arg):
+    """
+    Parse a numeric argument with an optional unit suffix to base units.
+
+    Parameters
+    ----------
+    arg : string
+        Argument, e.g. '1550.0NM', '1mW' or '20nm/s'.
+
+    Returns
+    -------
+    value : float
+        Value in base units (m, W, m/s).
+    unit : string
+        Unit suffix (lower case).
+
+    """
+    m = re.match(r'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([a-zA-Z/]*)', arg)
+    if m is None:
+        raise ValueError('Not a numeric argument: '+str(arg))
+    unit = m.group(2).lower()
+    if unit == 'dbm':
+        return 1e-3*10**(float(m.group(1))/10), unit
+    return float(m.group(1))*OPTIONS_SCALE.get(unit, 1.), unit
+
+
+def fmt(value):
+    """Format a numeric response."""
+    return '%+.8E' % value
+
+
+def block(data):
+    """
+    Encode an array as an IEEE 488.2 definite length binary block.
+
+    Parameters
+    ----------
+    data : np.array
+        Data of the block, encoded with its dtype.
+
+    Returns
+    -------
+    bytes
+        Binary block.
+
+    """
+    raw = np.ascontiguousarray(data).tobytes()
+    length = str(len(raw))
+    return ('#'+str(len(length))+length).encode()+raw
+
+
+def split_statements(msg):
+    """Split a program message on ';' outside of brackets and quotes."""
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    for idx, c in enumerate(msg):
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c in '({[':
+            depth += 1
+        elif c in ')}]':
+            depth -= 1
+        elif c == ';' and depth == 0:
+            parts.append(msg[start:idx])
+            start = idx+1
+    parts.append(msg[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+class sim_resource:
+    """
+    Simulated VISA resource.
+
+    Implements the subset of the pyvisa resource interface used by the
+    drivers. Messages are handled by the instrument model and its responses
+    are buffered until read. Every transaction takes the bench latency.
+    """
+
+    def __init__(self, bench, model, resource_name):
+        self.bench = bench
+        self.model = model
+        self.resource_name = resource_name
+        self.timeout = 2000
+        self.output = bytearray()
+
+    def delay(self, msg):
+        """Sleep for the simulated latency of a message."""
+        latency = self.bench.latency_of(msg, self.model.scpi)
+        if latency > 0:
+            time.sleep(latency)
+
+    def write(self, msg):
+        """Write a program message to the instrument model."""
+        self.delay(msg)
+        # SCPI responses to the queries of one program message are separated
+        # by ';' and terminated once, binary blocks are sent on their own
+        units = []
+        for cmd in split_statements(msg):
+            resp = self.model.handle(cmd)
+            if resp is None:
+                continue
+            if isinstance(resp, str):
+                if self.model.scpi and units and isinstance(units[-1], str):
+                    units[-1] += ';'+resp
+                else:
+                    units.append(resp)
+            else:
+                units.append(resp)
+        for resp in units:
+            if isinstance(resp, str):
+                resp = resp.encode()
+            self.output += resp+b'\n'
+
+    def read_bytes(self, count, chunk_size=None, break_on_termchar=False):
+        """Read a number of bytes from the output buffer."""
+        if len(self.output) < count:
+            raise TimeoutError('VI_ERROR_TMO (-1073807339): Timeout expired before operation completed.')
+        data = bytes(self.output[:count])
+        del self.output[:count]
+        return data
+
+    def read_raw(self, size=None):
+        """Read the output buffer up to and including the next termination."""
+        if not self.output:
+            raise TimeoutError('VI_ERROR_TMO (-1073807339): Timeout expired before operation completed.')
+        idx = self.output.find(b'\n')
+        return self.read_bytes(len(self.output) if idx == -1 else idx+1)
+
+    def read(self):
+        """Read a response."""
+        return self.read_raw().decode('latin-1')
+
+    def query(self, msg):
+        """Write a program message and read the response."""
+        self.write(msg)
+        return self.read()
+
+    def query_binary_values(self, msg, datatype='f', is_big_endian=False, container=list,
+                            header_fmt='ieee', expect_termination=True, data_points=None,
+                            chunk_size=None):
+        """Write a program message and read a binary block response."""
+        self.write(msg)
+        head = self.read_bytes(2)
+        ndigits = int(head[1:2])
+        length = int(self.read_bytes(ndigits)) if ndigits else len(self.output)
+        raw = self.read_bytes(length)
+        if expect_termination and self.output[:1] == b'\n':
+            self.read_bytes(1)
+        fmt = ('>' if is_big_endian else '<')+str(length//struct.calcsize(datatype))+datatype
+        return container(struct.unpack(fmt, raw))
+
+    def clear(self):
+        """Clear the output buffer."""
+        self.output = bytearray()
+
+    def close(self):
+        """Close the resource."""
+        return
+
+
+class sim_srq_resource(sim_resource):
+    """
+    Simulated VISA resource with service request events.
+
+    A service request asserted by the instrument model is queued as an
+    event of the resource, until waited for or discarded.
+    """
+
+    def __init__(self, bench, model, resource_name):
+        super(sim_srq_resource, self).__init__(bench, model, resource_name)
+        self.srq = threading.Condition()
+        self.srq_line = False
+        self.srq_events = 0
+
+    def write(self, msg):
+        """Write a program message, queueing an event if it asserts a service request."""
+        super(sim_srq_resource, self).write(msg)
+        with self.srq:
+            line = self.model.service_request()
+            if line and not self.srq_line:
+                self.srq_events += 1
+                self.srq.notify_all()
+            self.srq_line = line
+
+    def wait_for_srq(self, timeout=25000):
+        """Wait for a service request event, timeout in ms (None: no limit)."""
+        with self.srq:
+            if not self.srq.wait_for(lambda: self.srq_events,
+                                     None if timeout is None else 1e-3*timeout):
+                raise TimeoutError('VI_ERROR_TMO (-1073807339): Timeout expired before operation completed.')
+            self.srq_events = 0
+
+    def discard_events(self, event_type, mechanism):
+        """Discard the queued service request events."""
+        with self.srq:
+            self.srq_events = 0
+
+
+class sim_model:
+    """
+    Simulated instrument abstraction class.
+
+    Handles the IEEE 488.2 common commands, subclasses handle the rest.
+    """
+
+    scpi = True
+    idn = 'SiEPIClab,Simulated instrument,0,1.0'
+
+    def __init__(self):
+        self.bench = None
+        self.esr = 0
+        self.ese = 0
+        self.sre = 0
+
+    def reset(self):
+        """Reset the model to its power on state."""
+        return
+
+    def handle(self, cmd):
+        """
+        Handle a command.
+
+        Parameters
+        ----------
+        cmd : string
+            Command (single program message unit).
+
+        Returns
+        -------
+        String, bytes or None
+            Response of the command.
+
+        """
+        header = cmd.strip().lstrip(':').split(' ')[0].upper()
+        if header == '*IDN?':
+            return self.idn
+        if header == '*OPC?':
+            self.update()
+            return '1'
+        if header == '*OPC':
+            self.update()
+            self.esr |= 1
+            return None
+        if header == '*RST':
+            self.reset()
+            return None
+        if header == '*CLS':
+            self.esr = 0
+            return None
+        if header == '*ESE':
+            self.ese = int(cmd.split()[1])
+            return None
+        if header == '*SRE':
+            self.sre = int(cmd.split()[1])
+            return None
+        if header == '*ESR?':
+            esr, self.esr = self.esr, 0
+            return str(esr)
+        if header == '*TRG':
+            return None
+        self.update()
+        return self.command(cmd.strip().lstrip(':'))
+
+    def update(self):
+        """Advance the simulated state to the current time."""
+        return
+
+    def service_request(self):
+        """Flag if the model asserts a service request (event status summary enabled)."""
+        return bool(self.esr & self.ese) and bool(self.sre & 32)
+
+    def command(self, cmd):
+        """Handle an instrument specific command."""
+        raise ValueError('Simulated instrument does not support: '+cmd)
+
+
+class sim_laser:
+    """Simulated laser source module of a lightwave mainframe."""
+
+    idn = 'Agilent Technologies,81689A,SIM00000,1.0'
+
+    def __init__(self):
+        self.mainframe = None
+        self.reset()
+
+    def reset(self):
+        """Reset the module to its power on state."""
+        self.pwr = 1e-3  # W
+        self.unit = 1  # 0: dBm, 1: W
+        self.output = False
+        self.wavl = 1550e-9  # m
+        self.trig_out = 'DIS'
+
+    def update(self):
+        """Advance the simulated state to the current time."""
+        return
+
+    def source(self, sub, args):
+        """Handle a SOUR:... command."""
+        if sub == ':POW':
+            value, unit = number(args)
+            if unit == '' and self.unit == 0:
+                value = 1e-3*10**(value/10)
+            self.pwr = value
+        elif sub == ':POW?':
+            return fmt(self.pwr)
+        elif sub == ':POW:UNIT':
+            self.unit = 0 if args.upper().startswith('DBM') or args.strip() == '0' else 1
+        elif sub == ':POW:UNIT?':
+            return str(self.unit)
+        elif sub == ':POW:STAT':
+            self.output = args.strip().upper() in ('1', 'ON')
+        elif sub == ':POW:STAT?':
+            return '1' if self.output else '0'
+        elif sub == ':WAV':
+            self.wavl = number(args)[0]
+        elif sub == ':WAV?':
+            return fmt(self.wavl)
+        else:
+            raise ValueError('Simulated laser does not support: SOUR'+sub)
+
+    def trigger(self, sub, args):
+        """Handle a TRIG:... command."""
+        if sub == ':OUTP':
+            self.trig_out = args.strip().upper()
+        elif sub == ':OUTP?':
+            return self.trig_out
+        else:
+            raise ValueError('Simulated laser does not support: TRIG'+sub)
+
+
+class sim_tls(sim_laser):
+    """Simulated tunable laser source module of a lightwave mainframe."""
+
+    idn = 'Agilent Technologies,81600B,SIM00000,1.0'
+
+    def reset(self):
+        """Reset the module to its power on state."""
+        super(sim_tls, self).reset()
+        self.start = 1500e-9
+        self.stop = 1600e-9
+        self.speed = 20e-9
+        self.step = 1e-12
+        self.mode = 'CONT'
+        self.cycles = 1
+        self.repeat = 'ONEW'
+        self.dwell = 0.1
+        self.llog = False
+        self.t_sweep = None
+        self.llog_data = np.zeros(0)
+
+    def points(self):
+        """Wavelength points of a sweep (m)."""
+        num = int(round((self.stop-self.start)/self.step))+1
+        return np.linspace(self.start, self.stop, max(num, 1))
+
+    def duration(self):
+        """Duration of a sweep (s)."""
+        if self.mode == 'STEP':
+            return self.cycles*len(self.points())*self.dwell
+        return self.cycles*(self.stop-self.start)/self.speed
+
+    def update(self):
+        """Complete the running sweep once its duration has elapsed."""
+        if self.t_sweep is None:
+            return
+        elapsed = time.monotonic()-self.t_sweep
+        if elapsed >= self.duration()*self.mainframe.bench.time_scale:
+            self.t_sweep = None
+            self.finish()
+
+    def finish(self):
+        """Log the swept wavelengths and trigger the power monitors."""
+        wavls = self.points()
+        if self.llog:
+            self.llog_data = wavls
+        if self.trig_out == 'STF':
+            for cycle in range(self.cycles):
+                cycle_wavls = wavls[::-1] if self.repeat == 'TWOW' and cycle % 2 else wavls
+                self.mainframe.triggered(cycle_wavls, self.pwr if self.output else 0.)
+                self.mainframe.bench.trigger_out(self, cycle_wavls)
+        self.wavl = self.start
+
+    def source(self, sub, args):
+        """Handle a SOUR:... command."""
+        if sub == ':WAV:SWE:STAR':
+            self.start = number(args)[0]
+        elif sub == ':WAV:SWE:STAR?':
+            return fmt(self.start)
+        elif sub == ':WAV:SWE:STOP':
+            self.stop = number(args)[0]
+        elif sub == ':WAV:SWE:STOP?':
+            return fmt(self.stop)
+        elif sub == ':WAV:SWE:SPE':
+            self.speed = number(args)[0]
+        elif sub == ':WAV:SWE:SPE?':
+            return fmt(self.speed)
+        elif sub == ':WAV:SWE:STEP':
+            self.step = number(args)[0]
+        elif sub == ':WAV:SWE:STEP?':
+            return fmt(self.step)
+        elif sub == ':WAV:SWE:MODE':
+            self.mode = args.strip().upper()
+        elif sub == ':WAV:SWE:MODE?':
+            return self.mode
+        elif sub == ':WAV:SWE:CYCL':
+            self.cycles = int(args)
+        elif sub == ':WAV:SWE:CYCL?':
+            return str(self.cycles)
+        elif sub == ':WAV:SWE:DWEL':
+            self.dwell = number(args)[0]
+        elif sub == ':WAV:SWE:DWEL?':
+            return fmt(self.dwell)
+        elif sub == ':WAV:SWE:REP':
+            self.repeat = args.strip().upper()
+        elif sub == ':WAV:SWE:REP?':
+            return self.repeat
+        elif sub == ':WAV:SWE:LLOG':
+            self.llog = args.strip().upper() in ('1', 'ON')
+        elif sub == ':WAV:SWE:LLOG?':
+            return '1' if self.llog else '0'
+        elif sub == ':WAV:SWE':
+            if args.strip().upper().startswith('STAR'):
+                self.t_sweep = time.monotonic()
+            else:
+                self.t_sweep = None
+        elif sub == ':WAV:SWE?':
+            return '0' if self.t_sweep is None else '1'
+        elif sub == ':READ:DATA?':
+            return block(np.asarray(self.llog_data, dtype='<f8'))
+        else:
+            return super(sim_tls, self).source(sub, args)
+
+
+class sim_pm:
+    """
+    Simulated optical power monitor module of a lightwave mainframe.
+
+    heads : int, Optional.
+        Number of detector heads (channels) of the module. Default is 2.
+    transmission : list of functions, Optional.
+        Linear transmission of the optical path to each head as a function of
+        wavelength (nm). Default is the bench device under test.
+    """
+
+    idn = 'Agilent Technologies,81635A,SIM00000,1.0'
+
+    def __init__(self, heads=2, transmission=None):
+        self.mainframe = None
+        self.heads = heads
+        self.transmission = transmission or [None]*heads
+        self.reset()
+
+    def reset(self):
+        """Reset the module to its power on state."""
+        self.wavl = [1550e-9]*self.heads
+        self.unit = [0]*self.heads  # 0: dBm, 1: W
+        self.auto = [1]*self.heads
+        self.range = [10.]*self.heads
+        self.num_pts = 100
+        self.avg_time = 1e-4
+        self.func = 'NONE'
+        self.func_state = 'COMPLETE'
+        self.t_func = None
+        self.trig_in = 'IGN'
+        self.data = [np.zeros(0, dtype='<f4') for head in range(self.heads)]
+
+    def power(self, head, wavl=None):
+        """Optical power incident on a head (W), at the laser wavelength if not given."""
+        bench = self.mainframe.bench
+        return bench.optical_power(self.transmission[head], wavl)
+
+    def update(self):
+        """Complete an untriggered logging once its duration has elapsed."""
+        if self.t_func is None:
+            return
+        elapsed = time.monotonic()-self.t_func
+        if elapsed >= self.num_pts*self.avg_time*self.mainframe.bench.time_scale:
+            self.t_func = None
+            for head in range(self.heads):
+                self.data[head] = np.full(self.num_pts, self.power(head), dtype='<f4')
+            self.func_state = 'COMPLETE'
+
+    def triggered(self, wavls, pwr):
+        """Log the power of a triggered sweep over the given wavelengths (m)."""
+        if self.func != 'LOGGING_STABILITY' or self.func_state != 'PROGRESS' or self.trig_in != 'SME':
+            return
+        # the logging continues over the triggers of consecutive sweep cycles
+        wavls = wavls[:self.num_pts-len(self.data[0])]
+        for head in range(self.heads):
+            logged = np.array([self.power(head, w*1e9) if pwr else 0. for w in wavls], dtype='<f4')
+            self.data[head] = np.concatenate([self.data[head], logged])
+        if len(self.data[0]) >= self.num_pts:
+            self.func_state = 'COMPLETE'
+
+    def sense(self, head, sub, args):
+        """Handle a SENS:... command."""
+        if sub == ':POW:WAV':
+            self.wavl[head] = number(args)[0]
+        elif sub == ':POW:WAV?':
+            return fmt(self.wavl[head])
+        elif sub == ':POW:UNIT':
+            self.unit[head] = 0 if args.upper().startswith('DBM') or args.strip() == '0' else 1
+        elif sub == ':POW:UNIT?':
+            return str(self.unit[head])
+        elif sub == ':POW:RANG:AUTO':
+            self.auto[head] = int(args)
+        elif sub == ':POW:RANG:AUTO?':
+            return str(self.auto[head])
+        elif sub == ':POW:RANG':
+            self.range[head] = float(args)
+        elif sub == ':POW:RANG?':
+            return fmt(self.range[head])
+        elif sub == ':FUNC:PAR:LOGG':
+            num_pts, avg_time = args.split(',')
+            self.num_pts = int(num_pts)
+            self.avg_time = float(avg_time)
+        elif sub == ':FUNC:PAR:LOGG?':
+            return str(self.num_pts)+','+fmt(self.avg_time)
+        elif sub == ':FUNC:STAT':
+            func, action = [a.strip().upper() for a in args.split(',')]
+            if action.startswith('STAR'):
+                self.func = 'LOGGING_STABILITY'
+                self.func_state = 'PROGRESS'
+                self.data = [np.zeros(0, dtype='<f4') for head in range(self.heads)]
+                self.t_func = time.monotonic() if self.trig_in == 'IGN' else None
+            else:
+                self.func = 'NONE'
+                self.func_state = 'COMPLETE'
+                self.t_func = None
+        elif sub == ':FUNC:STAT?':
+            return self.func+','+self.func_state
+        elif sub == ':FUNC:RES?':
+            return block(self.data[head])
+        elif sub == ':CORR:COLL:ZERO:ALL':
+            return None
+        elif sub == ':CORR:COLL:ZERO:ALL?':
+            return '0'
+        else:
+            raise ValueError('Simulated power monitor does not support: SENS'+sub)
+
+    def fetch(self, head):
+        """Handle a FETC:POW? query."""
+        pwr = self.power(head)
+        if self.unit[head] == 0:
+            return fmt(10*np.log10(max(pwr, 1e-15)/1e-3))
+        return fmt(pwr)
+
+    def trigger(self, sub, args):
+        """Handle a TRIG:... command."""
+        if sub == ':INP':
+            self.trig_in = args.strip().upper()
+        elif sub == ':INP?':
+            return self.trig_in
+        else:
+            raise ValueError('Simulated power monitor does not support: TRIG'+sub)
+
+
+class sim_mainframe(sim_model):
+    """
+    Simulated HP-Agilent-Keysight lightwave measurement system mainframe.
+
+    slots : dict, Optional.
+        Modules of the mainframe keyed by slot number. Default is a tunable
+        laser in slot 0 and a dual head power monitor in slot 1.
+    """
+
+    idn = 'Agilent Technologies,8164B,SIM00000,1.0'
+
+    def __init__(self, slots=None):
+        super(sim_mainframe, self).__init__()
+        if slots is None:
+            slots = {0: sim_tls(), 1: sim_pm()}
+        self.slots = slots
+        for module in slots.values():
+            module.mainframe = self
+        self.trig_conf = 'PASS'
+
+    def reset(self):
+        """Reset the mainframe and its modules."""
+        self.trig_conf = 'PASS'
+        for module in self.slots.values():
+            module.reset()
+
+    def update(self):
+        """Advance the simulated state of the modules."""
+        for module in self.slots.values():
+            module.update()
+
+    def triggered(self, wavls, pwr):
+        """Route the output triggers of a sweep to the modules."""
+        if self.trig_conf != 'LOOP':
+            return
+        for module in self.slots.values():
+            if isinstance(module, sim_pm):
+                module.triggered(wavls, pwr)
+
+    def command(self, cmd):
+        """Handle the module commands."""
+        header, _, args = cmd.partition(' ')
+        header = header.upper()
+        m = re.match(r'^SOUR(\d*)(:.*)$', header)
+        if m:
+            return self.slots[int(m.group(1) or 0)].source(m.group(2), args)
+        m = re.match(r'^SENS(\d*)(?::CHAN(\d*))?(:.*)$', header)
+        if m:
+            return self.slots[int(m.group(1) or 1)].sense(int(m.group(2) or 1)-1, m.group(3), args)
+        m = re.match(r'^(?:FETC|READ)(\d*)(?::CHAN(\d+))?(?::SCAL)?:POW\?$', header)
+        if m:
+            return self.slots[int(m.group(1) or 1)].fetch(int(m.group(2) or 1)-1)
+        if header == 'TRIG:CONF':
+            self.trig_conf = args.strip().upper()
+            return None
+        if header == 'TRIG:CONF?':
+            return self.trig_conf
+        m = re.match(r'^TRIG(\d+)(:.*)$', header)
+        if m:
+            return self.slots[int(m.group(1))].trigger(m.group(2), args)
+        m = re.match(r'^SLOT(\d+):IDN\?$', header)
+        if m:
+            return self.slots[int(m.group(1))].idn
+        raise ValueError('Simulated mainframe does not support: '+cmd)
+
+
+class sim_smu_channel:
+    """
+    Simulated source measure unit channel.
+
+    load : function, Optional.
+        Current (A) drawn by the device under test as a function of the
+        voltage (V). Default is a 1 kOhm resistor.
+    """
+
+    def __init__(self, load=None):
+        self.load = load or (lambda v: v/1e3)
+        self.reset()
+
+    def reset(self):
+        """Reset the channel to its power on state."""
+        self.func = 'v'
+        self.levelv = 0.
+        self.leveli = 0.
+        self.limitv = 20.
+        self.limiti = 0.1
+        self.limitp = 1e3
+        self.output = 0
+
+    def measure(self):
+        """
+        Measure the channel.
+
+        Returns
+        -------
+        v : float
+            Voltage (V).
+        i : float
+            Current (A).
+
+        """
+        if not self.output:
+            return 0., 0.
+        if self.func == 'v':
+            v = self.levelv
+            i = float(np.clip(self.load(v), -self.limiti, self.limiti))
+            return v, i
+        # current source: solve the load for the voltage by bisection
+        lo, hi = -self.limitv, self.limitv
+        target = self.leveli
+        if self.load(hi) <= target:
+            return hi, self.load(hi)
+        if self.load(lo) >= target:
+            return lo, self.load(lo)
+        for it in range(60):
+            mid = 0.5*(lo+hi)
+            if self.load(mid) < target:
+                lo = mid
+            else:
+                hi = mid
+        return 0.5*(lo+hi), target
+
+    def resistance(self):
+        """Measured resistance (Ohms)."""
+        v, i = self.measure()
+        return v/i if i else 9.91e37
+
+
+class sim_keithley2600(sim_model):
+    """
+    Simulated Keithley 2600 series source measure unit (TSP).
+
+    loads : dict, Optional.
+        Load function of each channel ('a', 'b'), see sim_smu_channel.
+    """
+
+    scpi = False
+    idn = 'Keithley Instruments Inc., Model 2602B, SIM00000, 1.0'
+
+    def __init__(self, loads=None):
+        super(sim_keithley2600, self).__init__()
+        loads = loads or {}
+        self.smu = {ch: sim_smu_channel(loads.get(ch)) for ch in 'ab'}
+        # scripts survive a reset, the functions they define are modeled
+        # by name in library
+        self.scripts = {}
+        self.functions = set()
+        self.loading = None
+        self.library = {'siepiclab_sweep_dual': self.sweep_dual}
+        self.variables = {}  # global variables of the scripts, kept on reset
+        self.reset()
+
+    def reset(self):
+        """Reset the channels, their buffers and trigger model."""
+        for ch in self.smu.values():
+            ch.reset()
+        self.nvbuffer = {(ch, n): [] for ch in 'ab' for n in '12'}
+        self.sweep = {ch: {'levels': [], 'count': 1, 'buffers': None, 'source': True,
+                           'stimulus': None, 'pending': 0} for ch in 'ab'}
+        self.format = 'ASCII'
+
+    def initiate(self, ch):
+        """Run the trigger model sweep of a channel into its buffers."""
+        sweep = self.sweep[ch]
+        if sweep['stimulus'] is not None:
+            # measurements wait for the digital I/O triggers
+            sweep['pending'] = int(sweep['count'])
+            return
+        for idx in range(int(sweep['count'])):
+            self.measure_point(ch, idx)
+
+    def measure_point(self, ch, idx):
+        """Source (if enabled) and measure a point of the trigger model into the buffers."""
+        sweep = self.sweep[ch]
+        smu = self.smu[ch]
+        if sweep['source']:
+            smu.func = 'v'
+            smu.levelv = sweep['levels'][idx % len(sweep['levels'])]
+        v, i = smu.measure()
+        if sweep['buffers']:
+            self.nvbuffer[(ch, sweep['buffers'][0])].append(i)
+            self.nvbuffer[(ch, sweep['buffers'][1])].append(v)
+
+    def armed(self):
+        """Flag if a trigger model waits for input triggers."""
+        return any(sweep['pending'] for sweep in self.sweep.values())
+
+    def trigger_in(self):
+        """Take the measurement of an input trigger on the armed channels."""
+        for ch, sweep in self.sweep.items():
+            if sweep['pending']:
+                self.measure_point(ch, int(sweep['count'])-sweep['pending'])
+                sweep['pending'] -= 1
+
+    def sweep_dual(self, s1, f1, levels, s2, f2, bias):
+        """Model of the siepiclab_sweep_dual library function of smu_keithley."""
+        ch1, ch2 = s1[-1], s2[-1]
+        smu1, smu2 = self.smu[ch1], self.smu[ch2]
+        for key in [(ch1, '1'), (ch1, '2'), (ch2, '1'), (ch2, '2')]:
+            self.nvbuffer[key] = []
+        smu2.func = f2.strip('"')
+        setattr(smu2, 'level'+smu2.func, float(bias))
+        smu1.func = f1.strip('"')
+        smu1.output = smu2.output = 1
+        for level in split_args(levels.strip('{}')):
+            setattr(smu1, 'level'+smu1.func, float(level))
+            for ch, smu in [(ch1, smu1), (ch2, smu2)]:
+                v, i = smu.measure()
+                self.nvbuffer[(ch, '1')].append(i)
+                self.nvbuffer[(ch, '2')].append(v)
+
+    def printbuffer(self, args):
+        """Print the readings of buffers, interleaved per point."""
+        start, stop = int(float(args[0])), int(float(args[1]))
+        buffers = []
+        for arg in args[2:]:
+            m = re.match(r'^smu([ab])\.nvbuffer([12])\.readings$', arg)
+            buffers.append(self.nvbuffer[(m.group(1), m.group(2))][start-1:stop])
+        values = np.array(buffers).T.ravel()
+        if self.format == 'REAL32':
+            return b'#0'+values.astype('<f4').tobytes()
+        return ', '.join('%.5e' % v for v in values)
+
+    def value(self, expr):
+        """Evaluate a TSP expression printed by the drivers, as a list of values."""
+        expr = expr.strip()
+        m = re.match(r'^smu([ab])\.measure\.(iv|[vir])\(\)$', expr)
+        if m:
+            ch = self.smu[m.group(1)]
+            v, i = ch.measure()
+            return {'iv': [i, v], 'v': [v], 'i': [i], 'r': [ch.resistance()]}[m.group(2)]
+        m = re.match(r'^smu([ab])\.source\.(func|output|levelv|leveli|limitv|limiti|limitp)$', expr)
+        if m:
+            ch = self.smu[m.group(1)]
+            if m.group(2) == 'func':
+                return [1 if ch.func == 'v' else 0]
+            return [getattr(ch, m.group(2))]
+        return [float(expr)]
+
+    def command(self, cmd):
+        """Handle a TSP statement."""
+        if self.loading is not None:
+            if cmd == 'endscript':
+                self.loading = None
+            else:
+                self.scripts[self.loading].append(cmd)
+            return None
+        m = re.match(r'^loadscript\s+(\w+)$', cmd)
+        if m:
+            self.loading = m.group(1)
+            self.scripts[self.loading] = []
+            return None
+        m = re.match(r'^print\((\w+) ~= nil\)$', cmd)
+        if m:
+            return 'true' if m.group(1) in self.scripts else 'false'
+        m = re.match(r'^(\w+)\((.*)\)$', cmd)
+        if m and m.group(1) in self.scripts:
+            # running a script defines its functions
+            for line in self.scripts[m.group(1)]:
+                self.functions.update(re.findall(r'^function\s+(\w+)\(', line))
+            return None
+        if m and m.group(1) in self.functions:
+            self.library[m.group(1)](*split_args(m.group(2)))
+            return None
+        m = re.match(r'^smu([ab])\.reset\(\)$', cmd)
+        if m:
+            self.smu[m.group(1)].reset()
+            return None
+        m = re.match(r'^smu([ab])\.source\.func\s*=\s*smu[ab]\.OUTPUT_(DCVOLTS|DCAMPS)$', cmd)
+        if m:
+            self.smu[m.group(1)].func = 'v' if m.group(2) == 'DCVOLTS' else 'i'
+            return None
+        m = re.match(r'^smu([ab])\.source\.output\s*=\s*smu[ab]\.OUTPUT_(ON|OFF)$', cmd)
+        if m:
+            self.smu[m.group(1)].output = 1 if m.group(2) == 'ON' else 0
+            return None
+        m = re.match(r'^smu([ab])\.source\.(levelv|leveli|limitv|limiti|limitp)\s*=\s*(\S+)$', cmd)
+        if m:
+            setattr(self.smu[m.group(1)], m.group(2), float(m.group(3)))
+            return None
+        m = re.match(r'^smu([ab])\.nvbuffer([12])\.clear\(\)$', cmd)
+        if m:
+            self.nvbuffer[(m.group(1), m.group(2))] = []
+            return None
+        m = re.match(r'^smu([ab])\.trigger\.source\.linearv\((.*)\)$', cmd)
+        if m:
+            start, stop, points = [float(a) for a in split_args(m.group(2))]
+            self.sweep[m.group(1)]['levels'] = list(np.linspace(start, stop, int(points)))
+            return None
+        m = re.match(r'^smu([ab])\.trigger\.source\.listv\(\{(.*)\}\)$', cmd)
+        if m:
+            self.sweep[m.group(1)]['levels'] = [float(a) for a in split_args(m.group(2))]
+            return None
+        m = re.match(r'^smu([ab])\.trigger\.measure\.iv\(smu[ab]\.nvbuffer([12]),\s*smu[ab]\.nvbuffer([12])\)$', cmd)
+        if m:
+            self.sweep[m.group(1)]['buffers'] = (m.group(2), m.group(3))
+            return None
+        m = re.match(r'^smu([ab])\.trigger\.source\.action\s*=\s*(smu[ab]\.(ENABLE|DISABLE)|\w+)$', cmd)
+        if m:
+            if m.group(3):
+                self.sweep[m.group(1)]['source'] = m.group(3) == 'ENABLE'
+            else:
+                self.sweep[m.group(1)]['source'] = self.variables[m.group(2)]
+            return None
+        m = re.match(r'^(\w+)\s*=\s*smu([ab])\.trigger\.source\.action$', cmd)
+        if m:
+            self.variables[m.group(1)] = self.sweep[m.group(2)]['source']
+            return None
+        m = re.match(r'^smu([ab])\.trigger\.measure\.stimulus\s*=\s*(\S+)$', cmd)
+        if m:
+            line = re.match(r'^digio\.trigger\[(\d+)\]\.EVENT_ID$', m.group(2))
+            self.sweep[m.group(1)]['stimulus'] = int(line.group(1)) if line else None
+            return None
+        m = re.match(r'^smu([ab])\.trigger\.count\s*=\s*(\S+)$', cmd)
+        if m:
+            self.sweep[m.group(1)]['count'] = int(float(m.group(2)))
+            return None
+        m = re.match(r'^smu([ab])\.trigger\.initiate\(\)$', cmd)
+        if m:
+            self.initiate(m.group(1))
+            return None
+        if re.match(r'^(smu[ab]\.(trigger\.\w+\.\w+|measure\.(nplc|delay))|digio\.trigger\[\d+\]\.\w+)\s*=', cmd) or \
+                re.match(r'^digio\.trigger\[\d+\]\.clear\(\)$', cmd) or \
+                cmd in ('waitcomplete()', 'format.byteorder = format.LITTLEENDIAN'):
+            # timing and trigger actions do not change the simulated readings
+            return None
+        m = re.match(r'^format\.data\s*=\s*format\.(ASCII|REAL32)$', cmd)
+        if m:
+            self.format = m.group(1)
+            return None
+        m = re.match(r'^printbuffer\((.*)\)$', cmd)
+        if m:
+            return self.printbuffer(split_args(m.group(1)))
+        m = re.match(r'^print\((.*)\)$', cmd)
+        if m:
+            values = [v for expr in split_args(m.group(1)) for v in self.value(expr)]
+            return '\t'.join('%.5e' % v for v in values)
+        raise ValueError('Simulated Keithley 2600 does not support: '+cmd)
+
+
+def split_args(args):
+    """Split function arguments on ',' outside of brackets."""
+    parts = []
+    depth = 0
+    start = 0
+    for idx, c in enumerate(args):
+        if c in '({[':
+            depth += 1
+        elif c in ')}]':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(args[start:idx])
+            start = idx+1
+    parts.append(args[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+class sim_keithley2400(sim_model):
+    """
+    Simulated Keithley 2400 series source measure unit (SCPI).
+
+    channels : int, Optional.
+        Number of channels (2 for the dual channel 2402 driver). Default is 1.
+    loads : list of functions, Optional.
+        Load function of each channel, see sim_smu_channel.
+    """
+
+    idn = 'KEITHLEY INSTRUMENTS INC.,MODEL 2400,SIM00000,1.0'
+
+    def __init__(self, channels=1, loads=None):
+        super(sim_keithley2400, self).__init__()
+        loads = loads or [None]*channels
+        self.smu = [sim_smu_channel(load) for load in loads]
+        self.reset()
+
+    def reset(self):
+        """Reset the channels."""
+        for ch in self.smu:
+            ch.reset()
+        self.conf = 'VOLT'
+        self.elements = ['VOLT']
+        self.sweep = [{'mode': 'FIX', 'list': [0.], 'start': 0., 'stop': 0., 'points': 1}
+                      for ch in self.smu]
+        self.count = 1
+        self.form = 'ASC'
+        self.swap = False
+
+    def levels(self, idx):
+        """Source levels of the sweep of a channel."""
+        sweep = self.sweep[idx]
+        if sweep['mode'] == 'LIST':
+            return sweep['list']
+        if sweep['mode'] == 'SWE':
+            return list(np.linspace(sweep['start'], sweep['stop'], sweep['points']))
+        return [self.smu[idx].levelv]
+
+    def read(self, idxs=(0,)):
+        """Read the configured elements of channels, for each trigger."""
+        levels = {idx: self.levels(idx) for idx in idxs}
+        values = []
+        for n in range(self.count):
+            for idx in idxs:
+                ch = self.smu[idx]
+                if self.sweep[idx]['mode'] != 'FIX':
+                    ch.levelv = levels[idx][n % len(levels[idx])]
+                v, i = ch.measure()
+                point = {'VOLT': v, 'CURR': i, 'RES': ch.resistance()}
+                values += [point[e] for e in self.elements]
+        if self.form == 'REAL':
+            return b'#0'+np.array(values).astype('<f8' if self.swap else '>f8').tobytes()
+        return ','.join(fmt(v) for v in values)
+
+    def command(self, cmd):
+        """Handle a SCPI command."""
+        header, _, args = cmd.partition(' ')
+        header = header.upper()
+        args = args.strip()
+        m = re.match(r'^(SOUR|SENS|OUTP)(\d*)(.*)$', header)
+        if m:
+            idx = int(m.group(2) or 1)-1
+            kind, ch, sub, sweep = m.group(1), self.smu[idx], m.group(3), self.sweep[idx]
+            if kind == 'OUTP':
+                if sub == '?':
+                    return str(ch.output)
+                ch.output = int(float(args)) if args not in ('ON', 'OFF') else int(args == 'ON')
+                return None
+            if kind == 'SOUR':
+                if sub == ':FUNC':
+                    ch.func = 'v' if args.upper().startswith('VOLT') else 'i'
+                elif sub == ':VOLT':
+                    ch.levelv = float(args)
+                    ch.func = 'v' if len(self.smu) > 1 else ch.func
+                elif sub == ':CURR':
+                    ch.leveli = float(args)
+                    ch.func = 'i' if len(self.smu) > 1 else ch.func
+                elif sub == ':VOLT:MODE':
+                    mode = args.upper()
+                    sweep['mode'] = 'FIX' if mode.startswith('FIX') else \
+                        'LIST' if mode.startswith('LIST') else 'SWE'
+                elif sub == ':LIST:VOLT':
+                    sweep['list'] = [float(a) for a in args.split(',')]
+                elif sub in (':VOLT:STAR', ':VOLT:STOP'):
+                    sweep['start' if sub.endswith('STAR') else 'stop'] = float(args)
+                elif sub == ':SWE:POIN':
+                    sweep['points'] = int(float(args))
+                elif sub in (':DEL', ':SWE:SPAC'):
+                    pass
+                else:
+                    raise ValueError('Simulated Keithley 2400 does not support: '+cmd)
+                return None
+            if sub == ':CURR:PROT':
+                ch.limiti = float(args)
+            elif sub == ':CURR:PROT?':
+                return fmt(ch.limiti)
+            elif sub == ':VOLT:PROT':
+                ch.limitv = float(args)
+            elif sub == ':VOLT:PROT?':
+                return fmt(ch.limitv)
+            elif sub in (':CURR:NPLC', ':FUNC:CONC', ':FUNC:ON', ':RES:MODE'):
+                pass
+            elif sub in (':VOLT?', ':CURR?', ':RES?'):
+                v, i = ch.measure()
+                return fmt({':VOLT?': v, ':CURR?': i, ':RES?': ch.resistance()}[sub])
+            else:
+                raise ValueError('Simulated Keithley 2400 does not support: '+cmd)
+            return None
+        if header.startswith('CONF:'):
+            self.conf = header[5:]
+            return None
+        if header == 'CONF?':
+            return '"'+self.conf+':DC"'
+        if header == 'FORM:ELEM':
+            self.elements = [e.strip().upper() for e in args.split(',')]
+            return None
+        if header == 'READ?':
+            m = re.match(r'^\(@([\d,]+)\)$', args)
+            return self.read([int(c)-1 for c in m.group(1).split(',')] if m else (0,))
+        if header == 'TRIG:COUN':
+            self.count = int(float(args))
+            return None
+        if header in ('FORM', 'FORM:DATA'):
+            self.form = args.upper().split(',')[0][:4]
+            return None
+        if header == 'FORM:BORD':
+            self.swap = args.upper().startswith('SWAP')
+            return None
+        if header in ('STAT:QUEUE:CLEAR', 'STAT:PRES', '*CLS'):
+            return None
+        raise ValueError('Simulated Keithley 2400 does not support: '+cmd)
+
+
+class sim_polctrl(sim_model):
+    """
+    Simulated HP-Agilent-Keysight 11896A polarization controller.
+
+    The polarization dependent transmission of the optical path is modelled
+    as the product of a cos^2 dependence on each paddle angle, maximum at the
+    'optimum' paddle positions.
+    """
+
+    idn = 'HEWLETT-PACKARD,11896A,SIM00000,1.0'
+
+    def __init__(self, optimum=(350, 720, 130, 500), extinction=0.05, dwell=0.05, seed=0):
+        super(sim_polctrl, self).__init__()
+        self.optimum = optimum
+        self.extinction = extinction
+        self.dwell = dwell
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        """Reset the controller."""
+        self.positions = [500, 500, 500, 500]
+        self.scanrate = 1
+        self.scanning = False
+        self.t_move = 0.
+
+    def update(self):
+        """Move the paddles randomly while scanning, every dwell time."""
+        if not self.scanning:
+            return
+        now = time.monotonic()
+        if now-self.t_move >= self.dwell/self.scanrate*self.bench.time_scale:
+            self.t_move = now
+            self.positions = [int(p) for p in self.rng.integers(0, 1000, 4)]
+
+    def factor(self):
+        """Polarization dependent transmission of the optical path."""
+        f = 1.
+        for pos, opt in zip(self.positions, self.optimum):
+            f *= np.cos(np.pi*(pos-opt)/999)**2
+        return self.extinction+(1-self.extinction)*f
+
+    def command(self, cmd):
+        """Handle a SCPI command."""
+        header, _, args = cmd.partition(' ')
+        header = header.upper()
+        if header == 'INIT:IMM':
+            self.scanning = True
+            return None
+        if header == 'ABOR':
+            self.scanning = False
+            return None
+        if header == 'SCAN:RATE':
+            self.scanrate = int(args)
+            return None
+        if header == 'SCAN:RATE?':
+            return str(self.scanrate)
+        m = re.match(r'^PADD(\d):POS(\??)$', header)
+        if m:
+            paddle = int(m.group(1))-1
+            if m.group(2):
+                return str(self.positions[paddle])
+            self.positions[paddle] = int(np.clip(int(float(args)), 0, 999))
+            return None
+        raise ValueError('Simulated polarization controller does not support: '+cmd)
+
+
+class sim_ldc500(sim_model):
+    """Simulated Stanford Research Systems LDC500 series laser diode controller."""
+
+    idn = 'Stanford_Research_Systems,LDC501,SIM00000,1.0'
+
+    def __init__(self):
+        super(sim_ldc500, self).__init__()
+        self.reset()
+
+    def reset(self):
+        """Reset the controller."""
+        self.values = {'TEMP': 25., 'TEON': 0, 'LDON': 0, 'SILD': 0., 'SVLM': 2.5,
+                       'SILM': 100., 'RNGE': 0, 'BIAS': 0., 'PILM': 5., 'PWLM': 50.,
+                       'RESP': 0.8}
+
+    def command(self, cmd):
+        """Handle a command."""
+        header, _, args = cmd.partition(' ')
+        header = header.upper()
+        v = self.values
+        current = v['SILD'] if v['LDON'] else 0.
+        if header == 'TTRD?':
+            return '%.4f' % v['TEMP']
+        if header == 'RILD?':
+            return '%.4f' % current
+        if header == 'RVLD?':
+            return '%.4f' % (min(0.9+0.005*current, v['SVLM']) if v['LDON'] else 0.)
+        if header == 'RIPD?':
+            return '%.4f' % (10*max(current-10., 0.))
+        if header == 'RWPD?':
+            return '%.4f' % (0.3*max(current-10., 0.))
+        if header == 'LDON?':
+            return str(v['LDON'])
+        if header.endswith('?') and header[:-1] in v:
+            return str(v[header[:-1]])
+        if header in ('TEON', 'LDON'):
+            v[header] = 1 if args.strip().upper() in ('ON', '1') else 0
+            return None
+        if header == 'RNGE':
+            v[header] = 1 if args.strip().upper() == 'HIGH' else 0
+            return None
+        if header in v:
+            v[header] = float(args)
+            return None
+        raise ValueError('Simulated LDC500 does not support: '+cmd)
+
+
+class bench:
+    """
+    Simulated test bench.
+
+    Holds the instrument models and opens simulated resources on them, like
+    a pyvisa ResourceManager.
+
+    time_scale : float, Optional.
+        Scale of the simulated operation durations (sweeps, logging), 0 for
+        instantaneous operations. Default is 1 (real time).
+    latency : dict, Optional.
+        Latency added per command (seconds), keyed by command template as
+        reported by instruments.io_stats (e.g. 'SOUR*:WAV?').
+    default_latency : float, Optional.
+        Latency of every bus transaction (seconds). Default is 0.
+    dut : function, Optional.
+        Linear transmission of the device under test as a function of
+        wavelength (nm). Default is a ring resonator notch filter.
+    srq : Boolean, Optional.
+        Flag if the resources support service requests (wait_for_srq).
+        Default is False, the drivers poll for operation complete.
+    """
+
+    boards = 0
+
+    def __init__(self, time_scale=1., latency=None, default_latency=0., dut=None, srq=False):
+        self.time_scale = time_scale
+        self.srq = srq
+        self.latency = latency or {}
+        self.default_latency = default_latency
+        self.dut = dut or ring_resonator
+        self.models = {}
+        self.board = bench.boards
+        bench.boards += 1
+        self.templates = {True: instruments.io_stats(True), False: instruments.io_stats(False)}
+
+    def add(self, name, model):
+        """
+        Add an instrument model to the bench.
+
+        Parameters
+        ----------
+        name : string
+            Resource name of the instrument.
+        model : sim_model
+            Instrument model.
+
+        Returns
+        -------
+        model : sim_model
+            Instrument model.
+
+        """
+        model.bench = self
+        self.models[name] = model
+        return model
+
+    def open_resource(self, name, **kwargs):
+        """
+        Open a simulated resource on an instrument of the bench.
+
+        The resource name is prefixed by the bench board number, so that
+        drivers share a session per instrument of a given bench only.
+        """
+        resource = sim_srq_resource if self.srq else sim_resource
+        return resource(self, self.models[name], 'SIM'+str(self.board)+'::'+name)
+
+    def list_resources(self):
+        """List the resource names of the bench."""
+        return tuple(self.models)
+
+    def latency_of(self, msg, scpi=True):
+        """Simulated latency of a program message (seconds)."""
+        if not self.latency:
+            return self.default_latency
+        template = self.templates[scpi].template(msg)
+        return self.default_latency+sum(self.latency.get(t, 0.) for t in template.split(';'))
+
+    def trigger_out(self, laser, wavls):
+        """
+        Send the output triggers of a laser sweep to the armed instruments.
+
+        Models the trigger output of the mainframe wired to the trigger
+        inputs of the other instruments of the bench. The laser is stepped
+        through the wavelengths (m) of the triggers.
+        """
+        armed = [m for m in self.models.values() if getattr(m, 'armed', lambda: False)()]
+        if not armed:
+            return
+        wavl = laser.wavl
+        for w in wavls:
+            laser.wavl = w
+            for model in armed:
+                model.trigger_in()
+        laser.wavl = wavl
+
+    def lasers(self):
+        """Laser modules of the bench."""
+        for model in self.models.values():
+            for module in getattr(model, 'slots', {}).values():
+                if isinstance(module, sim_laser):
+                    yield module
+
+    def optical_power(self, transmission=None, wavl=None):
+        """
+        Optical power at the output of the optical path (W).
+
+        Parameters
+        ----------
+        transmission : function, optional
+            Linear transmission of the path as a function of wavelength (nm).
+            The default is None (the bench device under test).
+        wavl : float, optional
+            Wavelength of the light (nm). The default is the laser wavelength.
+
+        Returns
+        -------
+        float
+            Optical power (W).
+
+        """
+        transmission = transmission or self.dut
+        pwr = 0.
+        for laser in self.lasers():
+            if laser.output:
+                w = laser.wavl*1e9 if wavl is None else wavl
+                pwr += laser.pwr*transmission(w)
+        for model in self.models.values():
+            if isinstance(model, sim_polctrl):
+                pwr *= model.factor()
+        return pwr
+
+
+def ring_resonator(wavl, fsr=10., fwhm=0.2, extinction=0.9, loss=0.5):
+    """
+    Linear transmission of an all-pass ring resonator (Lorentzian notches).
+
+    Parameters
+    ----------
+    wavl : float or np.array
+        Wavelength (nm).
+    fsr : float, optional
+        Free spectral range (nm). The default is 10.
+    fwhm : float, optional
+        Resonance full width at half maximum (nm). The default is 0.2.
+    extinction : float, optional
+        Fractional depth of the notches. The default is 0.9.
+    loss : float, optional
+        Insertion loss (linear). The default is 0.5.
+
+    Returns
+    -------
+    float or np.array
+        Linear transmission.
+
+    """
+    detuning = (np.asarray(wavl) % fsr)-fsr/2
+    return loss*(1-extinction/(1+(2*detuning/fwhm)**2))
+
+
+def default_bench(time_scale=0., **kwargs):
+    """
+    Build a bench with one simulated instrument of each supported kind.
+
+    Resources:
+        'mainframe_1550': 8164 mainframe, tunable laser in slot 0, dual head
+            power monitor in slot 1 and fixed laser in slot 2.
+        'keithley_2604b': Keithley 2600 series (TSP).
+        'keithley_2400': Keithley 2400.
+        'keithley_2402': dual channel Keithley 2400 series.
+        'polctrl': 11896A polarization controller.
+        'ldc500': SRS LDC501 laser diode controller.
+
+    Parameters
+    ----------
+    time_scale : float, optional
+        Scale of the simulated operation durations. The default is 0.
+    **kwargs :
+        Other bench settings (latency, default_latency, dut, srq).
+
+    Returns
+    -------
+    bench
+        Simulated bench.
+
+    """
+    sim = bench(time_scale=time_scale, **kwargs)
+    sim.add('mainframe_1550', sim_mainframe({0: sim_tls(), 1: sim_pm(), 2: sim_laser()}))
+    sim.add('keithley_2604b', sim_keithley2600())
+    sim.add('keithley_2400', sim_keithley2400())
+    sim.add('keithley_2402', sim_keithley2400(channels=2))
+    sim.add('polctrl', sim_polctrl())
+    sim.add('ldc500', sim_ldc500())
+    return sim
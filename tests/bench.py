@@ -0,0 +1,27 @@
+"""Simulated bench shared by the tests of the drivers and sequences."""
+
+
+import unittest
+
+from siepiclab import simulation
+from siepiclab.drivers.tls_keysight import tls_keysight
+from siepiclab.drivers.lwmm_keysight import lwmm_keysight
+from siepiclab.drivers.PowerMonitor_keysight import PowerMonitor_keysight
+
+
+class BenchTestCase(unittest.TestCase):
+    """Test case on a fresh default simulated bench (see simulation.default_bench)."""
+
+    def setUp(self):
+        """Set up a simulated bench and open its lightwave mainframe."""
+        self.bench = simulation.default_bench()
+        self.mainframe = self.bench.open_resource('mainframe_1550')
+
+    def sweep_instruments(self):
+        """Mainframe, tunable laser and power monitor drivers of a wavelength sweep."""
+        return (lwmm_keysight(self.mainframe), tls_keysight(self.mainframe, chan='0'),
+                PowerMonitor_keysight(self.mainframe, chan='1'))
+
+    def transmission(self, wavl):
+        """Expected power (mW) at the power monitor of the 1 mW laser, at wavl (nm)."""
+        return simulation.ring_resonator(wavl)*self.bench.models['polctrl'].factor()
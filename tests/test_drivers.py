@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+"""Tests for `siepiclab.drivers` package."""
+
+
+import contextlib
+import io
+
+import numpy as np
+
+from siepiclab import instruments, simulation
+from siepiclab.drivers.tls_keysight import tls_keysight
+from siepiclab.drivers.lwmm_keysight import lwmm_keysight
+from siepiclab.drivers.PowerMonitor_keysight import PowerMonitor_keysight, PowerMonitor_group
+from siepiclab.drivers.PolCtrl_keysight import PolCtrl_keysight
+from siepiclab.drivers.smu_keithley import smu_keithley
+from siepiclab.drivers.smu_keithley2400 import smu_keithley2400
+from siepiclab.drivers.smu_keithley2402 import smu_keithley2402
+from tests import bench
+
+
+class TestDrivers(bench.BenchTestCase):
+    """Tests for the drivers on the simulated instruments."""
+
+    def test_000_laser_power_monitor(self):
+        """Settings round-trip and the power monitor reads the laser through the DUT."""
+        tls = tls_keysight(self.mainframe, chan='0')
+        pm = PowerMonitor_keysight(self.mainframe, chan='1', slot='1')
+        tls.SetWavl(1555)
+        tls.SetPwrUnit('mW')
+        tls.SetPwr(2)
+        tls.SetOutput(True)
+        self.assertAlmostEqual(tls.GetWavl(), 1555)
+        self.assertAlmostEqual(tls.GetPwr(), 2)
+        self.assertTrue(tls.GetOutput())
+        pm.SetPwrUnit('mW')
+        expected = 2*self.transmission(1555)
+        self.assertAlmostEqual(pm.GetPwr(), expected, places=6)
+
+    def test_001_smu(self):
+        """The SMU models measure a resistive load."""
+        smu = smu_keithley(self.bench.open_resource('keithley_2604b'))
+        smu.SetOutput(1, 'A')
+        smu.SetVoltage(2., 'A')
+        self.assertAlmostEqual(smu.GetVoltage('A'), 2.)
+        self.assertAlmostEqual(smu.GetCurrent('A'), 2e-3)
+        self.assertEqual(smu.GetOutput('AB'), (1, 0))
+
+        smu = smu_keithley2400(self.bench.open_resource('keithley_2400'))
+        smu.SetCurrentLimit(5e-3)
+        self.assertAlmostEqual(smu.GetCurrentLimit(), 5e-3)
+
+        smu = smu_keithley2402(self.bench.open_resource('keithley_2402'), single_chan=False)
+        smu.SetOutput(1, 'B')
+        smu.SetVoltage(1., 'B')
+        self.assertAlmostEqual(smu.GetVoltage('B'), 1.)
+        self.assertAlmostEqual(smu.GetCurrent('B'), 1e-3)
+
+    def test_002_measure(self):
+        """Measure reads all the quantities of a channel in one transaction."""
+        smus = [(smu_keithley(self.bench.open_resource('keithley_2604b')), 'A'),
+                (smu_keithley2400(self.bench.open_resource('keithley_2400')), 'A'),
+                (smu_keithley2402(self.bench.open_resource('keithley_2402'), single_chan=False), 'B')]
+        for smu, chan in smus:
+            smu.SetOutput(1, chan)
+            smu.SetVoltage(2., chan)
+            smu.addr.stats.reset()
+            volt, curr, res = smu.Measure(chan)
+            self.assertEqual(sum(t['count'] for t in smu.addr.stats.snapshot().values()), 1)
+            self.assertAlmostEqual(volt, 2.)
+            self.assertAlmostEqual(curr, 2e-3)
+            self.assertAlmostEqual(res, 1e3, places=3)
+            self.assertAlmostEqual(smu.Measure(chan, ('i',))[0], 2e-3)
+        self.assertEqual(smu.Measure('AB', ('v',)), ((0.,), (2.,)))
+        # a channel the instrument does not have is reported
+        for smu, chan in zip([s for s, c in smus], ['C', 'B', 'BA']):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                self.assertIsNone(smu.Measure(chan))
+            self.assertTrue(out.getvalue().startswith('ERR: Not a valid channel.'))
+
+    def test_003_script_library(self):
+        """The TSP script library is uploaded once and sweeps on the instrument."""
+        smu = smu_keithley(self.bench.open_resource('keithley_2604b'))
+        v1, i1, v2, i2 = smu.SweepVI_independent(v1_start=0, v1_stop=2, curr2=-1e-3, pts=50,
+                                                 visualize=False)
+        np.testing.assert_allclose(v1, np.linspace(0, 2, 50), rtol=1e-6)
+        np.testing.assert_allclose(i1, v1/1e3, rtol=1e-5)
+        np.testing.assert_allclose(v2, -1., rtol=1e-5)
+        self.assertEqual(smu.GetOutput('A'), 0)
+
+        smu.SweepVV_independent(pts=10, visualize=False)
+        uploads = [t for t in smu.addr.stats.snapshot() if t.startswith('loadscript')]
+        self.assertEqual(len(uploads), 1)
+        # a new session finds the script already on the instrument
+        smu.addr.session.scripts.clear()
+        self.assertFalse(smu.addr.load_script(smu.library))
+        self.assertTrue(smu.addr.load_script(instruments.tsp_script('test', 'x = 1')))
+
+    def test_004_dual_channel_sweep(self):
+        """The 2402 sweeps both channels on a shared trigger."""
+        sim = simulation.bench()
+        sim.add('keithley_2402', simulation.sim_keithley2400(
+            channels=2, loads=[None, lambda v: v/2e3]))
+        smu = smu_keithley2402(sim.open_resource('keithley_2402'), single_chan=False)
+        heater = np.linspace(0, 2, 250)
+        volt, curr, res = smu.SweepIVBuffered((heater, -1.), 'AB')
+        self.assertEqual(volt.shape, (250, 2))
+        np.testing.assert_allclose(curr[:, 0], heater/1e3, rtol=1e-6)
+        np.testing.assert_allclose(curr[:, 1], -0.5e-3, rtol=1e-6)
+        self.assertAlmostEqual(smu.GetVoltage('A'), 2.)
+        self.assertEqual(smu.GetOutput('B'), 1)
+
+    def test_005_restore(self):
+        """SetState writes only the changed parameters, then verifies them."""
+        tls = tls_keysight(self.mainframe, chan='0')
+        saved = tls.GetState()
+        tls.SetWavl(1560)
+        tls.SetOutput(True)
+        stats = tls.addr.stats
+        stats.reset()
+        self.assertEqual(tls.SetState(saved), {})
+        writes = [t for t in stats.snapshot() if not t.endswith('?')]
+        self.assertEqual(writes, ['SOUR*:WAV;:SOUR*:POW:STAT'])
+        self.assertEqual(tls.GetState().state, saved.state)
+
+    def test_006_compound_state(self):
+        """GetState reads the declared parameters in one compound query."""
+        tls = tls_keysight(self.mainframe, chan='0')
+        tls.SetPwrUnit('mW')
+        tls.SetPwr(1.5)
+        stats = tls.addr.stats
+        stats.reset()
+        state = tls.GetState().state
+        self.assertEqual(len(stats.snapshot()), 1)
+        self.assertEqual(state['pwr_unit'], 'mW')
+        self.assertAlmostEqual(state['pwr'], 1.5)
+        self.assertIn('wavl_start', state)
+        self.assertEqual([p.name for p in tls.params],
+                         ['PwrUnit', 'Pwr', 'Wavl', 'SweepStart', 'SweepStop', 'SweepSpeed',
+                          'SweepStep', 'WavlLoggingStatus', 'SweepRun', 'Output'])
+
+        tls.SetPwrUnit('dBm')
+        tls.SetPwrUnit()
+        self.assertEqual(tls.GetPwrUnit(), 'mW')
+        tls.SetPwrUnit(unit='dBm')
+        self.assertEqual(tls.GetPwrUnit(), 'dBm')
+
+        pm = PowerMonitor_keysight(tls.addr, chan='1', slot='2')
+        pm.SetPwrLoggingPar(100, 1e-4)
+        self.assertEqual(pm.GetPwrLoggingPar(), (100, 1e-4))
+
+    def test_007_power_monitor_addressing(self):
+        """Power monitor commands keep the addressing of the instrument command set."""
+        from siepiclab import replay
+
+        rec = replay.recording()
+        res = rec.wrap(self.mainframe, 'mainframe')
+        for slot, head, start, results in [(None, 'SENS1:CHAN1', 'SENS1:CHAN1', 'SENS:CHAN1'),
+                                           ('2', 'SENS1:CHAN2', 'SENS1', 'SENS1:CHAN2')]:
+            del rec.resources['mainframe'][:]
+            pm = PowerMonitor_keysight(res, chan='1', slot=slot)
+            pm.shadow = None
+            pm.GetWavl()
+            pm.SetAutoRanging(0)
+            pm.GetPwrRange()
+            pm.SetPwrLoggingPar(10, 1e-3)
+            pm.SetPwrLogging(True)
+            pm.GetPwrLogging()
+            pm.SetPwrLogging(False)
+            pm.GetPwrLoggingData()
+            sens = 'SENS1' if slot is None else head
+            self.assertEqual([e['msg'] for e in rec.resources['mainframe'] if e['op'] in ('write', 'query')],
+                             [sens+':POW:WAV?', head+':POW:RANG:AUTO 0', head+':POW:RANG?',
+                              'SENS1:FUNC:PAR:LOGG 10,0.001', start+':FUNC:STAT LOGG,STAR',
+                              head+':FUNC:STAT?', head+':FUNC:STAT LOGG,STOP',
+                              results+':FUNC:RES?'])
+
+    def test_008_stream(self):
+        """Streamed power is kept in a bounded ring buffer and logged to disk."""
+        import os
+        import tempfile
+        import time
+
+        tls = tls_keysight(self.mainframe, chan='0')
+        tls.SetOutput(True)
+        pm = PowerMonitor_keysight(self.mainframe, chan='1')
+        pm.SetPwrUnit('mW')
+        expected = 1e-3*pm.GetPwr()
+        with tempfile.TemporaryDirectory() as tmp:
+            file = os.path.join(tmp, 'stability.bin')
+            acq = pm.StreamPwr(size=2500, file=file, num_pts=1000, avg_time=1e-4)
+            while acq.count < 5000:
+                time.sleep(0.01)
+            acq.stop()
+            self.assertEqual(acq.latest().shape, (2500, 2))
+            log = instruments.stream.read_log(file)
+            self.assertEqual(len(log), acq.count)
+            np.testing.assert_array_equal(acq.latest(), log[-2500:])
+            np.testing.assert_allclose(log[:, 1], expected, rtol=1e-6)
+            self.assertEqual(pm.GetPwrLogging(), 'LOGGING_STABILITY,COMPLETE')
+
+        acq = pm.StreamPwr(mode='fetch', interval=0.02, duration=0.2)
+        acq.wait(timeout=5)
+        t = acq.latest()[:, 0]
+        self.assertLessEqual(abs(len(t)-10), 1)
+        self.assertTrue(np.all(np.diff(t) > 0.015))
+
+    def test_009_power_group(self):
+        """The power monitors of a mainframe are read in one compound query."""
+        tls = tls_keysight(self.mainframe, chan='0')
+        tls.SetOutput(True)
+        pm = [PowerMonitor_keysight(self.mainframe, chan='1', slot='1'),
+              PowerMonitor_keysight(self.mainframe, chan='1', slot='2')]
+        for p in pm:
+            p.SetPwrUnit('mW')
+        expected = [p.GetPwr() for p in pm]
+        stats = tls.addr.stats
+        stats.reset()
+        pwr = lwmm_keysight(self.mainframe).GetPwrAll(pm)
+        self.assertEqual(sum(s['count'] for s in stats.snapshot().values()), 1)
+        np.testing.assert_allclose(pwr, expected)
+        np.testing.assert_allclose(PowerMonitor_group(pm).GetPwr(log=True), 10*np.log10(expected))
+
+    def test_010_optimize_paddles(self):
+        """The paddles are optimized within their hardware range."""
+        sim = simulation.bench()
+        sim.add('polctrl', simulation.sim_polctrl(optimum=(999, 997, 3, 500)))
+        polctrl = PolCtrl_keysight(sim.open_resource('polctrl'))
+        model = sim.models['polctrl']
+        report = polctrl.OptimizePaddles(model.factor, tol=1e-6, max_meas=100)
+        self.assertEqual(report['positions'], [999, 997, 3, 500])
+        samples = np.array([positions for positions, pwr in report['trajectory']])
+        self.assertTrue(((samples >= 0) & (samples <= 999)).all())
+
+        # with a period longer than the range, out of range samples are moved
+        # to the end of the range nearest in phase
+        report = polctrl.OptimizePaddles(model.factor, paddles=(4,), period=1500, max_meas=10)
+        samples = np.array([positions for positions, pwr in report['trajectory']])
+        self.assertEqual(list(samples[1:4, 3]), [875, 0, 125])
@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+
+"""Tests for `siepiclab.instruments` module."""
+
+
+import threading
+import time
+import unittest
+
+from siepiclab import instruments, simulation
+
+
+class fake_resource:
+    """Minimal VISA resource recording the messages written to it."""
+
+    def __init__(self, name=None, responses=None):
+        if name is not None:
+            self.resource_name = name
+        self.timeout = 2000
+        self.written = []
+        self.responses = responses or {}
+
+    def write(self, msg):
+        self.written.append(msg)
+
+    def read(self):
+        return '1\n'
+
+    def query(self, msg):
+        self.written.append(msg)
+        return self.responses.get(msg, '1\n')
+
+
+class TestBatching(unittest.TestCase):
+    """Tests for the write batching of VISA sessions."""
+
+    def test_000_writes_are_joined(self):
+        """Queued SCPI writes are sent as a single message."""
+        res = fake_resource()
+        instr = instruments.instr_VISA(res, chan='0')
+        with instr.batch():
+            instr.write('SOUR', ':POW 1mW')
+            instr.write('SOUR', ':WAV 1550NM')
+            instr.addr.write('*CLS')
+            self.assertEqual(res.written, [])
+        self.assertEqual(res.written, ['SOUR0:POW 1mW;:SOUR0:WAV 1550NM;*CLS'])
+
+    def test_001_query_flushes(self):
+        """A query sends the queued writes before it."""
+        res = fake_resource()
+        instr = instruments.instr_VISA(res, chan='0')
+        with instr.batch():
+            instr.write('SOUR', ':POW 1mW')
+            instr.query('SOUR', ':POW?')
+            instr.write('SOUR', ':POW 2mW')
+        self.assertEqual(res.written, ['SOUR0:POW 1mW', 'SOUR0:POW?', 'SOUR0:POW 2mW'])
+
+    def test_002_shared_session(self):
+        """Drivers opened on the same resource share their queue."""
+        res1 = fake_resource('mainframe')
+        instr1 = instruments.instr_VISA(res1, chan='0')
+        instr2 = instruments.instr_VISA(res1, chan='1')
+        self.assertIs(instr1.addr.session, instr2.addr.session)
+        with instr1.batch():
+            instr1.write('SOUR', ':POW 1mW')
+            instr2.write('SENS', ':POW:UNIT 1')
+        self.assertEqual(res1.written, ['SOUR0:POW 1mW;:SENS1:POW:UNIT 1'])
+
+        # a resource reopened under the same name does not reuse the session
+        res2 = fake_resource('mainframe')
+        instr3 = instruments.instr_VISA(res2, chan='0')
+        self.assertIsNot(instr3.addr.session, instr1.addr.session)
+        self.assertIs(instr3.addr.session.resource, res2)
+
+    def test_003_attribute_passthrough(self):
+        """Resource attributes are reachable through the session."""
+        res = fake_resource()
+        instr = instruments.instr_VISA(res)
+        instr.addr.timeout = 5000
+        self.assertEqual(res.timeout, 5000)
+        self.assertEqual(instr.addr.timeout, 5000)
+
+    def test_004_thread_batches(self):
+        """Writes from another thread are not queued in the batch of a thread."""
+        res = fake_resource()
+        instr = instruments.instr_VISA(res, chan='0')
+        with instr.batch():
+            instr.write('SOUR', ':POW 1mW')
+            thread = threading.Thread(target=instr.write, args=('SOUR', ':POW 2mW'))
+            thread.start()
+            thread.join()
+            self.assertEqual(res.written, ['SOUR0:POW 2mW'])
+        self.assertEqual(res.written, ['SOUR0:POW 2mW', 'SOUR0:POW 1mW'])
+
+
+class TestOperationComplete(unittest.TestCase):
+    """Tests for the operation complete engine."""
+
+    def test_000_poll_backoff(self):
+        """Polling stops at the first complete reply and reports the polls."""
+        replies = iter(['0\n', '0\n', '1\n'])
+        res = fake_resource()
+        res.query = lambda msg: next(replies)
+        instr = instruments.instr_VISA(res)
+        report = instr.wait()
+        self.assertEqual(report['method'], 'poll')
+        self.assertEqual(report['polls'], 3)
+
+    def test_001_poll_deadline(self):
+        """Polling raises once the deadline is reached."""
+        res = fake_resource()
+        res.query = lambda msg: '0\n'
+        instr = instruments.instr_VISA(res)
+        with self.assertRaises(TimeoutError):
+            instr.wait(timeout=0.01)
+
+    def test_002_srq(self):
+        """Service request notification is used when the backend supports it."""
+        res = fake_resource()
+        res.wait_for_srq = lambda timeout: None
+        instr = instruments.instr_VISA(res)
+        report = instr.wait()
+        self.assertEqual(report['method'], 'srq')
+        self.assertEqual(report['polls'], 0)
+        self.assertEqual(res.written, ['*ESE 1', '*SRE 32', '*OPC', '*ESR?'])
+
+    def test_003_predicted(self):
+        """Completion is polled from shortly before the predicted end."""
+        t0 = time.monotonic()
+        done = lambda: time.monotonic()-t0 > 0.2
+        report = instruments.wait_predicted(done, 0.2, lead=0.05)
+        self.assertGreaterEqual(report['elapsed'], 0.2)
+        self.assertLess(report['polls'], 10)
+        with self.assertRaises(TimeoutError):
+            instruments.wait_predicted(lambda: False, 0.01, timeout=0.05)
+
+    def test_004_srq_fallback(self):
+        """A missed SRQ is polled for until cleared, an unsupported SRQ from then on."""
+        class visa_error(Exception):
+            def __init__(self, error_code):
+                self.error_code = error_code
+
+        def timeout(ms):
+            raise visa_error(instruments.opc_engine.VI_ERROR_TMO)
+
+        res = fake_resource()
+        res.wait_for_srq = timeout
+        instr = instruments.instr_VISA(res)
+        report = instr.wait(timeout=0.01)
+        self.assertEqual(report['method'], 'poll')
+        # the stale status is cleared once the operations are complete
+        self.assertEqual(res.written, ['*ESE 1', '*SRE 32', '*OPC', '*OPC?', '*ESR?'])
+        self.assertTrue(instr.addr.opc.srq)
+        self.assertFalse(instr.addr.opc.stale)
+
+        res.wait_for_srq = lambda ms: None
+        self.assertEqual(instr.wait()['method'], 'srq')
+
+        def unsupported(ms):
+            raise visa_error(instruments.opc_engine.VI_ERROR_NSUP[0])
+
+        res.wait_for_srq = unsupported
+        self.assertEqual(instr.wait()['method'], 'poll')
+        self.assertFalse(instr.addr.opc.srq)
+
+        # other errors are not mistaken for a missing SRQ support
+        res = fake_resource()
+        res.wait_for_srq = lambda ms: 1/0
+        instr = instruments.instr_VISA(res)
+        with self.assertRaises(ZeroDivisionError):
+            instr.wait()
+        self.assertTrue(instr.addr.opc.srq)
+
+    def test_005_concurrent_srq(self):
+        """Concurrent waits on a session each get their own service request."""
+        sim = simulation.bench(srq=True, latency={'*OPC': 0.05})
+        sim.add('instr', simulation.sim_model())
+        res = sim.open_resource('instr')
+        instrs = [instruments.instr_VISA(res) for k in range(2)]
+        reports = []
+        errors = []
+
+        def wait(instr):
+            try:
+                reports.append(instr.wait(timeout=2))
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=wait, args=(instr,)) for instr in instrs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual([r['method'] for r in reports], ['srq', 'srq'])
+        self.assertEqual(res.srq_events, 0)
+
+
+class TestShadow(unittest.TestCase):
+    """Tests for the instrument shadow register."""
+
+    def setUp(self):
+        """Set up a power monitor on a fake resource."""
+        from siepiclab.drivers.PowerMonitor_keysight import PowerMonitor_keysight
+        self.res = fake_resource(responses={'SENS1:POW:WAV?': '1.31E-06\n',
+                                            'SENS1:FUNC:PAR:LOGG?': '100,+1.0E-04\n'})
+        self.pm = PowerMonitor_keysight(self.res, chan='1')
+        self.pm.enable_shadow()
+
+    def test_000_setter_recorded(self):
+        """Getters answer the values written by the setters."""
+        self.pm.SetWavl(1550)
+        self.pm.SetPwrLoggingPar(501, 0.01)
+        self.pm.SetPwrUnit('dbm')
+        self.assertEqual(self.pm.GetWavl(), 1550.0)
+        self.assertEqual(self.pm.GetPwrLoggingPar(), (501, 0.01))
+        self.assertEqual(self.pm.GetPwrUnit(), 'dBm')
+        self.assertFalse([msg for msg in self.res.written if msg.endswith('?')])
+
+    def test_001_readthrough(self):
+        """Queried values are recorded and queried once."""
+        self.assertAlmostEqual(self.pm.GetWavl(), 1310.0)
+        self.assertAlmostEqual(self.pm.GetWavl(), 1310.0)
+        self.assertEqual(self.res.written.count('SENS1:POW:WAV?'), 1)
+
+    def test_002_invalidation(self):
+        """A reset or an explicit invalidation discards the recorded values."""
+        self.pm.SetWavl(1550)
+        self.pm.addr.write('*RST')
+        self.assertAlmostEqual(self.pm.GetWavl(), 1310.0)
+        self.pm.SetWavl(1550)
+        self.pm.invalidate_shadow('GetWavl')
+        self.assertAlmostEqual(self.pm.GetWavl(), 1310.0)
+
+    def test_003_disabled(self):
+        """Without shadow register every getter queries the instrument."""
+        self.pm.disable_shadow()
+        self.pm.SetWavl(1550)
+        self.assertAlmostEqual(self.pm.GetWavl(), 1310.0)
+
+
+class TestAsync(unittest.TestCase):
+    """Tests for the asynchronous instrument I/O."""
+
+    def test_000_separate_resources_overlap(self):
+        """I/O to separate resources runs concurrently."""
+        import asyncio
+        import time
+
+        class slow_resource(fake_resource):
+            def query(self, msg):
+                time.sleep(0.1)
+                return '1\n'
+
+        instrs = [instruments.instr_VISA(slow_resource(), chan='') for ii in range(4)]
+
+        async def main():
+            return await asyncio.gather(*[i.async_query('*IDN?') for i in instrs])
+
+        t0 = time.monotonic()
+        replies = asyncio.run(main())
+        self.assertEqual(replies, ['1\n']*4)
+        self.assertLess(time.monotonic()-t0, 0.35)
+
+
+class TestArbiter(unittest.TestCase):
+    """Tests for the session arbiter."""
+
+    def test_000_priority(self):
+        """Waiting requests are granted by priority, then in turn per client."""
+        import threading
+        import time
+
+        arb = instruments.arbiter()
+        order = []
+
+        def worker(client, priority):
+            with arb.request(client, priority):
+                order.append(client)
+
+        with arb.request('holder'):
+            threads = []
+            for client, priority in [('low', 1), ('a', 0), ('b', 0)]:
+                t = threading.Thread(target=worker, args=(client, priority))
+                t.start()
+                threads.append(t)
+                while arb.pending() < len(threads):
+                    time.sleep(1e-3)
+        for t in threads:
+            t.join()
+        self.assertEqual(order, ['a', 'b', 'low'])
+
+    def test_001_reentrant(self):
+        """The thread holding the session can request it again."""
+        res = fake_resource()
+        instr = instruments.instr_VISA(res, chan='0')
+        with instr.transaction():
+            instr.write('SOUR', ':POW 1mW')
+            self.assertEqual(instr.query('SOUR', ':POW?'), '1\n')
+
+
+class TestStats(unittest.TestCase):
+    """Tests for the session I/O statistics."""
+
+    def test_000_templates(self):
+        """Commands are keyed by template."""
+        stats = instruments.io_stats()
+        self.assertEqual(stats.template('SOUR0:WAV 1550NM'), 'SOUR*:WAV')
+        self.assertEqual(stats.template('SENS1:CHAN2:FUNC:RES?'), 'SENS*:CHAN*:FUNC:RES?')
+        tsp = instruments.io_stats(scpi=False)
+        self.assertEqual(tsp.template('smub.source.levelv = 1.5'), 'smu*.source.levelv =')
+        self.assertEqual(tsp.template('print(smua.measure.v())'), 'print(smu*.measure.v())')
+
+    def test_001_snapshot_export(self):
+        """Transactions are counted and exported."""
+        import json
+        import os
+        import tempfile
+
+        res = fake_resource()
+        instr = instruments.instr_VISA(res, chan='0')
+        for ii in range(3):
+            instr.query('SOUR', ':WAV?')
+        instr.write('SOUR', ':WAV 1550NM')
+        snapshot = instr.addr.stats.snapshot()
+        self.assertEqual(snapshot['SOUR*:WAV?']['count'], 3)
+        self.assertEqual(snapshot['SOUR*:WAV?']['bytes_in'], 6)
+        self.assertEqual(snapshot['SOUR*:WAV']['count'], 1)
+        self.assertEqual(sum(snapshot['SOUR*:WAV?']['hist']), 3)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, 'stats.json')
+            instruments.export_stats(file_name, {'res': snapshot})
+            with open(file_name) as f:
+                self.assertEqual(json.load(f)['res']['SOUR*:WAV?']['count'], 3)
+            instruments.export_stats(os.path.join(tmp, 'stats.csv'), {'res': snapshot})
+
+        instr.addr.stats.reset()
+        self.assertEqual(instr.addr.stats.snapshot(), {})
+
+
+class TestBlock(unittest.TestCase):
+    """Tests for the binary block readout of VISA sessions."""
+
+    def setUp(self):
+        """Set up a resource answering a binary block."""
+        import numpy as np
+
+        self.values = np.arange(1000, dtype='<f4')
+        raw = self.values.tobytes()
+        self.res = fake_resource()
+        self.res.output = bytearray(b'#4'+str(len(raw)).encode()+raw+b'\n')
+        self.res.chunks = []
+
+        def read_bytes(count):
+            self.res.chunks.append(count)
+            data = bytes(self.res.output[:count])
+            del self.res.output[:count]
+            return data
+        self.res.read_bytes = read_bytes
+
+    def test_000_chunked(self):
+        """The block is read in chunks into the given buffer."""
+        import numpy as np
+
+        instr = instruments.instr_VISA(self.res)
+        out = np.zeros(2000, dtype='<f4')
+        data = instr.addr.read_block('FUNC:RES?', '<f4', out=out, chunk_size=1024)
+        np.testing.assert_array_equal(data, self.values)
+        self.assertTrue(np.shares_memory(data, out))
+        self.assertEqual(self.res.chunks, [2, 4, 1024, 1024, 1024, 928, 1])
+        self.assertEqual(self.res.output, b'')
+
+    def test_001_file(self):
+        """The block is streamed to a file."""
+        import os
+        import tempfile
+        import numpy as np
+
+        instr = instruments.instr_VISA(self.res)
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, 'block.bin')
+            data = instr.addr.read_block('FUNC:RES?', '<f4', file=file_name)
+            np.testing.assert_array_equal(data, self.values)
+            del data
+            np.testing.assert_array_equal(np.fromfile(file_name, dtype='<f4'), self.values)
+
+    def test_002_fallback(self):
+        """Backends without raw reads use query_binary_values."""
+        import numpy as np
+
+        res = fake_resource()
+        res.query_binary_values = lambda cmd, datatype, is_big_endian: [1., 2.]
+        instr = instruments.instr_VISA(res)
+        data = instr.addr.read_block('FUNC:RES?', '>f8')
+        self.assertEqual(data.dtype, np.dtype('>f8'))
+        np.testing.assert_array_equal(data, [1., 2.])
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+"""Tests for `siepiclab.measurements` module."""
+
+
+import time
+import unittest
+
+import numpy as np
+
+from siepiclab import measurements, simulation
+from siepiclab.drivers.tls_keysight import tls_keysight
+from siepiclab.drivers.PowerMonitor_keysight import PowerMonitor_keysight
+from siepiclab.drivers.smu_keithley import smu_keithley
+from siepiclab.drivers.smu_keithley2400 import smu_keithley2400
+
+
+class TestLabSetup(unittest.TestCase):
+    """Tests for the experiment lab setup."""
+
+    def setUp(self):
+        """Set up instruments on three resources of a slow bench."""
+        self.bench = simulation.default_bench(default_latency=0.005)
+        mainframe = self.bench.open_resource('mainframe_1550')
+        self.instruments = [tls_keysight(mainframe, chan='0'),
+                            PowerMonitor_keysight(mainframe, chan='1', slot='1'),
+                            smu_keithley(self.bench.open_resource('keithley_2604b')),
+                            smu_keithley2400(self.bench.open_resource('keithley_2400'))]
+
+    def test_000_parallel_settings(self):
+        """States of separate resources are captured concurrently, in order."""
+        setup = measurements.lab_setup(self.instruments)
+        t0 = time.monotonic()
+        serial = setup.GetSettings(parallel=False)
+        t_serial = time.monotonic()-t0
+        t0 = time.monotonic()
+        parallel = setup.GetSettings()
+        t_parallel = time.monotonic()-t0
+        self.assertEqual([s.state for s in parallel], [s.state for s in serial])
+        self.assertLess(t_parallel, 0.75*t_serial)
+
+    def test_001_identify_cached(self):
+        """Instruments are identified once per session."""
+        setup = measurements.lab_setup(self.instruments)
+        idns = setup.identify()
+        self.assertIn('81600B', idns[0])
+        self.assertIn('81635A', idns[1])
+        self.assertIn('2602B', idns[2])
+        stats = self.instruments[2].addr.stats
+        setup.identify()
+        self.assertEqual(stats.snapshot()['*IDN?']['count'], 1)
+
+
+class TestRunningStats(unittest.TestCase):
+    """Tests for the running statistics of repeated measurements."""
+
+    def test_000_mean_variance(self):
+        """Running mean and variance match the statistics of all the measurements."""
+        data = np.random.default_rng(0).normal(1., 0.1, (16, 50, 2))
+        stats = measurements.running_stats()
+        for cycle in data:
+            stats.add(cycle)
+        self.assertEqual(stats.count, 16)
+        np.testing.assert_allclose(stats.mean, data.mean(axis=0))
+        np.testing.assert_allclose(stats.std(), data.std(axis=0, ddof=1))
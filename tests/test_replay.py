@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""Tests for `siepiclab.replay` module."""
+
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from siepiclab import replay, simulation
+from siepiclab.drivers.tls_keysight import tls_keysight
+from siepiclab.drivers.lwmm_keysight import lwmm_keysight
+from siepiclab.drivers.PowerMonitor_keysight import PowerMonitor_keysight
+from siepiclab.drivers.smu_keithley import smu_keithley
+from siepiclab.sequences.SweepIV import SweepIV
+from siepiclab.sequences.SweepWavelengthSpectrum import SweepWavelengthSpectrum
+
+
+def sweep_iv(res):
+    """Run an IV sweep on a resource."""
+    seq = SweepIV(smu_keithley(res))
+    seq.v_pts = np.linspace(0, 1, 5)
+    seq.execute()
+    return seq.results.data
+
+
+def sweep_spectrum(res):
+    """Run a short wavelength sweep on a mainframe resource."""
+    seq = SweepWavelengthSpectrum(lwmm_keysight(res), tls_keysight(res, chan='0'),
+                                  PowerMonitor_keysight(res, chan='1'))
+    seq.wavl_start = 1545
+    seq.wavl_stop = 1555
+    seq.wavl_pts = 11
+    seq.execute()
+    return seq.results.data
+
+
+class TestReplay(unittest.TestCase):
+    """Tests for the record and replay of VISA resources."""
+
+    def test_000_record_replay(self):
+        """A replayed run issues the recorded I/O and gets the recorded results."""
+        sim = simulation.default_bench()
+        rec = replay.recording()
+        live_iv = sweep_iv(rec.wrap(sim.open_resource('keithley_2604b'), 'smu'))
+        live_sweep = sweep_spectrum(rec.wrap(sim.open_resource('mainframe_1550'), 'mainframe'))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, 'run.rec.gz')
+            rec.save(file_name)
+            rec = replay.recording.load(file_name)
+        self.assertEqual(set(rec.list_resources()), {'smu', 'mainframe'})
+
+        iv = sweep_iv(rec.open_resource('smu', time_scale=0))
+        sweep = sweep_spectrum(rec.open_resource('mainframe', time_scale=0))
+        np.testing.assert_array_equal(iv['curr'], live_iv['curr'])
+        np.testing.assert_array_equal(sweep['rslts_wavl'], live_sweep['rslts_wavl'])
+        np.testing.assert_array_equal(sweep['rslts_pwr'], live_sweep['rslts_pwr'])
+        self.assertEqual(rec.remaining(), {'smu': 0, 'mainframe': 0})
+
+    def test_001_divergence(self):
+        """I/O that differs from the recording raises."""
+        rec = replay.recording()
+        smu = smu_keithley(rec.wrap(simulation.default_bench().open_resource('keithley_2604b')))
+        smu.SetVoltage(1., 'A')
+        res = rec.open_resource(rec.list_resources()[0], time_scale=0)
+        with self.assertRaises(ValueError):
+            res.write('smua.source.levelv = 2.0')
+
+    def test_002_benchmark(self):
+        """Replays are timed with the scaled recorded latency."""
+        sim = simulation.default_bench(default_latency=0.01)
+        rec = replay.recording()
+        sweep_iv(rec.wrap(sim.open_resource('keithley_2604b'), 'smu'))
+        total = rec.latency()['smu']
+
+        times = replay.benchmark(lambda rec, scale: sweep_iv(rec.open_resource('smu', scale)),
+                                 rec, time_scale=0.5, repeat=2)
+        self.assertEqual(len(times), 2)
+        self.assertGreaterEqual(min(times), 0.5*total)
+        self.assertLess(max(times), total)
+
+    def test_003_errors(self):
+        """Operations that raised when recorded raise again on replay."""
+        class visa_error(Exception):
+            error_code = -1073807339
+
+        def timeout(ms):
+            raise visa_error('timeout expired')
+
+        rec = replay.recording()
+        res = rec.wrap(simulation.default_bench().open_resource('keithley_2604b'), 'smu')
+        with self.assertRaises(ValueError):
+            res.query('print(undefined)')
+        res.resource.wait_for_srq = timeout
+        with self.assertRaises(visa_error):
+            res.wait_for_srq(10)
+        self.assertEqual([e['error'] for e in rec.resources['smu']], ['ValueError', 'visa_error'])
+
+        res = rec.open_resource('smu', time_scale=0)
+        with self.assertRaises(ValueError):
+            res.query('print(undefined)')
+        with self.assertRaises(replay.replayed_error) as err:
+            res.wait_for_srq(10)
+        self.assertEqual(err.exception.error, 'visa_error')
+        self.assertEqual(err.exception.error_code, -1073807339)
+        self.assertEqual(str(err.exception), 'timeout expired')
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+
+"""Tests for `siepiclab.sequences` package."""
+
+
+import numpy as np
+
+from siepiclab import simulation
+from siepiclab.drivers.tls_keysight import tls_keysight
+from siepiclab.drivers.fls_keysight import fls_keysight
+from siepiclab.drivers.PowerMonitor_keysight import PowerMonitor_keysight
+from siepiclab.drivers.PolCtrl_keysight import PolCtrl_keysight
+from siepiclab.drivers.smu_keithley import smu_keithley
+from siepiclab.drivers.smu_keithley2400 import smu_keithley2400
+from tests import bench
+
+
+class TestSequences(bench.BenchTestCase):
+    """Tests for the measurement sequences on the simulated instruments."""
+
+    def test_000_sweep_iv(self):
+        """SweepIV measures the resistive load."""
+        from siepiclab.sequences.SweepIV import SweepIV
+
+        smu = smu_keithley(self.bench.open_resource('keithley_2604b'))
+        seq = SweepIV(smu)
+        seq.v_pts = np.linspace(0, 1, 5)
+        seq.execute()
+        np.testing.assert_allclose(seq.results.data['curr'], seq.v_pts/1e3)
+
+    def test_001_sweep_iv_buffered(self):
+        """Buffered SweepIV reads the whole sweep back in one binary transfer."""
+        from siepiclab.sequences.SweepIV import SweepIV
+        from siepiclab.sequences.SweepIV_opticalinput import SweepIV_opticalinput
+
+        smu = smu_keithley(self.bench.open_resource('keithley_2604b'))
+        seq = SweepIV(smu)
+        seq.mode = 'buffered'
+        seq.v_pts = np.linspace(0, 1, 500)
+        smu.addr.stats.reset()
+        seq.execute()
+        np.testing.assert_allclose(seq.results.data['curr'], seq.v_pts/1e3, rtol=1e-6)
+        self.assertEqual(seq.results.data['res'][0], 9.91e37)
+        # a stepped sweep takes 4 transactions per point
+        self.assertLess(sum(t['count'] for t in smu.addr.stats.snapshot().values()), 100)
+
+        smu2400 = smu_keithley2400(self.bench.open_resource('keithley_2400'))
+        seq = SweepIV(smu2400)
+        seq.mode = 'buffered'
+        seq.v_pts = np.concatenate([np.linspace(0, 1, 150), np.linspace(1, 0, 150)**2])
+        seq.execute()
+        np.testing.assert_allclose(seq.results.data['curr'], seq.v_pts/1e3, rtol=1e-6)
+
+        seq = SweepIV_opticalinput(smu, fls_keysight(self.mainframe, chan='2'))
+        seq.mode = 'buffered'
+        seq.v_pts = [0.5, -0.5, 1.]
+        seq.execute()
+        np.testing.assert_allclose(seq.results.data['volt'][:, 2], seq.v_pts)
+
+    def test_002_sweep_wavelength_spectrum(self):
+        """SweepWavelengthSpectrum logs the DUT transmission against wavelength."""
+        from siepiclab.sequences.SweepWavelengthSpectrum import SweepWavelengthSpectrum
+
+        seq = SweepWavelengthSpectrum(*self.sweep_instruments())
+        seq.wavl_start = 1540
+        seq.wavl_stop = 1560
+        seq.wavl_pts = 201
+        seq.execute()
+        wavl = seq.results.data['rslts_wavl']
+        pwr = seq.results.data['rslts_pwr']
+        self.assertEqual(pwr.shape, (201, 1))
+        np.testing.assert_allclose(wavl, np.linspace(1540, 1560, 201))
+        expected = self.transmission(wavl)
+        np.testing.assert_allclose(pwr[:, 0], expected, rtol=1e-5)
+
+    def test_003_segmented_sweep(self):
+        """A segmented sweep is stitched into the spectrum of a single sweep."""
+        from siepiclab.sequences.SweepWavelengthSpectrum import SweepWavelengthSpectrum
+
+        seq = SweepWavelengthSpectrum(*self.sweep_instruments())
+        seq.wavl_start = 1540
+        seq.wavl_stop = 1560
+        seq.wavl_pts = 2001
+        seq.segmented = True
+        seq.max_pts = 800
+        seq.overlap_pts = 50
+        seq.sweep_step = 0.01
+        segments = seq.segments()
+        self.assertEqual([pts for start, stop, pts in segments], [800, 800, 800])
+        self.assertAlmostEqual(segments[1][0], 1547.5)
+        self.assertAlmostEqual(segments[-1][1], 1560)
+        seq.execute()
+        wavl = seq.results.data['rslts_wavl']
+        pwr = seq.results.data['rslts_pwr']
+        np.testing.assert_allclose(wavl, np.linspace(1540, 1560, 2001), atol=1e-6)
+        expected = self.transmission(wavl)
+        np.testing.assert_allclose(pwr[:, 0], expected, rtol=1e-5)
+        np.testing.assert_allclose(seq.results.data['segment_gain'], 1, rtol=1e-5)
+
+        # a segment with drifted power is matched to the previous one
+        w = np.arange(11.)
+        wavl, pwr, gain = seq.stitch([(w, np.ones((11, 1))), (w+8, 2*np.ones((11, 1)))])
+        np.testing.assert_allclose(wavl, np.arange(19.))
+        np.testing.assert_allclose(pwr, 1)
+        self.assertAlmostEqual(gain[1, 0], 0.5)
+
+    def test_004_averaged_sweep(self):
+        """Bidirectional cycles are averaged into the spectrum of a single sweep."""
+        from siepiclab.sequences.SweepWavelengthSpectrum import SweepWavelengthSpectrum
+
+        mf, tls, pm = self.sweep_instruments()
+        seq = SweepWavelengthSpectrum(mf, tls, pm)
+        seq.wavl_start = 1545
+        seq.wavl_stop = 1555
+        seq.wavl_pts = 1001
+        seq.sweep_speed = 100
+        seq.sweep_overhead = 0.
+        seq.cycles = 3
+        seq.bidirectional = True
+        seq.execute()
+        wavl = seq.results.data['rslts_wavl']
+        pwr = seq.results.data['rslts_pwr']
+        np.testing.assert_allclose(wavl, np.linspace(1545, 1555, 1001), atol=1e-6)
+        expected = self.transmission(wavl)
+        np.testing.assert_allclose(pwr[:, 0], expected, rtol=1e-5)
+        np.testing.assert_allclose(seq.results.data['rslts_std'], 0, atol=1e-6)
+        self.assertEqual(self.bench.models['mainframe_1550'].slots[0].cycles, 2)
+        # the cycles are swept without running the setup again
+        stats = tls.addr.stats.snapshot()
+        self.assertEqual(stats['SOUR*:WAV:SWE']['count'], 3)
+
+    def test_005_stepped_sweep(self):
+        """The duration of a stepped sweep is predicted from its points and dwell time."""
+        from siepiclab.sequences.SweepWavelengthSpectrum import SweepWavelengthSpectrum
+
+        self.bench.time_scale = 1.
+        seq = SweepWavelengthSpectrum(*self.sweep_instruments())
+        seq.mode = 'step'
+        seq.wavl_start = 1549.5
+        seq.wavl_stop = 1550.5
+        seq.wavl_pts = 101
+        seq.sweep_step = 0.01
+        seq.sweep_speed = 100
+        seq.dwell = 2e-3
+        seq.sweep_overhead = 0.
+        seq.sweep_timeout = 0.
+        # far longer than the span over the sweep speed
+        self.assertAlmostEqual(seq.sweep_duration(1549.5, 1550.5, 101), 0.202)
+        seq.execute()
+        self.assertEqual(self.bench.models['mainframe_1550'].slots[0].mode, 'STEP')
+        self.assertAlmostEqual(self.bench.models['mainframe_1550'].slots[0].dwell, 2e-3)
+        wavl = seq.results.data['rslts_wavl']
+        pwr = seq.results.data['rslts_pwr']
+        np.testing.assert_allclose(wavl, np.linspace(1549.5, 1550.5, 101), atol=1e-6)
+        expected = self.transmission(wavl)
+        np.testing.assert_allclose(pwr[:, 0], expected, rtol=1e-5)
+
+    def test_006_bias_spectra(self):
+        """Spectra at each bias point are swept after a single setup."""
+        from siepiclab.sequences.SweepWavelengthSpectrum_VoltageBias import \
+            SweepWavelengthSpectrum_VoltageBias
+
+        mf, tls, pm = self.sweep_instruments()
+        smu = smu_keithley(self.bench.open_resource('keithley_2604b'))
+        seq = SweepWavelengthSpectrum_VoltageBias(
+            mf, tls, [pm, PowerMonitor_keysight(self.mainframe, chan='1', slot='1')], smu)
+        seq.wavl_start = 1545
+        seq.wavl_stop = 1555
+        seq.wavl_pts = 501
+        seq.sweep_speed = 100
+        seq.sweep_overhead = 0.
+        seq.v_pts = [0, 0.5, 1, 1.5, 2]
+        seq.execute()
+        wavl = seq.results.data['rslts_wavl']
+        pwr = seq.results.data['rslts_pwr']
+        self.assertEqual(wavl.shape, (5, 501))
+        self.assertEqual(pwr.shape, (5, 501, 2))
+        np.testing.assert_allclose(wavl, np.tile(np.linspace(1545, 1555, 501), (5, 1)), atol=1e-6)
+        expected = self.transmission(wavl[0])
+        np.testing.assert_allclose(pwr[:, :, 0], np.tile(expected, (5, 1)), rtol=1e-5)
+        stats = tls.addr.stats.snapshot()
+        self.assertEqual(stats['SOUR*:WAV:SWE']['count'], 5)
+        self.assertEqual(sum(s['count'] for cmd, s in stats.items() if ':WAV:SWE:MODE' in cmd), 1)
+
+        # a stitched spectrum needs not have wavl_pts points
+        seq.segmented = True
+        seq.max_pts = 300
+        seq.overlap_pts = 21
+        seq.sweep_step = 0.01
+        seq.wavl_pts = 1001
+        seq.v_pts = [0, 1]
+        seq.execute()
+        wavl = seq.results.data['rslts_wavl']
+        self.assertEqual(seq.results.data['rslts_pwr'].shape, wavl.shape+(2,))
+        np.testing.assert_allclose(wavl[0], wavl[1])
+        self.assertAlmostEqual(wavl[0, -1], 1555)
+
+    def test_007_sweep_polarization(self):
+        """SweepPolarization sets the controller to the best sampled position."""
+        from siepiclab.sequences.SweepPolarization import SweepPolarization
+
+        self.bench.time_scale = 1.
+        fls = fls_keysight(self.mainframe, chan='2')
+        polctrl = PolCtrl_keysight(self.bench.open_resource('polctrl'))
+        pm = PowerMonitor_keysight(self.mainframe, chan='1')
+        seq = SweepPolarization(fls, polctrl, pm)
+        seq.scantime = 0.5
+        seq.scanrate = 8
+        seq.optimize = True
+        seq.execute()
+        self.assertTrue(len(seq.results.data['pmReadOut']))
+
+    def test_008_model_polarization(self):
+        """The model-based optimizer converges to the best paddle positions."""
+        from siepiclab.sequences.SweepPolarization import SweepPolarization
+
+        fls = fls_keysight(self.mainframe, chan='2')
+        polctrl = PolCtrl_keysight(self.bench.open_resource('polctrl'))
+        pm = PowerMonitor_keysight(self.mainframe, chan='1')
+        seq = SweepPolarization(fls, polctrl, pm)
+        seq.method = 'model'
+        seq.max_meas = 40
+        seq.optimize = True
+        seq.instructions()
+        self.assertTrue(seq.results.data['converged'])
+        self.assertLessEqual(len(seq.results.data['pmReadOut']), 40)
+        self.assertAlmostEqual(self.bench.models['polctrl'].factor(), 1., places=4)
+        best = seq.results.data['samples'][seq.results.data['idx'][0]]
+        np.testing.assert_allclose(best, self.bench.models['polctrl'].optimum, atol=3)
+
+        # without optimize the paddles are set back after the search
+        polctrl.SetPaddlePositionAll([100, 200, 300, 400])
+        seq.optimize = False
+        seq.instructions()
+        self.assertEqual(self.bench.models['polctrl'].positions, [100, 200, 300, 400])
+        self.assertTrue(seq.results.data['converged'])
+
+    def test_009_triggered_responsivity(self):
+        """A triggered stepped sweep yields the responsivity curve in one fetch per bias."""
+        from siepiclab.sequences.photodiode_responsivity import photodiode_responsivity
+
+        # photodiode of 0.8 A/W on the optical path of the power monitor
+        def photodiode(v):
+            return -0.8*self.bench.optical_power()
+        self.bench.add('keithley_pd', simulation.sim_keithley2600(loads={'a': photodiode}))
+        smu = smu_keithley(self.bench.open_resource('keithley_pd'))
+        seq = photodiode_responsivity(smu, PowerMonitor_keysight(self.mainframe, chan='1'),
+                                      tls_keysight(self.mainframe, chan='0'))
+        seq.mode = 'triggered'
+        seq.settle = 0.
+        seq.dwell = 1e-3
+        seq.sweep_overhead = 0.
+        seq.loss_coupling = 0
+        seq.wavl_start = 1545
+        seq.wavl_stop = 1555
+        seq.wavl_pts = 101
+        seq.execute()
+        photocurr = seq.results.data['photocurr']
+        self.assertEqual(photocurr.shape, (101, 3))
+        expected = 0.8*1e-3*self.transmission(np.linspace(1545, 1555, 101))
+        np.testing.assert_allclose(photocurr[:, 0], expected, rtol=1e-5)
+        np.testing.assert_allclose(seq.results.data['responsivity'], 0.8, rtol=1e-5)
+        fetches = [s['count'] for cmd, s in smu.addr.stats.snapshot().items() if 'printbuffer' in cmd]
+        self.assertEqual(fetches, [3])
+        # the source action of the trigger model is restored
+        self.assertTrue(self.bench.models['keithley_pd'].sweep['a']['source'])
+        smu.addr.write('smua.trigger.source.action = smua.DISABLE')
+        seq.smu_v_bias = [0]
+        seq.execute()
+        self.assertFalse(self.bench.models['keithley_pd'].sweep['a']['source'])
+
+        # both modes correct the power monitor readings the same way
+        seq.loss_coupling = 3
+        seq.wavl_pts = 11
+        pwr_optical = {}
+        for mode in ('triggered', 'stepped'):
+            seq.mode = mode
+            seq.execute()
+            pwr_optical[mode] = seq.results.data['pwr_optical']
+        np.testing.assert_allclose(pwr_optical['stepped'], pwr_optical['triggered'], rtol=1e-5)
+        np.testing.assert_allclose(seq.results.data['responsivity'], 0.8/10**0.3, rtol=1e-5)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+
+"""Tests for `siepiclab.simulation` module."""
+
+
+import unittest
+
+from siepiclab import simulation
+from siepiclab.drivers.tls_keysight import tls_keysight
+
+
+class TestBench(unittest.TestCase):
+    """Tests for the simulated VISA backend."""
+
+    def test_000_latency(self):
+        """Configured latency is added per command template."""
+        import time
+
+        sim = simulation.default_bench(latency={'SOUR*:WAV?': 0.05})
+        tls = tls_keysight(sim.open_resource('mainframe_1550'), chan='0')
+        t0 = time.monotonic()
+        tls.GetWavl()
+        self.assertGreaterEqual(time.monotonic()-t0, 0.05)
+        t0 = time.monotonic()
+        tls.GetPwr()
+        self.assertLess(time.monotonic()-t0, 0.05)